@@ -10,10 +10,15 @@ const transcribeBtn = document.getElementById('transcribeBtn');
 const resultSection = document.getElementById('resultSection');
 const transcriptionText = document.getElementById('transcriptionText');
 const downloadBtn = document.getElementById('downloadBtn');
+const subtitleButtons = [
+    document.getElementById('downloadSrtBtn'),
+    document.getElementById('downloadVttBtn')
+];
 const errorMessage = document.getElementById('errorMessage');
 const optionsSection = document.getElementById('optionsSection');
 const cleanTextCheckbox = document.getElementById('cleanText');
 const useAICheckbox = document.getElementById('useAI');
+const skipSilenceCheckbox = document.getElementById('skipSilence');
 const aiRefinementHint = document.getElementById('aiRefinementHint');
 const ollamaStatus = document.getElementById('ollamaStatus');
 const statusIndicator = document.getElementById('statusIndicator');
@@ -23,6 +28,7 @@ let selectedFile = null;
 let ollamaRunning = false;
 let availableModels = [];
 let currentTranscription = "";
+let currentTranscriptId = null;  // Server-side session id from /transcribe
 
 // Upload area click handler
 uploadArea.addEventListener('click', () => {
@@ -93,6 +99,8 @@ transcribeBtn.addEventListener('click', async () => {
     formData.append('file', selectedFile);
     formData.append('clean_text', cleanTextCheckbox.checked.toString());
     formData.append('use_ai_refinement', useAICheckbox.checked.toString());
+    formData.append('skip_silence', skipSilenceCheckbox.checked.toString());
+    formData.append('fields', 'transcription');  // Only the text is displayed
     
     // Show loading state
     transcribeBtn.disabled = true;
@@ -125,6 +133,8 @@ transcribeBtn.addEventListener('click', async () => {
         const transcription = data.transcription || 'No transcription available';
         transcriptionText.value = transcription;
         currentTranscription = transcription; // Store for summaries
+        currentTranscriptId = data.transcript_id || null;
+        updateSubtitleButtons();
         resultSection.style.display = 'block';
         
         // Scroll to result
@@ -159,6 +169,26 @@ downloadBtn.addEventListener('click', () => {
     URL.revokeObjectURL(url);
 });
 
+// Subtitle downloads (SRT / WebVTT) are generated by the server from the
+// transcript's timed segments, so they need a server-side transcript id
+function updateSubtitleButtons() {
+    subtitleButtons.forEach(btn => {
+        btn.style.display = currentTranscriptId ? 'flex' : 'none';
+    });
+}
+
+subtitleButtons.forEach(btn => {
+    btn.addEventListener('click', () => {
+        if (!currentTranscriptId) return;
+        
+        const a = document.createElement('a');
+        a.href = `${API_URL}/transcripts/${currentTranscriptId}/export?format=${btn.dataset.format}`;
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+    });
+});
+
 // Error handling
 function showError(message) {
     errorMessage.textContent = message;
@@ -292,13 +322,20 @@ const summaryButtons = document.querySelectorAll('.btn-summary');
 // Store current transcription text for summaries
 function setCurrentTranscription(text) {
     currentTranscription = text;
+    currentTranscriptId = null;  // Text no longer matches the server-side transcript
+    updateSubtitleButtons();
 }
 
+// Summaries use the edited text once the transcription is changed by hand
+transcriptionText.addEventListener('input', () => {
+    setCurrentTranscription(transcriptionText.value);
+});
+
 // Handle summary button clicks
 summaryButtons.forEach(btn => {
     btn.addEventListener('click', async () => {
         const summaryType = btn.dataset.type;
-        await requestSummary(summaryType, btn);
+        await requestSummary(summaryType, btn, btn.dataset.mode || 'llm');
     });
 });
 
@@ -308,14 +345,15 @@ closeSummaryBtn.addEventListener('click', () => {
 });
 
 // Request summary from API
-async function requestSummary(summaryType, buttonElement) {
+async function requestSummary(summaryType, buttonElement, mode = 'llm') {
     if (!currentTranscription || currentTranscription.length < 50) {
         showError('Transcription is too short to generate a summary. Please transcribe an audio file first.');
         return;
     }
     
     // Refresh Ollama status (will auto-start if needed)
-    if (!ollamaRunning) {
+    // Extractive summaries are computed on the server without Ollama
+    if (!ollamaRunning && mode !== 'extractive') {
         statusText.textContent = 'Starting Ollama...';
         await checkOllamaStatus();
     }
@@ -326,23 +364,31 @@ async function requestSummary(summaryType, buttonElement) {
     buttonElement.innerHTML = '<span class="spinner" style="width: 16px; height: 16px; border-width: 2px;"></span> Generating...';
     
     // Show summary result section with loading
-    summaryTitle.textContent = getSummaryTitle(summaryType);
+    summaryTitle.textContent = mode === 'extractive' ? 'Key Sentences' : getSummaryTitle(summaryType);
     summaryResultContent.innerHTML = '<div class="summary-loading"><div class="spinner"></div><p>Generating summary...</p></div>';
     summaryResultSection.style.display = 'block';
     summaryResultSection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
     
     try {
-        const response = await fetch(`${API_URL}/summarize`, {
+        const summarize = (payload) => fetch(`${API_URL}/summarize`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({
-                text: currentTranscription,
-                summary_type: summaryType
-            })
+            body: JSON.stringify(payload)
         });
         
+        // Send the transcript id rather than the whole text when we have one
+        let response = await summarize(currentTranscriptId
+            ? { transcript_id: currentTranscriptId, summary_type: summaryType, mode: mode }
+            : { text: currentTranscription, summary_type: summaryType, mode: mode });
+        if (response.status === 404 && currentTranscriptId) {
+            // The server no longer has this transcript: fall back to sending the text
+            currentTranscriptId = null;
+            updateSubtitleButtons();
+            response = await summarize({ text: currentTranscription, summary_type: summaryType, mode: mode });
+        }
+        
         if (!response.ok) {
             const error = await response.json();
             throw new Error(error.detail || 'Summary generation failed');
@@ -365,7 +411,7 @@ async function requestSummary(summaryType, buttonElement) {
 
 // Display summary result
 function displaySummary(data) {
-    summaryTitle.textContent = data.title;
+    summaryTitle.textContent = data.mode === 'extractive' ? 'Key Sentences' : data.title;
     
     if (data.summary_type === 'executive') {
         // Executive summary - plain text
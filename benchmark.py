@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+"""
+Reproducible end-to-end benchmark suite.
+
+Runs the FastAPI app in-process against a deterministic stub transcription
+backend and a local fake Ollama HTTP server, so results don't depend on
+Apple Silicon, model downloads or a real Ollama install.
+
+Reports throughput, p50/p95/p99 latency and peak memory for /transcribe,
+/summarize and the text_cleaner functions at several concurrency levels,
+saves the results as JSON and can fail on regressions against a baseline.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --max-regression 0.2
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+SPANISH_WORDS = (
+    "el la de que y en un una los las por con para como pero más este esta "
+    "reunión proyecto cliente equipo presupuesto semana informe entrega "
+    "propuesta contrato ventas resultado problema solución tiempo empresa "
+    "datos sistema cambio proceso plan objetivo mercado producto servicio "
+    "necesitamos revisar enviar acordar preparar analizar decidir mejorar "
+    "importante próximo mañana lunes viernes rápido claro bueno entonces"
+).split()
+
+HALLUCINATIONS = (
+    "es de la cartería",
+    "gracias por ver el video",
+    "suscríbete al canal",
+    "no sé no sé no sé",
+    "porque aquel dijo no es que yo las liquidaciones le digo a no sé"
+)
+
+
+# ---------------------------------------------------------------------------
+# Synthetic inputs
+# ---------------------------------------------------------------------------
+
+def generate_transcript(num_words: int, seed: int = 0, hallucination_rate: float = 0.15) -> str:
+    """
+    Generate a Spanish transcript with Whisper-style hallucination loops.
+
+    Args:
+        num_words: Approximate number of words
+        seed: Random seed (same seed, same text)
+        hallucination_rate: Probability that a sentence is followed by a repeated loop
+
+    Returns:
+        Transcript text with repeated sequences and repeated short lines
+    """
+    rng = random.Random(seed)
+    parts: List[str] = []
+    count = 0
+
+    while count < num_words:
+        length = rng.randint(6, 18)
+        sentence = " ".join(rng.choice(SPANISH_WORDS) for _ in range(length))
+        sentence = sentence[0].upper() + sentence[1:] + "."
+        parts.append(sentence)
+        count += length
+
+        if rng.random() < hallucination_rate:
+            loop = rng.choice(HALLUCINATIONS)
+            repeats = rng.randint(3, 12)
+            if rng.random() < 0.5:
+                # Inline repetition loop (remove_repetitions)
+                parts.append(" ".join([loop] * repeats))
+            else:
+                # Repeated short lines (remove_short_repeats)
+                parts.append("\n" + "\n".join([loop] * repeats) + "\n")
+            count += len(loop.split()) * repeats
+
+    return " ".join(parts)
+
+
+def generate_wav(seconds: float, seed: int = 0) -> bytes:
+    """
+    Generate a 16 kHz mono WAV with speech-like tone bursts separated by silence.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    audio = rng.normal(0, 0.002, n).astype(np.float32)
+
+    pos = 0
+    while pos < n:
+        burst = int(rng.uniform(1.0, 4.0) * SAMPLE_RATE)
+        gap = int(rng.uniform(0.3, 2.5) * SAMPLE_RATE)
+        end = min(n, pos + burst)
+        t = np.arange(end - pos) / SAMPLE_RATE
+        freq = rng.uniform(120, 300)
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)  # ~syllable rate modulation
+        audio[pos:end] += (0.3 * envelope * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+        pos = end + gap
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Stub transcription backend
+# ---------------------------------------------------------------------------
+
+class StubWhisperBackend:
+    """
+    Deterministic stand-in for MLX Whisper.
+
+    Decodes WAV with the stdlib, optionally sleeps to simulate a given
+    real-time factor, and returns hallucination-heavy Spanish segments
+    whose content depends only on the audio length.
+    """
+
+    name = "stub"
+
+    def __init__(self, realtime_factor: float = 0.0, words_per_second: float = 2.5):
+        self.realtime_factor = realtime_factor
+        self.words_per_second = words_per_second
+        self._loaded = False
+
+    def load_audio(self, path: str) -> np.ndarray:
+        with wave.open(path, "rb") as wav:
+            frames = wav.readframes(wav.getnframes())
+        return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def transcribe(self, audio, **options) -> Dict:
+        if isinstance(audio, str):
+            audio = self.load_audio(audio)
+        seconds = len(audio) / SAMPLE_RATE
+        if self.realtime_factor > 0:
+            time.sleep(seconds / self.realtime_factor)
+        self._loaded = True
+
+        text = generate_transcript(int(seconds * self.words_per_second), seed=len(audio))
+        words = text.split(" ")
+        segments = []
+        step = 5.0
+        per_segment = max(1, int(step * self.words_per_second))
+        for i in range(0, len(words), per_segment):
+            index = i // per_segment
+            segments.append({
+                "id": index,
+                "seek": int(index * step * 100),
+                "start": round(min(seconds, index * step), 2),
+                "end": round(min(seconds, (index + 1) * step), 2),
+                "text": " " + " ".join(words[i:i + per_segment]),
+                "tokens": list(range(50364, 50364 + per_segment * 2)),
+                "temperature": 0.0,
+                "avg_logprob": -0.25,
+                "compression_ratio": 1.4,
+                "no_speech_prob": 0.02
+            })
+        return {"text": text, "segments": segments, "language": "es"}
+
+    def detect_language(self, audio) -> str:
+        return "es"
+
+    def is_model_loaded(self) -> bool:
+        return self._loaded
+
+
+# ---------------------------------------------------------------------------
+# Fake Ollama server
+# ---------------------------------------------------------------------------
+
+FAKE_MODELS = ["qwen2.5:7b-instruct", "llama3.2:3b-instruct", "llama3.2:1b-instruct"]
+
+
+def _make_ollama_handler(latency: float, tokens_per_second: float, output_tokens: int):
+    class FakeOllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload: Dict, status: int = 200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json({"models": [{"name": name} for name in FAKE_MODELS]})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path != "/api/generate":
+                self._send_json({"error": "not found"}, 404)
+                return
+
+            prompt = request.get("prompt", "")
+            prompt_tokens = max(1, len(prompt) // 4)
+            generation_seconds = output_tokens / tokens_per_second if tokens_per_second > 0 else 0.0
+            time.sleep(latency + generation_seconds)
+
+            ideas = [
+                f"{i}. Idea sintética número {i} sobre el proyecto y el presupuesto del equipo."
+                for i in range(1, 11)
+            ]
+            self._send_json({
+                "model": request.get("model"),
+                "response": "\n".join(ideas),
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(latency * 1e9),
+                "eval_count": output_tokens,
+                "eval_duration": int(generation_seconds * 1e9),
+                "total_duration": int((latency + generation_seconds) * 1e9)
+            })
+
+    return FakeOllamaHandler
+
+
+def start_fake_ollama(latency: float, tokens_per_second: float, output_tokens: int) -> ThreadingHTTPServer:
+    """Start the fake Ollama server on a free local port (in a daemon thread)."""
+    handler = _make_ollama_handler(latency, tokens_per_second, output_tokens)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+# ---------------------------------------------------------------------------
+# Measurement helpers
+# ---------------------------------------------------------------------------
+
+def _peak_rss_mb() -> float:
+    """Process peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def _summarize_latencies(latencies: List[float], wall: float, errors: int) -> Dict:
+    values = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        "p50_ms": round(float(np.percentile(values, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(values, 95)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(values, 99)) * 1000, 3),
+        "mean_ms": round(float(values.mean()) * 1000, 3)
+    }
+
+
+def run_load(call: Callable[[int], bool], total: int, concurrency: int) -> Dict:
+    """
+    Issue `total` calls with `concurrency` threads and collect latency stats.
+
+    Args:
+        call: Function taking the request index and returning True on success
+    """
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(index: int):
+        nonlocal errors
+        start = time.perf_counter()
+        ok = call(index)
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(total)))
+    wall = time.perf_counter() - wall_start
+
+    result = _summarize_latencies(latencies, wall, errors)
+    result["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+    return result
+
+
+def bench_function(func: Callable[[str], str], text: str, repeats: int) -> Dict:
+    """
+    Time a text function, then measure its peak Python allocation in a separate
+    pass (tracemalloc slows execution, so it isn't active while timing).
+    """
+    latencies = []
+    wall_start = time.perf_counter()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(text)
+        latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = _summarize_latencies(latencies, wall, 0)
+    result["peak_alloc_mb"] = round(peak / (1024 * 1024), 3)
+    result["chars_per_second"] = round(len(text) * repeats / wall) if wall > 0 else 0
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+def bench_text_cleaner(sizes: List[int], repeats: int, concurrency_levels: List[int]) -> List[Dict]:
+    """
+    Time each text_cleaner function on its own, then clean_text under the
+    same concurrency levels as the endpoints (`repeats` calls per thread),
+    since the server runs it for concurrent requests on its threadpool.
+    """
+    import text_cleaner
+
+    functions = {
+        "remove_repetitions": text_cleaner.remove_repetitions,
+        "remove_short_repeats": text_cleaner.remove_short_repeats,
+        "clean_fragmented_sentences": text_cleaner.clean_fragmented_sentences,
+        "clean_text": text_cleaner.clean_text
+    }
+
+    results = []
+    for size in sizes:
+        text = generate_transcript(size, seed=size)
+        for name, func in functions.items():
+            stats = bench_function(func, text, repeats)
+            stats.update({"name": f"text_cleaner.{name}", "words": size, "concurrency": 1})
+            results.append(stats)
+            print(f"  {name:<28} {size:>6} words  p50 {stats['p50_ms']:>9.2f} ms  "
+                  f"p95 {stats['p95_ms']:>9.2f} ms  peak {stats['peak_alloc_mb']:.2f} MB")
+
+        for concurrency in concurrency_levels:
+            if concurrency == 1:
+                continue  # Measured above
+            def call(index: int, text=text) -> bool:
+                text_cleaner.clean_text(text)
+                return True
+            stats = run_load(call, repeats * concurrency, concurrency)
+            stats.update({"name": "text_cleaner.clean_text", "words": size, "concurrency": concurrency})
+            results.append(stats)
+            print(f"  {'clean_text':<28} {size:>6} words  c={concurrency:<3} "
+                  f"{stats['throughput_rps']:>8.2f} calls/s  p95 {stats['p95_ms']:>9.2f} ms")
+    return results
+
+
+class AppServer:
+    """Run the FastAPI app with uvicorn on a free local port in a background thread."""
+
+    def __init__(self, app):
+        import uvicorn
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("App server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def bench_endpoints(args, ollama: ThreadingHTTPServer) -> List[Dict]:
+    import requests
+    import server
+    import transcriber
+
+    transcriber.set_backend(StubWhisperBackend(realtime_factor=args.whisper_rtf))
+
+    audio_files = {
+        seconds: generate_wav(seconds, seed=int(seconds)) for seconds in args.audio_seconds
+    }
+    summary_text = generate_transcript(args.summary_words, seed=42)
+
+    results = []
+    try:
+        with AppServer(server.app) as app_server:
+            local = threading.local()
+
+            def session():
+                if not hasattr(local, "session"):
+                    local.session = requests.Session()
+                return local.session
+
+            for seconds, wav_bytes in audio_files.items():
+                for concurrency in args.concurrency:
+                    def call(index: int, wav_bytes=wav_bytes) -> bool:
+                        response = session().post(
+                            f"{app_server.url}/transcribe",
+                            files={"file": (f"bench_{index}.wav", wav_bytes, "audio/wav")},
+                            data={"clean_text": "true", "use_ai_refinement": str(args.ai_refinement).lower()}
+                        )
+                        return response.status_code == 200
+
+                    stats = run_load(call, args.requests, concurrency)
+                    stats.update({"name": "/transcribe", "audio_seconds": seconds, "concurrency": concurrency})
+                    results.append(stats)
+                    print(f"  /transcribe {seconds:>6.0f}s audio  c={concurrency:<3} "
+                          f"{stats['throughput_rps']:>8.2f} req/s  p50 {stats['p50_ms']:>9.2f} ms  "
+                          f"p95 {stats['p95_ms']:>9.2f} ms  p99 {stats['p99_ms']:>9.2f} ms  errors {stats['errors']}")
+
+            for concurrency in args.concurrency:
+                def call(index: int) -> bool:
+                    response = session().post(
+                        f"{app_server.url}/summarize",
+                        json={"text": summary_text, "summary_type": "top5"}
+                    )
+                    return response.status_code == 200
+
+                stats = run_load(call, args.requests, concurrency)
+                stats.update({"name": "/summarize", "words": args.summary_words, "concurrency": concurrency})
+                results.append(stats)
+                print(f"  /summarize  {args.summary_words:>6} words  c={concurrency:<3} "
+                      f"{stats['throughput_rps']:>8.2f} req/s  p50 {stats['p50_ms']:>9.2f} ms  "
+                      f"p95 {stats['p95_ms']:>9.2f} ms  p99 {stats['p99_ms']:>9.2f} ms  errors {stats['errors']}")
+    finally:
+        transcriber.set_backend(None)
+        ollama.shutdown()
+
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Regression check
+# ---------------------------------------------------------------------------
+
+def _result_key(result: Dict) -> tuple:
+    return (
+        result["name"],
+        result.get("concurrency"),
+        result.get("words"),
+        result.get("audio_seconds")
+    )
+
+
+def compare_results(current: List[Dict], baseline: List[Dict], max_regression: float) -> List[str]:
+    """
+    Compare results against a baseline.
+
+    A scenario regresses if its p95 latency grew, or its throughput fell,
+    by more than max_regression (e.g. 0.2 = 20%).
+
+    Returns:
+        List of human-readable regression descriptions (empty if none)
+    """
+    baseline_by_key = {_result_key(r): r for r in baseline}
+    regressions = []
+
+    for result in current:
+        base = baseline_by_key.get(_result_key(result))
+        if not base:
+            continue
+
+        label = " ".join(str(part) for part in _result_key(result) if part is not None)
+        if base["p95_ms"] > 0 and result["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{label}: p95 {base['p95_ms']:.2f} ms -> {result['p95_ms']:.2f} ms"
+            )
+        if base["throughput_rps"] > 0 and result["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{label}: throughput {base['throughput_rps']:.2f} -> {result['throughput_rps']:.2f} req/s"
+            )
+        if result["errors"] > base.get("errors", 0):
+            regressions.append(f"{label}: errors {base.get('errors', 0)} -> {result['errors']}")
+
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Dicta end-to-end benchmark suite")
+    parser.add_argument("--suite", choices=["all", "text", "endpoints"], default="all")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 8],
+                        help="Comma-separated concurrency levels (default: 1,4,8)")
+    parser.add_argument("--requests", type=int, default=32,
+                        help="Requests per endpoint scenario (default: 32)")
+    parser.add_argument("--audio-seconds", type=_float_list, default=[30.0, 300.0],
+                        help="Synthetic audio lengths in seconds (default: 30,300)")
+    parser.add_argument("--text-words", type=_int_list, default=[500, 2000, 8000],
+                        help="Transcript sizes for text_cleaner benchmarks (default: 500,2000,8000)")
+    parser.add_argument("--text-repeats", type=int, default=5,
+                        help="Timed runs per text_cleaner scenario (default: 5)")
+    parser.add_argument("--summary-words", type=int, default=3000)
+    parser.add_argument("--whisper-rtf", type=float, default=0.0,
+                        help="Simulated Whisper real-time factor, 0 = no delay (default: 0)")
+    parser.add_argument("--ollama-latency", type=float, default=0.05,
+                        help="Fake Ollama fixed latency in seconds (default: 0.05)")
+    parser.add_argument("--ollama-tokens-per-sec", type=float, default=500.0,
+                        help="Fake Ollama generation rate (default: 500)")
+    parser.add_argument("--ollama-output-tokens", type=int, default=120)
+    parser.add_argument("--ai-refinement", action="store_true",
+                        help="Enable AI refinement in /transcribe scenarios")
+    parser.add_argument("--output", help="Write results JSON to this path")
+    parser.add_argument("--baseline", help="Baseline results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed p95/throughput regression vs baseline (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    ollama = None
+    if args.suite in ("all", "endpoints"):
+        # Point the pipeline at the fake Ollama before any pipeline module is imported
+        ollama = start_fake_ollama(args.ollama_latency, args.ollama_tokens_per_sec, args.ollama_output_tokens)
+        os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{ollama.server_address[1]}"
+        # Keep benchmark transcripts out of the user's transcript store
+        os.environ.setdefault("DICTA_TRANSCRIPT_DB", os.path.join(tempfile.mkdtemp(prefix="dicta-bench-"), "transcripts.db"))
+
+    results: List[Dict] = []
+    if args.suite in ("all", "text"):
+        print("text_cleaner:")
+        results.extend(bench_text_cleaner(args.text_words, args.text_repeats, args.concurrency))
+    if args.suite in ("all", "endpoints"):
+        print("endpoints:")
+        results.extend(bench_endpoints(args, ollama))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+        },
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline.get("results", []), args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\nNo regressions vs {args.baseline} (tolerance {args.max_regression:.0%})")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Dedicated Whisper inference service.
+
+Runs the model in one long-lived process so API workers (uvicorn --workers N,
+the bulk CLI) don't each load their own copy. Workers decode audio
+themselves, place the samples in shared memory and submit a job over a
+local socket; only the shared-memory name and the result dictionary cross
+the connection, so the audio is never pickled.
+
+Usage:
+    python inference_service.py                      # listens on the default socket
+    DICTA_INFERENCE_ADDRESS=/tmp/dicta-inference.sock uvicorn server:app --workers 4
+
+Several services (e.g. one per GPU or model) can be listed comma-separated
+in DICTA_INFERENCE_ADDRESS; each client sends a job to the least busy one.
+
+Connections are authenticated with DICTA_INFERENCE_AUTHKEY or, when that is
+unset, a random key the service writes to ~/.dicta/inference.key (mode 0600)
+for clients running as the same user. TCP addresses are limited to loopback
+unless DICTA_INFERENCE_ALLOW_REMOTE=true.
+"""
+
+import argparse
+import ipaddress
+import logging
+import os
+import secrets
+import socket
+import tempfile
+import threading
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from model_residency import InsufficientMemory, residency, start_watchdog
+from scheduler import Overloaded, current_request_class, reset_request_class, set_request_class
+from transcriber import (MODEL_PATH, SAMPLE_RATE, WhisperBackend, detect_language, load_audio_file, run_whisper,
+                         set_backend)
+
+logger = logging.getLogger("dicta.inference")
+
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), "dicta-inference.sock")
+# Shared secret for the connection handshake. Messages are pickled, so anyone
+# holding the key can run code in the service: without an explicit key, the
+# service generates a random one into a file only its user can read
+AUTHKEY = os.environ.get("DICTA_INFERENCE_AUTHKEY", "")
+AUTHKEY_FILE = os.environ.get("DICTA_INFERENCE_AUTHKEY_FILE",
+                              os.path.join(os.path.expanduser("~"), ".dicta", "inference.key"))
+# Listen on non-loopback TCP addresses (reachable from other machines)
+ALLOW_REMOTE = os.environ.get("DICTA_INFERENCE_ALLOW_REMOTE", "false").lower() == "true"
+
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """'host:port' becomes a TCP address; anything else is a unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return host, int(port)
+    return address
+
+
+def _read_authkey_file(path: str) -> bytes:
+    if os.stat(path).st_mode & 0o077:
+        raise RuntimeError(f"{path} is readable by other users; chmod 600 it")
+    with open(path, "rb") as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"{path} is empty")
+    return key
+
+
+def load_authkey(create: bool = False) -> bytes:
+    """
+    Return the handshake key: DICTA_INFERENCE_AUTHKEY if set, otherwise the
+    contents of AUTHKEY_FILE. With create=True (the service) a missing file
+    is created with a random key and mode 0600.
+
+    Raises:
+        RuntimeError: no key is configured, or the key file is readable by others
+    """
+    if AUTHKEY:
+        return AUTHKEY.encode("utf-8")
+    if create and not os.path.exists(AUTHKEY_FILE):
+        os.makedirs(os.path.dirname(AUTHKEY_FILE), mode=0o700, exist_ok=True)
+        try:
+            fd = os.open(AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # Created concurrently by another service
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_hex(32).encode("ascii"))
+            logger.info("Generated inference authkey in %s", AUTHKEY_FILE)
+    try:
+        return _read_authkey_file(AUTHKEY_FILE)
+    except FileNotFoundError:
+        raise RuntimeError(
+            f"No inference authkey: set DICTA_INFERENCE_AUTHKEY or start the service first "
+            f"so it creates {AUTHKEY_FILE}"
+        ) from None
+
+
+def _is_loopback(host: str) -> bool:
+    if not host:
+        return False  # Empty host binds every interface
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(a.split("%")[0]).is_loopback for a in addresses)
+
+
+def check_listen_address(parsed: Union[str, Tuple[str, int]]) -> None:
+    """Refuse TCP addresses other machines can reach unless DICTA_INFERENCE_ALLOW_REMOTE is set."""
+    if isinstance(parsed, tuple) and not ALLOW_REMOTE and not _is_loopback(parsed[0]):
+        raise RuntimeError(
+            f"Refusing to listen on {parsed[0]}:{parsed[1]}: only loopback addresses are allowed "
+            f"unless DICTA_INFERENCE_ALLOW_REMOTE=true"
+        )
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    """
+    Attach to a block created by a client without taking ownership of it.
+    Python < 3.13 registers attached blocks with the resource tracker, which
+    would unlink them (and warn) when this process exits.
+    """
+    shm = SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _handle_audio_job(job: Dict):
+    shm = _attach_shared_memory(job["shm"])
+    # Queue under the priority class and client of the API request that sent it
+    token = set_request_class(*job.get("request_class", ("interactive", "unknown")))
+    try:
+        audio = np.ndarray((job["samples"],), dtype=np.dtype(job["dtype"]), buffer=shm.buf)
+        # run_whisper and detect_language serialize jobs from all connections on the single model
+        if job["op"] == "detect_language":
+            return detect_language(audio)
+        return run_whisper(audio, audio_seconds=job.get("audio_seconds"), **job.get("options", {}))
+    finally:
+        reset_request_class(token)
+        audio = None
+        try:
+            shm.close()
+        except BufferError:
+            pass  # A traceback still references the view; released when it is collected
+
+
+def _handle_connection(conn, backend: WhisperBackend) -> None:
+    """Serve requests from one client connection until it closes."""
+    with conn:
+        while True:
+            try:
+                job = conn.recv()
+            except (EOFError, OSError):
+                return
+
+            try:
+                op = job.get("op")
+                if op in ("transcribe", "detect_language"):
+                    reply = {"ok": True, "result": _handle_audio_job(job), "model_loaded": backend.is_model_loaded()}
+                elif op == "status":
+                    reply = {"ok": True, "model_loaded": backend.is_model_loaded(),
+                             "model_path": backend.model_path, "pid": os.getpid(),
+                             "residency": residency.snapshot(backend)}
+                elif op == "ping":
+                    reply = {"ok": True}
+                else:
+                    reply = {"ok": False, "error": f"Unknown operation: {op}"}
+            except Overloaded as e:
+                reply = {"ok": False, "error": str(e), "overloaded": [e.resource, e.priority]}
+            except InsufficientMemory as e:
+                reply = {"ok": False, "error": str(e), "insufficient_memory": True}
+            except Exception as e:
+                logger.exception("Inference job failed")
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                return
+
+
+def serve(address: str = DEFAULT_ADDRESS, model_path: str = MODEL_PATH, warmup: bool = True) -> None:
+    """Load the model and serve jobs until interrupted."""
+    parsed = parse_address(address)
+    check_listen_address(parsed)
+    authkey = load_authkey(create=True)
+
+    backend = WhisperBackend(model_path)
+    set_backend(backend)
+
+    if warmup:
+        logger.info("Loading %s", model_path)
+        run_whisper(np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+    # The service holds the model, so it runs the idle/memory eviction
+    start_watchdog()
+
+    if isinstance(parsed, str) and os.path.exists(parsed):
+        os.unlink(parsed)  # Stale socket from a previous run
+
+    with Listener(parsed, authkey=authkey) as listener:
+        logger.info("Inference service ready on %s (pid %d)", address, os.getpid())
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Failed handshake (e.g. wrong authkey); keep serving others
+                    logger.warning("Rejected connection: %s", e)
+                    continue
+                threading.Thread(target=_handle_connection, args=(conn, backend), daemon=True).start()
+        except KeyboardInterrupt:
+            logger.info("Inference service stopping")
+
+
+class RemoteWhisperBackend:
+    """
+    Backend that submits jobs to one or more inference services.
+
+    Audio is decoded locally (ffmpeg only, no MLX import) and shared with the
+    service through a shared-memory block that lives only for the call.
+    """
+
+    name = "inference-service"
+    # The service queues jobs itself, so run_whisper needn't hold the local lock
+    concurrent = True
+
+    def __init__(self, addresses: str, authkey: Optional[bytes] = None):
+        self.addresses = [a.strip() for a in addresses.split(",") if a.strip()]
+        if not self.addresses:
+            raise ValueError("No inference service address given")
+        self.authkey = authkey
+        self._in_flight = {address: 0 for address in self.addresses}
+        # Model state reported by each service's last reply (None: not asked yet)
+        self._model_loaded: Dict[str, Optional[bool]] = {address: None for address in self.addresses}
+        self._lock = threading.Lock()
+
+    def _request(self, address: str, message: Dict) -> Dict:
+        if self.authkey is None:
+            # Read lazily: the service creates the key file when it starts
+            self.authkey = load_authkey()
+        try:
+            conn = Client(parse_address(address), authkey=self.authkey)
+        except (OSError, EOFError) as e:
+            self._model_loaded[address] = None
+            raise RuntimeError(f"Inference service not reachable at {address}: {e}") from e
+        except AuthenticationError as e:
+            raise RuntimeError(f"Inference service at {address} rejected the authkey") from e
+        with conn:
+            conn.send(message)
+            reply = conn.recv()
+        if "model_loaded" in reply:
+            self._model_loaded[address] = reply["model_loaded"]
+        if reply.get("overloaded"):
+            raise Overloaded(*reply["overloaded"], reason="inference service queue")
+        if reply.get("insufficient_memory"):
+            raise InsufficientMemory(reply["error"])
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error") or "Inference service error")
+        return reply
+
+    def _pick_address(self) -> str:
+        with self._lock:
+            address = min(self.addresses, key=self._in_flight.__getitem__)
+            self._in_flight[address] += 1
+            return address
+
+    def load_audio(self, path: str) -> np.ndarray:
+        return load_audio_file(path)
+
+    def _submit(self, op: str, audio: np.ndarray, **fields):
+        """Run an audio job on the least busy service; the samples travel in shared memory."""
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        shm = SharedMemory(create=True, size=max(audio.nbytes, 1))
+        address = self._pick_address()
+        try:
+            np.ndarray(audio.shape, dtype=audio.dtype, buffer=shm.buf)[:] = audio
+            reply = self._request(address, {
+                "op": op,
+                "shm": shm.name,
+                "samples": len(audio),
+                "dtype": audio.dtype.str,
+                "request_class": current_request_class(),
+                **fields
+            })
+            return reply["result"]
+        finally:
+            with self._lock:
+                self._in_flight[address] -= 1
+            shm.close()
+            shm.unlink()
+
+    def transcribe(self, audio: Union[str, np.ndarray], **options) -> Dict:
+        if isinstance(audio, str):
+            audio = self.load_audio(audio)
+        return self._submit("transcribe", audio, audio_seconds=len(audio) / SAMPLE_RATE, options=options)
+
+    def detect_language(self, audio: np.ndarray) -> str:
+        return self._submit("detect_language", audio)
+
+    def is_model_loaded(self) -> bool:
+        """
+        Whether every service has its model loaded, as of its last reply;
+        services are only asked when nothing is known about them yet.
+        """
+        try:
+            for address in self.addresses:
+                if self._model_loaded[address] is None:
+                    self._request(address, {"op": "status"})
+        except RuntimeError:
+            return False
+        return all(self._model_loaded.values())
+
+    def status(self) -> List[Dict]:
+        """Status of every configured service (for diagnostics)."""
+        statuses = []
+        for address in self.addresses:
+            try:
+                reply = self._request(address, {"op": "status"})
+                statuses.append({"address": address, "reachable": True, "model_loaded": reply["model_loaded"],
+                                 "model_path": reply["model_path"], "pid": reply["pid"],
+                                 "residency": reply.get("residency")})
+            except RuntimeError as e:
+                statuses.append({"address": address, "reachable": False, "error": str(e)})
+        return statuses
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Whisper model in a dedicated inference process")
+    parser.add_argument("--address", default=os.environ.get("DICTA_INFERENCE_ADDRESS", "").split(",")[0] or DEFAULT_ADDRESS,
+                        help=f"Unix socket path or host:port to listen on (default: {DEFAULT_ADDRESS})")
+    parser.add_argument("--model", default=MODEL_PATH, help="Whisper model path or Hugging Face repo")
+    parser.add_argument("--no-warmup", action="store_true", help="Load the model on the first job instead of at startup")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    serve(args.address, args.model, warmup=not args.no_warmup)
+
+
+if __name__ == "__main__":
+    main()
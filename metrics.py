@@ -0,0 +1,196 @@
+"""
+Prometheus metrics for the transcription and summarization pipeline.
+Exposes per-stage latency histograms, Ollama attempt outcomes, queue and
+in-flight gauges, cache counters and real-time factor tracking.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+from profiling import record_timing
+
+# Buckets spanning fast text stages (ms) up to long transcriptions (minutes)
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0
+)
+
+STAGE_LATENCY = Histogram(
+    "dicta_stage_duration_seconds",
+    "Latency of individual pipeline stages",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+REQUEST_LATENCY = Histogram(
+    "dicta_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "dicta_requests_in_flight",
+    "HTTP requests currently being processed",
+    ["endpoint"]
+)
+
+QUEUE_DEPTH = Gauge(
+    "dicta_queue_depth",
+    "Work items waiting for a shared resource",
+    ["resource"]
+)
+
+QUEUE_WAIT = Histogram(
+    "dicta_queue_wait_seconds",
+    "Time work waited for a resource slot, by priority class",
+    ["resource", "priority"],
+    buckets=LATENCY_BUCKETS
+)
+
+SHED_REQUESTS = Counter(
+    "dicta_shed_total",
+    "Work rejected by admission control (HTTP 429)",
+    ["resource", "priority"]
+)
+
+OLLAMA_ATTEMPT_LATENCY = Histogram(
+    "dicta_ollama_attempt_duration_seconds",
+    "Latency of each Ollama generate attempt",
+    ["caller", "model", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+MODEL_FALLBACKS = Counter(
+    "dicta_model_fallbacks_total",
+    "Times a fallback model was tried after the previous one failed",
+    ["caller", "model"]
+)
+
+TIMEOUTS = Counter(
+    "dicta_timeouts_total",
+    "Ollama requests that timed out",
+    ["caller", "model"]
+)
+
+OLLAMA_TOKENS_PER_SECOND = Gauge(
+    "dicta_ollama_tokens_per_second",
+    "Rolling (EWMA) Ollama throughput estimate per model",
+    ["model", "phase"]
+)
+
+MODEL_ROUTES = Counter(
+    "dicta_model_routes_total",
+    "First-choice model picked by the latency-aware router",
+    ["caller", "model", "within_target"]
+)
+
+CACHE_REQUESTS = Counter(
+    "dicta_cache_requests_total",
+    "Cache lookups by result (hit ratio = hit / (hit + miss))",
+    ["cache", "result"]
+)
+
+AUDIO_SECONDS = Counter(
+    "dicta_audio_seconds_total",
+    "Seconds of audio transcribed"
+)
+
+TRANSCRIPTION_WALL_SECONDS = Counter(
+    "dicta_transcription_wall_seconds_total",
+    "Wall-clock seconds spent in Whisper transcription"
+)
+
+REALTIME_FACTOR = Histogram(
+    "dicta_transcription_realtime_factor",
+    "Audio seconds transcribed per wall-clock second, per request",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """
+    Time a block of code and record it in the stage latency histogram
+    and in the current request's timings.
+
+    Args:
+        stage: Stage name used as the histogram label
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage=stage).observe(elapsed)
+        record_timing(stage, elapsed)
+
+
+@contextmanager
+def track_queue(resource: str) -> Iterator[None]:
+    """
+    Count a work item as queued for a resource while the block runs.
+    Wrap only the waiting part (e.g. acquiring a lock).
+
+    Args:
+        resource: Resource name used as the gauge label
+    """
+    gauge = QUEUE_DEPTH.labels(resource=resource)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Record a cache lookup result."""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_ollama_attempt(caller: str, model: str, outcome: str, duration: float) -> None:
+    """
+    Record one Ollama generate attempt.
+
+    Args:
+        caller: Pipeline component making the call ('refine', 'summarize')
+        model: Model name that was tried
+        outcome: 'success', 'empty', 'http_error', 'timeout', 'connection_error', 'shed' or 'error'
+        duration: Attempt duration in seconds
+    """
+    OLLAMA_ATTEMPT_LATENCY.labels(caller=caller, model=model, outcome=outcome).observe(duration)
+    record_timing(f"ollama_{caller}", duration)
+    if outcome == "timeout":
+        TIMEOUTS.labels(caller=caller, model=model).inc()
+
+
+def record_fallback(caller: str, model: str) -> None:
+    """Record that a fallback model is being tried after a failed attempt."""
+    MODEL_FALLBACKS.labels(caller=caller, model=model).inc()
+
+
+def record_transcription(audio_seconds: float, wall_seconds: float) -> None:
+    """Record audio duration against Whisper wall time (real-time factor)."""
+    AUDIO_SECONDS.inc(audio_seconds)
+    TRANSCRIPTION_WALL_SECONDS.inc(wall_seconds)
+    if wall_seconds > 0 and audio_seconds > 0:
+        REALTIME_FACTOR.observe(audio_seconds / wall_seconds)
+
+
+def render_metrics() -> tuple:
+    """
+    Render all metrics in Prometheus text exposition format.
+
+    Returns:
+        Tuple of (payload bytes, content type)
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
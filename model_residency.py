@@ -0,0 +1,176 @@
+"""
+Whisper model residency: idle eviction and a memory watchdog.
+The Whisper model is unloaded after a configurable idle period (and
+reloaded transparently by the next transcription), and unloaded or kept
+from loading when the machine runs low on memory, so Ollama's models have
+room. psutil is used for memory figures when installed.
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import psutil
+except ImportError:  # Optional; fall back to /proc and getrusage
+    psutil = None
+
+logger = logging.getLogger("dicta.memory")
+
+IDLE_EVICT_SECONDS = float(os.environ.get("DICTA_WHISPER_IDLE_SECONDS", "900"))
+MIN_AVAILABLE_MB = float(os.environ.get("DICTA_MIN_AVAILABLE_MB", "1024"))
+MAX_RSS_MB = float(os.environ.get("DICTA_MAX_RSS_MB", "0"))
+WATCHDOG_INTERVAL_SECONDS = float(os.environ.get("DICTA_WATCHDOG_INTERVAL_SECONDS", "15"))
+
+
+class InsufficientMemory(RuntimeError):
+    """Raised instead of loading the model while memory is under pressure."""
+
+
+def memory_stats() -> Dict[str, Optional[float]]:
+    """
+    Process RSS and system memory in MB (None where the platform doesn't tell).
+    """
+    if psutil is not None:
+        system = psutil.virtual_memory()
+        return {
+            "rss_mb": round(psutil.Process().memory_info().rss / 2**20, 1),
+            "available_mb": round(system.available / 2**20, 1),
+            "total_mb": round(system.total / 2**20, 1)
+        }
+
+    stats: Dict[str, Optional[float]] = {"rss_mb": None, "available_mb": None, "total_mb": None}
+    try:
+        with open("/proc/self/statm") as f:
+            stats["rss_mb"] = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+        with open("/proc/meminfo") as f:
+            meminfo = {line.split(":")[0]: int(line.split()[1]) for line in f if ":" in line}
+        stats["available_mb"] = round(meminfo["MemAvailable"] / 1024, 1)
+        stats["total_mb"] = round(meminfo["MemTotal"] / 1024, 1)
+    except (OSError, KeyError, ValueError, IndexError):
+        # macOS without psutil: only the peak RSS is known (bytes on macOS)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stats["rss_mb"] = round(peak / (2**20 if os.uname().sysname == "Darwin" else 1024), 1)
+    return stats
+
+
+def memory_pressure(stats: Optional[Dict] = None) -> Optional[str]:
+    """Why memory is under pressure, or None if it isn't."""
+    stats = stats or memory_stats()
+    if MIN_AVAILABLE_MB and stats["available_mb"] is not None and stats["available_mb"] < MIN_AVAILABLE_MB:
+        return f"only {stats['available_mb']:.0f} MB available (minimum {MIN_AVAILABLE_MB:.0f} MB)"
+    if MAX_RSS_MB and stats["rss_mb"] is not None and stats["rss_mb"] > MAX_RSS_MB:
+        return f"process uses {stats['rss_mb']:.0f} MB (maximum {MAX_RSS_MB:.0f} MB)"
+    return None
+
+
+class ModelResidency:
+    """
+    Tracks use of the Whisper model so it is never unloaded mid-transcription.
+    Only backends with an unload() method are evicted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self.last_used = time.monotonic()
+        self.evictions = 0
+        self.last_eviction: Optional[Dict] = None
+
+    @contextmanager
+    def use(self, backend) -> Iterator[None]:
+        """
+        Mark the model in use for the block.
+
+        Raises:
+            InsufficientMemory: The model isn't loaded and memory is under pressure
+        """
+        with self._lock:
+            if hasattr(backend, "unload") and not backend.is_model_loaded():
+                reason = memory_pressure()
+                if reason:
+                    raise InsufficientMemory(f"Not loading the Whisper model: {reason}")
+            self._in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self.last_used = time.monotonic()
+
+    def evict(self, backend, reason: str) -> bool:
+        """Unload the model unless it is in use. Returns whether it was unloaded."""
+        with self._lock:
+            if self._in_use or not hasattr(backend, "unload") or not backend.is_model_loaded():
+                return False
+            backend.unload()
+            self.evictions += 1
+            self.last_eviction = {"reason": reason, "at": time.time()}
+        logger.info("Unloaded the Whisper model: %s", reason)
+        return True
+
+    def check(self, backend) -> None:
+        """One watchdog pass: evict on idle timeout or memory pressure."""
+        idle = time.monotonic() - self.last_used
+        if IDLE_EVICT_SECONDS and idle > IDLE_EVICT_SECONDS:
+            self.evict(backend, f"idle for {idle:.0f}s")
+            return
+        reason = memory_pressure()
+        if reason and self.evict(backend, f"memory pressure: {reason}"):
+            logger.warning("Memory pressure: %s", reason)
+
+    def snapshot(self, backend) -> Dict:
+        with self._lock:
+            in_use = self._in_use
+            idle = time.monotonic() - self.last_used
+        stats = memory_stats()
+        return {
+            "whisper_model_loaded": backend.is_model_loaded(),
+            "whisper_in_use": in_use,
+            "idle_seconds": round(idle, 1),
+            "idle_evict_seconds": IDLE_EVICT_SECONDS,
+            "evictions": self.evictions,
+            "last_eviction": self.last_eviction,
+            "memory": stats,
+            "memory_pressure": memory_pressure(stats)
+        }
+
+
+residency = ModelResidency()
+
+
+def _watchdog_loop(stop: threading.Event) -> None:
+    from transcriber import get_backend
+    while not stop.wait(WATCHDOG_INTERVAL_SECONDS):
+        try:
+            residency.check(get_backend())
+        except Exception as e:
+            logger.warning("Memory watchdog check failed: %s", e)
+
+
+def start_watchdog() -> threading.Event:
+    """
+    Start the idle/memory watchdog in a daemon thread.
+
+    Returns:
+        Event that stops the watchdog when set
+    """
+    stop = threading.Event()
+    threading.Thread(target=_watchdog_loop, args=(stop,), name="dicta-memory-watchdog", daemon=True).start()
+    return stop
+
+
+def release_memory() -> None:
+    """Collect garbage and drop MLX's buffer cache after unloading a model."""
+    gc.collect()
+    try:
+        import mlx.core as mx
+        clear_cache = getattr(mx, "clear_cache", None) or mx.metal.clear_cache
+        clear_cache()
+    except Exception:
+        pass
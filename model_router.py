@@ -0,0 +1,213 @@
+"""
+Latency-aware Ollama model routing.
+Keeps rolling (EWMA) estimates of each model's prompt-evaluation and
+generation speed from the stats Ollama returns with every response, and
+orders the models to try so the best-quality one predicted to finish
+within the latency target goes first. Huge inputs or a busy Ollama fall
+back to smaller, faster models.
+"""
+
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from metrics import MODEL_ROUTES, OLLAMA_TOKENS_PER_SECOND
+
+# Target for one Ollama call (seconds); models predicted to be slower are tried last
+LATENCY_TARGET_SECONDS = float(os.environ.get("DICTA_LLM_LATENCY_TARGET_SECONDS", "60"))
+# Requests Ollama serves concurrently (its OLLAMA_NUM_PARALLEL); more than this queue
+OLLAMA_PARALLEL = max(1, int(os.environ.get("DICTA_OLLAMA_PARALLEL", os.environ.get("OLLAMA_NUM_PARALLEL", "1"))))
+# Weight of the newest measurement in the rolling estimates
+EWMA_ALPHA = 0.3
+# Rough characters per token for Spanish text (used to size prompts without a tokenizer)
+CHARS_PER_TOKEN = 3.5
+# How long the installed-model list from /api/tags is reused
+MODELS_TTL_SECONDS = 30.0
+# How long a failed /api/tags check (Ollama down) is reused before asking again
+MODELS_DOWN_TTL_SECONDS = 5.0
+
+# Speed priors for unmeasured models, scaled by parameter count (tokens/s for a 1B model)
+PRIOR_PROMPT_TPS_1B = 2100.0
+PRIOR_EVAL_TPS_1B = 140.0
+
+_PARAMS = re.compile(r"(\d+(?:\.\d+)?)b\b")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text."""
+    return max(1, int(len(text) / CHARS_PER_TOKEN))
+
+
+def _model_size_billions(model: str) -> Optional[float]:
+    """Parameter count from a name tag like 'qwen2.5:7b', or None when the name has none."""
+    match = _PARAMS.search(model.lower())
+    return float(match.group(1)) if match else None
+
+
+class ModelRouter:
+    """Throughput estimates per model plus the routing decision built on them."""
+
+    def __init__(self, target_seconds: float = LATENCY_TARGET_SECONDS, parallel: int = OLLAMA_PARALLEL):
+        self.target_seconds = target_seconds
+        self.parallel = parallel
+        self._lock = threading.Lock()
+        self._estimates: Dict[str, Dict[str, float]] = {}
+        self._in_flight = 0
+        self._installed: Optional[List[str]] = None
+        self._installed_at = 0.0
+
+    # -- measurements --------------------------------------------------------
+
+    def record(self, model: str, stats: Dict) -> None:
+        """
+        Update a model's estimates from an Ollama /api/generate response
+        (prompt_eval_count/duration and eval_count/duration, durations in ns).
+        """
+        updates = {}
+        for phase, count_key, duration_key in (
+            ("prompt", "prompt_eval_count", "prompt_eval_duration"),
+            ("eval", "eval_count", "eval_duration"),
+        ):
+            count, duration = stats.get(count_key), stats.get(duration_key)
+            if count and duration:
+                updates[phase] = count / (duration / 1e9)
+
+        if not updates:
+            return
+        with self._lock:
+            estimate = self._estimates.setdefault(model, {"samples": 0})
+            for phase, tps in updates.items():
+                key = f"{phase}_tps"
+                estimate[key] = tps if key not in estimate else (1 - EWMA_ALPHA) * estimate[key] + EWMA_ALPHA * tps
+                OLLAMA_TOKENS_PER_SECOND.labels(model=model, phase=phase).set(estimate[key])
+            estimate["samples"] += 1
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Count an Ollama call as in flight (used to predict queueing)."""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    # -- prediction ----------------------------------------------------------
+
+    def _speeds(self, model: str) -> Optional[Dict[str, float]]:
+        size = _model_size_billions(model)
+        estimate = self._estimates.get(model, {})
+        if size is None and not ("prompt_tps" in estimate and "eval_tps" in estimate):
+            # No measurement and no size tag to base a prior on
+            return None
+        return {
+            "prompt_tps": estimate.get("prompt_tps") or PRIOR_PROMPT_TPS_1B / size,
+            "eval_tps": estimate.get("eval_tps") or PRIOR_EVAL_TPS_1B / size,
+            "measured": bool(estimate.get("samples"))
+        }
+
+    def predict_seconds(self, model: str, prompt_tokens: int, output_tokens: int) -> Optional[float]:
+        """
+        Predicted duration of one call, including waiting behind the calls
+        already running when Ollama is saturated. None for a model that
+        hasn't been measured and whose name carries no parameter count.
+        """
+        with self._lock:
+            speeds = self._speeds(model)
+            queued_ahead = self._in_flight // self.parallel
+        if speeds is None:
+            return None
+        own = prompt_tokens / speeds["prompt_tps"] + output_tokens / speeds["eval_tps"]
+        return own * (1 + queued_ahead)
+
+    def order(self, candidates: List[str], prompt: str, output_tokens: int,
+              requested: Optional[str] = None) -> List[str]:
+        """
+        Order models to try for one call, without recording a route (for
+        choosing a model ahead of the calls that will use it).
+
+        Args:
+            candidates: Models in quality order (best first)
+            prompt: The prompt that will be sent
+            output_tokens: Expected length of the answer in tokens
+            requested: Model the user asked for explicitly; always tried first
+
+        Returns:
+            Installed candidates predicted within the latency target in
+            quality order, then those that can't be predicted yet (no
+            measurement, no size in the name) in quality order, then the
+            rest fastest first
+        """
+        return self._order(candidates, prompt, output_tokens, requested)[0]
+
+    def route(self, caller: str, candidates: List[str], prompt: str, output_tokens: int,
+              requested: Optional[str] = None) -> List[str]:
+        """
+        Order models to try for one call (see order()) and count the choice
+        in the routing metric.
+
+        Args:
+            caller: Pipeline component ('refine', 'summarize')
+        """
+        routed, within = self._order(candidates, prompt, output_tokens, requested)
+        if routed:
+            MODEL_ROUTES.labels(caller=caller, model=routed[0],
+                                within_target=str(routed[0] in within).lower()).inc()
+        return routed
+
+    def _order(self, candidates: List[str], prompt: str, output_tokens: int,
+               requested: Optional[str]) -> Tuple[List[str], List[str]]:
+        """(models in the order to try, those predicted within the target)"""
+        installed = self.installed_models()
+        ordered = [m for m in dict.fromkeys(candidates) if installed is None or m in installed]
+
+        prompt_tokens = estimate_tokens(prompt)
+        predicted = {m: self.predict_seconds(m, prompt_tokens, output_tokens) for m in ordered}
+        within = [m for m in ordered if predicted[m] is not None and predicted[m] <= self.target_seconds]
+        unknown = [m for m in ordered if predicted[m] is None]
+        slower = sorted((m for m in ordered if predicted[m] is not None and predicted[m] > self.target_seconds),
+                        key=predicted.get)
+        routed = within + unknown + slower
+
+        if requested:
+            routed = [requested] + [m for m in routed if m != requested]
+        return routed, within
+
+    def installed_models(self) -> Optional[List[str]]:
+        """Installed models from Ollama (cached briefly), or None if unknown."""
+        now = time.monotonic()
+        with self._lock:
+            ttl = MODELS_TTL_SECONDS if self._installed is not None else MODELS_DOWN_TTL_SECONDS
+            if self._installed_at and now - self._installed_at < ttl:
+                return self._installed
+
+        from ollama_checker import check_ollama_status
+        status = check_ollama_status()
+        installed = status["available_models"] if status["running"] else None
+        with self._lock:
+            self._installed = installed
+            self._installed_at = now
+        return installed
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Current estimates per model (for status endpoints)."""
+        with self._lock:
+            return {
+                "target_seconds": self.target_seconds,
+                "in_flight": self._in_flight,
+                "models": {
+                    model: {
+                        "prompt_tokens_per_second": round(estimate.get("prompt_tps", 0.0), 1),
+                        "eval_tokens_per_second": round(estimate.get("eval_tps", 0.0), 1),
+                        "samples": estimate["samples"]
+                    }
+                    for model, estimate in self._estimates.items()
+                }
+            }
+
+
+router = ModelRouter()
@@ -2,8 +2,34 @@
 Utility module to check Ollama status and available models.
 """
 
-import requests
+import os
 from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+
+def _ollama_base_url() -> str:
+    """
+    Ollama base URL from OLLAMA_HOST (same variable the Ollama CLI uses),
+    parsed the way Ollama does: the scheme defaults to http, the host to
+    127.0.0.1 and the port to 11434 (443 for https).
+    """
+    host = os.environ.get("OLLAMA_HOST", "").strip().rstrip("/") or "http://localhost:11434"
+    if "://" not in host:
+        host = f"http://{host}"
+    parts = urlsplit(host)
+    hostname = parts.hostname or "127.0.0.1"
+    if ":" in hostname:
+        hostname = f"[{hostname}]"  # IPv6
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is None:
+        port = 443 if parts.scheme == "https" else 11434
+    return f"{parts.scheme}://{hostname}:{port}{parts.path}"
+
+
+OLLAMA_URL = _ollama_base_url()
 
 
 def check_ollama_status() -> Dict:
@@ -18,8 +44,10 @@ def check_ollama_status() -> Dict:
             "error": Optional[str]
         }
     """
+    import requests  # Imported lazily to keep server startup fast
+    
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=3)
+        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=3)
         
         if response.status_code == 200:
             data = response.json()
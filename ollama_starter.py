@@ -4,9 +4,10 @@ Utility module to start Ollama automatically if it's not running.
 
 import subprocess
 import time
-import requests
 from typing import Dict, Optional
 
+from ollama_checker import OLLAMA_URL
+
 
 def start_ollama() -> Dict:
     """
@@ -21,9 +22,11 @@ def start_ollama() -> Dict:
             "pid": Optional[int]
         }
     """
+    import requests  # Imported lazily to keep server startup fast
+    
     # First check if it's already running
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=2)
+        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=2)
         if response.status_code == 200:
             return {
                 "started": False,
@@ -53,7 +56,7 @@ def start_ollama() -> Dict:
             
             # Check if it's running now
             try:
-                response = requests.get("http://localhost:11434/api/tags", timeout=3)
+                response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=3)
                 if response.status_code == 200:
                     return {
                         "started": True,
@@ -67,7 +70,7 @@ def start_ollama() -> Dict:
             # If not responding yet, wait a bit more
             time.sleep(2)
             try:
-                response = requests.get("http://localhost:11434/api/tags", timeout=3)
+                response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=3)
                 if response.status_code == 200:
                     return {
                         "started": True,
@@ -97,7 +100,7 @@ def start_ollama() -> Dict:
             time.sleep(3)
             
             try:
-                response = requests.get("http://localhost:11434/api/tags", timeout=3)
+                response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=3)
                 if response.status_code == 200:
                     return {
                         "started": True,
@@ -122,7 +125,7 @@ def start_ollama() -> Dict:
             # Check if it's running now
             for _ in range(3):
                 try:
-                    response = requests.get("http://localhost:11434/api/tags", timeout=3)
+                    response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=3)
                     if response.status_code == 200:
                         return {
                             "started": True,
@@ -164,9 +167,11 @@ def ensure_ollama_running() -> Dict:
             "error": Optional[str]
         }
     """
+    import requests  # Imported lazily to keep server startup fast
+    
     # Check if already running
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=3)
+        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=3)
         if response.status_code == 200:
             data = response.json()
             models = data.get("models", [])
@@ -190,7 +195,7 @@ def ensure_ollama_running() -> Dict:
         
         # Check again
         try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
+            response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 models = data.get("models", [])
@@ -0,0 +1,169 @@
+"""
+Per-request stage timings and opt-in request profiling.
+Stage timings are collected through a context variable so any pipeline stage
+can report into the current request, and profiles are written as cProfile
+(pstats) files to a configurable directory.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+PROFILE_DIR = os.environ.get(
+    "DICTA_PROFILE_DIR",
+    os.path.join(tempfile.gettempdir(), "dicta-profiles")
+)
+MAX_PROFILES = int(os.environ.get("DICTA_MAX_PROFILES", "50"))
+PROFILING_ENABLED = os.environ.get("DICTA_PROFILING_ENABLED", "false").lower() in ("true", "1", "yes")
+
+_PROFILE_NAME = re.compile(r"^[\w\-]+\.prof$")
+
+_current_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("dicta_timings", default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """
+    Collect stage timings for the current request.
+    Stages timed anywhere inside the block (including worker threads started
+    with run_in_threadpool) are added to the yielded dictionary.
+
+    Yields:
+        Dictionary mapping stage name to seconds spent
+    """
+    timings: Dict[str, float] = {}
+    token = _current_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["total"] = round(time.perf_counter() - start, 4)
+        _current_timings.reset(token)
+
+
+def record_timing(stage: str, seconds: float) -> None:
+    """
+    Add time spent in a stage to the current request's timings.
+    Repeated stages (e.g. several Ollama attempts) accumulate.
+    Does nothing outside collect_timings().
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+
+
+def is_profiling_requested(header_value: Optional[str], query_value: Optional[str]) -> bool:
+    """
+    Check the X-Profile header or ?profile= query flag.
+
+    Returns:
+        True if profiling is enabled and the request opted in
+    """
+    if not PROFILING_ENABLED:
+        return False
+    for value in (header_value, query_value):
+        if value and value.lower() in ("true", "1", "yes"):
+            return True
+    return False
+
+
+def run_profiled(label: str, func: Callable, *args, **kwargs) -> Tuple[Any, str]:
+    """
+    Run a function under cProfile and save the profile.
+    Must be called in the thread that does the work (e.g. inside
+    run_in_threadpool), since cProfile only profiles the current thread.
+
+    Args:
+        label: Short label included in the profile name (e.g. endpoint name)
+        func: Function to run
+
+    Returns:
+        Tuple of (function result, profile name)
+    """
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(func, *args, **kwargs)
+    finally:
+        name = _save_profile(profiler, label)
+    return result, name
+
+
+def _save_profile(profiler: cProfile.Profile, label: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r"[^\w\-]", "_", label)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}_{safe_label}_{uuid.uuid4().hex[:8]}.prof"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    _prune_profiles()
+    return name
+
+
+def _prune_profiles() -> None:
+    """Keep only the most recent MAX_PROFILES profiles."""
+    profiles = list_profiles()
+    for profile in profiles[MAX_PROFILES:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, profile["name"]))
+        except OSError:
+            pass
+
+
+def list_profiles() -> List[Dict]:
+    """
+    List saved profiles, newest first.
+
+    Returns:
+        List of dictionaries with name, size_bytes and created (unix time)
+    """
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.is_file() and _PROFILE_NAME.match(entry.name):
+            stat = entry.stat()
+            profiles.append({
+                "name": entry.name,
+                "size_bytes": stat.st_size,
+                "created": stat.st_mtime
+            })
+    profiles.sort(key=lambda p: p["created"], reverse=True)
+    return profiles
+
+
+def get_profile_path(name: str) -> Optional[str]:
+    """
+    Resolve a profile name to its path.
+
+    Returns:
+        Path to the profile, or None if the name is invalid or doesn't exist
+    """
+    if not _PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def format_profile(path: str, limit: int = 50, sort_by: str = "cumulative") -> str:
+    """
+    Render a saved profile as a pstats text report.
+
+    Args:
+        path: Path to the .prof file
+        limit: Number of functions to include
+        sort_by: pstats sort key ('cumulative', 'tottime', 'calls', ...)
+
+    Returns:
+        Text report
+    """
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.sort_stats(sort_by).print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,95 @@
+"""
+Response shaping for large transcription payloads.
+Provides field selection (e.g. "transcription,segments.start,segments.text"),
+a fast JSON encoder (orjson when installed) and NDJSON segment streaming.
+"""
+
+import json
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; fall back to the stdlib encoder
+    orjson = None
+
+
+def dumps(payload: Any) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON, using orjson when available.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with dumps() instead of the stdlib encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict]:
+    """
+    Parse a comma-separated field list into a selection tree.
+
+    "transcription,segments.start,segments.end" becomes
+    {"transcription": None, "segments": {"start": None, "end": None}},
+    where None means "the whole value".
+
+    Returns:
+        Selection tree, or None to select everything
+    """
+    if not fields or not fields.strip():
+        return None
+
+    tree: Dict = {}
+    for field in fields.split(","):
+        parts = [p.strip() for p in field.strip().split(".") if p.strip()]
+        if not parts:
+            continue
+
+        node = tree
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if last:
+                node[part] = None
+            elif node.get(part, {}) is None:
+                # Whole value already selected (e.g. "segments" and "segments.start")
+                break
+            else:
+                node = node.setdefault(part, {})
+    return tree or None
+
+
+def select_fields(payload: Any, tree: Optional[Dict]) -> Any:
+    """
+    Keep only the selected fields. Lists are filtered element by element,
+    so "segments.start" keeps the start of every segment.
+    """
+    if tree is None:
+        return payload
+    if isinstance(payload, list):
+        return [select_fields(item, tree) for item in payload]
+    if not isinstance(payload, dict):
+        return payload
+    return {
+        key: select_fields(payload[key], subtree)
+        for key, subtree in tree.items()
+        if key in payload
+    }
+
+
+def iter_ndjson(payload: Dict, list_key: str = "segments") -> Iterator[bytes]:
+    """
+    Stream a result as NDJSON: one line with every field except the list,
+    followed by one line per list item (e.g. per segment).
+    """
+    items = payload.get(list_key) or []
+    header = {key: value for key, value in payload.items() if key != list_key}
+    header[f"{list_key}_count"] = len(items)
+    yield dumps(header) + b"\n"
+    for item in items:
+        yield dumps(item) + b"\n"
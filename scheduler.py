@@ -0,0 +1,267 @@
+"""
+Priority-aware admission control for shared resources.
+Whisper and each Ollama model get a concurrency limit; work waiting for a
+slot is served by priority class (interactive before batch) and, within a
+class, round-robin across clients so one client's bulk job can't starve
+the others. Full queues shed load with Overloaded (HTTP 429).
+
+Waiting for a slot blocks a thread, so the server first admits requests to
+its threadpool per class (ThreadAdmission): surplus requests wait in the
+event loop, and batch work can never hold the threads interactive requests
+need.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+
+from metrics import QUEUE_WAIT, SHED_REQUESTS, track_queue
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Served strictly in this order
+PRIORITIES = (INTERACTIVE, BATCH)
+
+WHISPER_CONCURRENCY = int(os.environ.get("DICTA_WHISPER_CONCURRENCY", "1"))
+OLLAMA_MODEL_CONCURRENCY = int(os.environ.get(
+    "DICTA_OLLAMA_MODEL_CONCURRENCY", os.environ.get("OLLAMA_NUM_PARALLEL", "1")
+))
+MAX_QUEUE = {
+    INTERACTIVE: int(os.environ.get("DICTA_MAX_QUEUE_INTERACTIVE", "16")),
+    BATCH: int(os.environ.get("DICTA_MAX_QUEUE_BATCH", "256"))
+}
+# Longest work of each class may wait for a slot before it is shed (0 = no limit)
+MAX_WAIT_SECONDS = {
+    INTERACTIVE: float(os.environ.get("DICTA_MAX_WAIT_INTERACTIVE_SECONDS", "120")),
+    BATCH: float(os.environ.get("DICTA_MAX_WAIT_BATCH_SECONDS", "0"))
+}
+# Server threadpool size (anyio's default is 40); requests of each class may
+# occupy at most this share of it, the rest is kept for uploads, /ready etc.
+THREADPOOL_THREADS = int(os.environ.get("DICTA_THREADPOOL_THREADS", "40"))
+THREAD_SHARE = {INTERACTIVE: 0.5, BATCH: 0.25}
+
+_request_class: ContextVar[Tuple[str, str]] = ContextVar("dicta_request_class", default=(INTERACTIVE, "local"))
+
+
+class Overloaded(Exception):
+    """Raised when work is shed because a resource's queue is full or the wait is too long."""
+
+    def __init__(self, resource: str, priority: str, reason: str, retry_after: int = 5):
+        super().__init__(f"{resource} is overloaded ({reason}) for {priority} work; retry later")
+        self.resource = resource
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+def set_request_class(priority: str, client: str):
+    """
+    Set the priority class and client id for the current request; work
+    started from this context (including worker threads) inherits it.
+
+    Returns:
+        Token for reset_request_class()
+    """
+    if priority not in PRIORITIES:
+        # Unknown classes never get ahead of interactive work
+        priority = BATCH
+    return _request_class.set((priority, client or "anonymous"))
+
+
+def reset_request_class(token) -> None:
+    _request_class.reset(token)
+
+
+def current_request_class() -> Tuple[str, str]:
+    """(priority, client) of the current request."""
+    return _request_class.get()
+
+
+class ResourceQueue:
+    """Concurrency-limited resource with prioritized, per-client fair waiting."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self._cond = threading.Condition()
+        # priority -> client -> waiters, clients in round-robin order
+        self._waiting: Dict[str, "OrderedDict[str, Deque[object]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = {p: 0 for p in PRIORITIES}
+
+    def _next_waiter(self) -> Optional[object]:
+        for priority in PRIORITIES:
+            clients = self._waiting[priority]
+            if clients:
+                return next(iter(clients.values()))[0]
+        return None
+
+    def _remove(self, priority: str, client: str, waiter: object, served: bool) -> None:
+        clients = self._waiting[priority]
+        queue = clients[client]
+        queue.remove(waiter)
+        self._queued[priority] -= 1
+        if not queue:
+            del clients[client]
+        elif served:
+            # This client had its turn; the next one goes first
+            clients.move_to_end(client)
+
+    def acquire(self, priority: str, client: str) -> float:
+        """
+        Wait for a slot.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            Overloaded: The class's queue is full or the maximum wait passed
+        """
+        start = time.perf_counter()
+        with self._cond:
+            if self.active < self.limit and self._next_waiter() is None:
+                self.active += 1
+                return 0.0
+
+            if self._queued[priority] >= MAX_QUEUE[priority]:
+                raise Overloaded(self.name, priority, "queue full")
+
+            waiter = object()
+            self._waiting[priority].setdefault(client, deque()).append(waiter)
+            self._queued[priority] += 1
+            max_wait = MAX_WAIT_SECONDS[priority]
+            deadline = start + max_wait if max_wait > 0 else None
+
+            while not (self.active < self.limit and self._next_waiter() is waiter):
+                timeout = None if deadline is None else deadline - time.perf_counter()
+                if timeout is not None and timeout <= 0:
+                    self._remove(priority, client, waiter, served=False)
+                    self._cond.notify_all()
+                    raise Overloaded(self.name, priority, f"waited over {max_wait:.0f}s")
+                self._cond.wait(timeout)
+
+            self._remove(priority, client, waiter, served=True)
+            self.active += 1
+            # Another slot may still be free for the next waiter
+            self._cond.notify_all()
+        return time.perf_counter() - start
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {"limit": self.limit, "active": self.active, "queued": dict(self._queued)}
+
+
+class Scheduler:
+    """Registry of resource queues, created on first use."""
+
+    def __init__(self):
+        self._resources: Dict[str, ResourceQueue] = {}
+        self._lock = threading.Lock()
+
+    def _resource(self, name: str) -> ResourceQueue:
+        with self._lock:
+            resource = self._resources.get(name)
+            if resource is None:
+                limit = OLLAMA_MODEL_CONCURRENCY if name.startswith("ollama:") else WHISPER_CONCURRENCY
+                resource = self._resources[name] = ResourceQueue(name, limit)
+            return resource
+
+    @contextmanager
+    def slot(self, name: str) -> Iterator[None]:
+        """
+        Hold one slot of a resource (e.g. "whisper", "ollama:qwen2.5:7b")
+        for the current request's priority class and client.
+        """
+        priority, client = current_request_class()
+        resource = self._resource(name)
+        try:
+            with track_queue(name):
+                waited = resource.acquire(priority, client)
+        except Overloaded:
+            SHED_REQUESTS.labels(resource=name, priority=priority).inc()
+            raise
+        QUEUE_WAIT.labels(resource=name, priority=priority).observe(waited)
+        try:
+            yield
+        finally:
+            resource.release()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            resources = dict(self._resources)
+        return {name: resource.snapshot() for name, resource in resources.items()}
+
+
+class ThreadAdmission:
+    """
+    Per-class limit on requests running in the server's threadpool.
+
+    Requests over the limit wait in the event loop (no thread held) and are
+    admitted in arrival order; full queues and long waits shed them with
+    Overloaded, like ResourceQueue. Used only from the event loop thread.
+    """
+
+    def __init__(self, threads: int = THREADPOOL_THREADS):
+        self.limits = {p: max(1, int(threads * THREAD_SHARE[p])) for p in PRIORITIES}
+        self.active = {p: 0 for p in PRIORITIES}
+        self._waiting: Dict[str, Deque[object]] = {p: deque() for p in PRIORITIES}
+
+    def _release(self, priority: str) -> None:
+        if self._waiting[priority]:
+            # Hand the thread straight to the next waiter
+            self._waiting[priority].popleft().set()
+        else:
+            self.active[priority] -= 1
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Wait (asynchronously) until the current request's class may use another thread."""
+        import anyio
+
+        priority, _ = current_request_class()
+        waiting = self._waiting[priority]
+        if self.active[priority] < self.limits[priority] and not waiting:
+            self.active[priority] += 1
+        else:
+            if len(waiting) >= MAX_QUEUE[priority]:
+                SHED_REQUESTS.labels(resource="threadpool", priority=priority).inc()
+                raise Overloaded("threadpool", priority, "queue full")
+            event = anyio.Event()
+            waiting.append(event)
+            start = time.perf_counter()
+            max_wait = MAX_WAIT_SECONDS[priority]
+            try:
+                with track_queue("threadpool"), anyio.move_on_after(max_wait if max_wait > 0 else None):
+                    await event.wait()
+            except BaseException:
+                # Cancelled (e.g. client gone): give up the place or the thread
+                if event.is_set():
+                    self._release(priority)
+                else:
+                    waiting.remove(event)
+                raise
+            if not event.is_set():
+                waiting.remove(event)
+                SHED_REQUESTS.labels(resource="threadpool", priority=priority).inc()
+                raise Overloaded("threadpool", priority, f"waited over {max_wait:.0f}s")
+            QUEUE_WAIT.labels(resource="threadpool", priority=priority).observe(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def snapshot(self) -> Dict:
+        return {"limits": dict(self.limits), "active": dict(self.active),
+                "queued": {p: len(w) for p, w in self._waiting.items()}}
+
+
+scheduler = Scheduler()
+admission = ThreadAdmission()
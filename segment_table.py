@@ -0,0 +1,309 @@
+"""
+Columnar segment storage and subtitle export.
+Segments are kept as NumPy arrays (start, end, confidence) plus
+offset-indexed text buffers for the raw and cleaned text of each segment,
+instead of one dict per segment. SRT, WebVTT and compact JSON are
+streamed straight from the columns.
+"""
+
+import logging
+import math
+import queue
+import re
+import threading
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from metrics import track_stage
+from response_format import dumps
+
+logger = logging.getLogger("dicta.segments")
+
+# Cues formatted per yielded chunk when streaming exports
+EXPORT_BLOCK = 256
+
+_TOKEN = re.compile(r"\S+")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def _text_column(texts: Sequence[str]):
+    """(buffer, offsets) for a list of strings; text i is buffer[offsets[i]:offsets[i + 1]]."""
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    if texts:
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+    return "".join(texts), offsets
+
+
+def _normalize(token: str) -> str:
+    return _NON_WORD.sub("", token.lower())
+
+
+def align_cleaned_text(segment_texts: Sequence[str], cleaned_text: str) -> List[str]:
+    """
+    Split cleaned text into per-segment pieces.
+
+    Cleaning drops repeated words and lines and changes case and
+    punctuation, so words are matched on their normalized form: each cleaned
+    word goes to the segment of the raw word it matches, and unmatched words
+    (e.g. rewritten by AI refinement) follow the preceding word. Segments
+    whose words were all removed get an empty string.
+    """
+    raw_words, raw_segment = [], []
+    for index, text in enumerate(segment_texts):
+        for token in _TOKEN.findall(text):
+            word = _normalize(token)
+            if word:
+                raw_words.append(word)
+                raw_segment.append(index)
+
+    spans, words = [], []
+    for match in _TOKEN.finditer(cleaned_text):
+        word = _normalize(match.group())
+        if word:
+            spans.append(match.span())
+            words.append(word)
+
+    pieces = [""] * len(segment_texts)
+    if not spans or not raw_words:
+        return pieces
+
+    owner = np.full(len(words), -1, dtype=np.int64)
+    matcher = SequenceMatcher(None, raw_words, words)
+    for a, b, size in matcher.get_matching_blocks():
+        owner[b:b + size] = raw_segment[a:a + size]
+
+    # Unmatched words belong with the previous matched one (or the first, at the start)
+    matched = np.flatnonzero(owner >= 0)
+    if not len(matched):
+        owner[:] = 0
+    else:
+        owner[:matched[0]] = owner[matched[0]]
+        filled = np.maximum.accumulate(np.where(owner >= 0, np.arange(len(owner)), 0))
+        owner = owner[filled]
+
+    bounds = np.flatnonzero(np.diff(owner)) + 1
+    for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(owner)] - 1):
+        pieces[owner[first]] = cleaned_text[spans[first][0]:spans[last][1]]
+    return pieces
+
+
+def _confidence(segment: Dict) -> float:
+    if segment.get("confidence") is not None:
+        return float(segment["confidence"])
+    if segment.get("avg_logprob") is not None:
+        # Mean token probability
+        return min(1.0, math.exp(segment["avg_logprob"]))
+    return float("nan")
+
+
+def _timestamps(times: np.ndarray, separator: str) -> List[str]:
+    ms = np.rint(np.maximum(times, 0.0) * 1000).astype(np.int64)
+    hours, ms = np.divmod(ms, 3_600_000)
+    minutes, ms = np.divmod(ms, 60_000)
+    seconds, ms = np.divmod(ms, 1000)
+    return [
+        f"{h:02d}:{m:02d}:{s:02d}{separator}{f:03d}"
+        for h, m, s, f in zip(hours.tolist(), minutes.tolist(), seconds.tolist(), ms.tolist())
+    ]
+
+
+def _cue_text(text: str) -> str:
+    # A blank line would end the cue early
+    return " ".join(text.split())
+
+
+def _rounded(values: np.ndarray) -> List[Optional[float]]:
+    return [None if v != v else v for v in np.round(values.astype(np.float64), 3).tolist()]
+
+
+class SegmentTable:
+    """Timed segments of one transcript in columnar form."""
+
+    __slots__ = ("start", "end", "confidence", "_text", "_text_offsets", "_cleaned", "_cleaned_offsets")
+
+    def __init__(self, start: Sequence[float], end: Sequence[float], confidence: Sequence[float],
+                 texts: Sequence[str], cleaned_texts: Sequence[str]):
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        self.confidence = np.asarray(confidence, dtype=np.float32)
+        self._text, self._text_offsets = _text_column(texts)
+        self._cleaned, self._cleaned_offsets = _text_column(cleaned_texts)
+
+    @classmethod
+    def from_segments(cls, segments: Sequence[Dict], cleaned_text: Optional[str] = None) -> "SegmentTable":
+        """
+        Build a table from Whisper segments (or from to_records() output).
+
+        Args:
+            segments: Dicts with 'start', 'end', 'text' and optionally
+                      'confidence' or Whisper's 'avg_logprob'
+            cleaned_text: Cleaned transcript to map onto the segments; used
+                          when the records don't carry 'cleaned_text'
+        """
+        texts = [(s.get("text") or "").strip() for s in segments]
+        if segments and all("cleaned_text" in s for s in segments):
+            cleaned = [s["cleaned_text"] or "" for s in segments]
+        elif cleaned_text is not None:
+            cleaned = align_cleaned_text(texts, cleaned_text)
+        else:
+            cleaned = texts
+        return cls(
+            [s.get("start", 0.0) for s in segments],
+            [s.get("end", 0.0) for s in segments],
+            [_confidence(s) for s in segments],
+            texts,
+            cleaned
+        )
+
+    @classmethod
+    def from_columns(cls, columns: Dict) -> "SegmentTable":
+        """Inverse of to_columns()."""
+        return cls(
+            columns["start"],
+            columns["end"],
+            [float("nan") if c is None else c for c in columns["confidence"]],
+            columns["text"],
+            columns["cleaned_text"]
+        )
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def text(self, index: int, cleaned: bool = False) -> str:
+        if cleaned:
+            return self._cleaned[self._cleaned_offsets[index]:self._cleaned_offsets[index + 1]]
+        return self._text[self._text_offsets[index]:self._text_offsets[index + 1]]
+
+    def texts(self, cleaned: bool = False) -> List[str]:
+        buffer, offsets = (self._cleaned, self._cleaned_offsets) if cleaned else (self._text, self._text_offsets)
+        bounds = offsets.tolist()
+        return [buffer[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the table."""
+        arrays = (self.start, self.end, self.confidence, self._text_offsets, self._cleaned_offsets)
+        return sum(a.nbytes for a in arrays) + len(self._text.encode()) + len(self._cleaned.encode())
+
+    # -- serialization -------------------------------------------------------
+
+    def to_columns(self) -> Dict[str, List]:
+        """Compact JSON-ready form: one list per column."""
+        return {
+            "start": _rounded(self.start),
+            "end": _rounded(self.end),
+            "confidence": _rounded(self.confidence),
+            "text": self.texts(),
+            "cleaned_text": self.texts(cleaned=True)
+        }
+
+    def to_records(self) -> List[Dict]:
+        """One dict per segment (for API responses)."""
+        columns = self.to_columns()
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    # -- export --------------------------------------------------------------
+
+    def _cues(self, cleaned: bool, separator: str) -> Iterator[tuple]:
+        """(start, end, text) per non-empty segment, formatted a block at a time."""
+        for block in range(0, len(self), EXPORT_BLOCK):
+            window = slice(block, block + EXPORT_BLOCK)
+            starts = _timestamps(self.start[window], separator)
+            ends = _timestamps(self.end[window], separator)
+            for i, (start, end) in enumerate(zip(starts, ends)):
+                text = _cue_text(self.text(block + i, cleaned))
+                if text:
+                    yield start, end, text
+
+    def iter_srt(self, cleaned: bool = True) -> Iterator[bytes]:
+        """Stream the segments as SubRip (.srt) cues."""
+        number = 0
+        lines = []
+        for start, end, text in self._cues(cleaned, ","):
+            number += 1
+            lines.append(f"{number}\n{start} --> {end}\n{text}\n\n")
+            if len(lines) == EXPORT_BLOCK:
+                yield "".join(lines).encode("utf-8")
+                lines = []
+        if lines:
+            yield "".join(lines).encode("utf-8")
+
+    def iter_vtt(self, cleaned: bool = True) -> Iterator[bytes]:
+        """Stream the segments as WebVTT (.vtt) cues."""
+        lines = ["WEBVTT\n\n"]
+        for start, end, text in self._cues(cleaned, "."):
+            lines.append(f"{start} --> {end}\n{text}\n\n")
+            if len(lines) >= EXPORT_BLOCK:
+                yield "".join(lines).encode("utf-8")
+                lines = []
+        if lines:
+            yield "".join(lines).encode("utf-8")
+
+    def iter_json(self, cleaned: bool = True) -> Iterator[bytes]:
+        """
+        Stream compact columnar JSON:
+        {"count": n, "start": [...], "end": [...], "confidence": [...], "text": [...]}
+        """
+        yield (b'{"count":' + dumps(len(self))
+               + b',"start":' + dumps(_rounded(self.start))
+               + b',"end":' + dumps(_rounded(self.end))
+               + b',"confidence":' + dumps(_rounded(self.confidence))
+               + b',"text":[')
+        for block in range(0, len(self), EXPORT_BLOCK):
+            texts = [self.text(i, cleaned) for i in range(block, min(block + EXPORT_BLOCK, len(self)))]
+            yield (b"," if block else b"") + b",".join(dumps(t) for t in texts)
+        yield b"]}"
+
+
+class LazySegmentTable:
+    """
+    Segments waiting to be converted to a SegmentTable.
+
+    Aligning the cleaned text takes noticeable time on long recordings, so
+    /transcribe doesn't wait for it: the table is built once, on the first
+    get() (by the transcript store's writer thread, or by build_in_background()
+    when there is no store), and shared by everyone holding this object.
+    After that it holds only the SegmentTable.
+    """
+
+    __slots__ = ("_segments", "_cleaned_text", "_table", "_lock")
+
+    def __init__(self, segments: Sequence[Dict], cleaned_text: Optional[str] = None):
+        self._segments = segments
+        self._cleaned_text = cleaned_text
+        self._table: Optional[SegmentTable] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> SegmentTable:
+        with self._lock:
+            if self._table is None:
+                with track_stage("segment_table"):
+                    self._table = SegmentTable.from_segments(self._segments, self._cleaned_text)
+                # The per-segment dicts aren't needed any more
+                self._segments = self._cleaned_text = None
+            return self._table
+
+
+_build_queue: "queue.Queue[LazySegmentTable]" = queue.Queue()
+_builder: Optional[threading.Thread] = None
+_builder_lock = threading.Lock()
+
+
+def _build_loop() -> None:
+    while True:
+        table = _build_queue.get()
+        try:
+            table.get()
+        except Exception:
+            logger.exception("Failed to build a segment table")
+
+
+def build_in_background(table: LazySegmentTable) -> None:
+    """Build the table on a background thread, so the raw segment dicts are released soon."""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = threading.Thread(target=_build_loop, name="dicta-segment-builder", daemon=True)
+            _builder.start()
+    _build_queue.put(table)
@@ -1,21 +1,165 @@
-import mlx_whisper
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+import time
+_import_start = time.perf_counter()
+
+import logging
+import anyio.to_thread
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import shutil
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.requests import ClientDisconnect
+from starlette.routing import Match
 import os
 import tempfile
-from pathlib import Path
-from text_cleaner import process_transcription
+import uuid
+from text_cleaner import refine_with_llm
+from transcriber import MODEL_PATH, get_backend, transcribe_batch, transcribe_file
 from summarizer import generate_summary
 from ollama_checker import check_ollama_status, get_recommended_model
 from ollama_starter import ensure_ollama_running
-from typing import Optional
+from metrics import (
+    REQUEST_LATENCY,
+    REQUESTS_IN_FLIGHT,
+    render_metrics,
+    track_stage,
+)
+from profiling import (
+    collect_timings,
+    format_profile,
+    get_profile_path,
+    is_profiling_requested,
+    list_profiles,
+    run_profiled,
+)
+from response_format import FastJSONResponse, dumps, iter_ndjson, parse_fields, select_fields
+from startup import readiness, start_warmup
+from model_router import router
+from model_residency import InsufficientMemory, residency, start_watchdog
+from scheduler import (BATCH, INTERACTIVE, THREADPOOL_THREADS, Overloaded, admission, reset_request_class,
+                       scheduler, set_request_class)
+from transcript_store import get_store
+from sessions import sessions
+from segment_table import LazySegmentTable, build_in_background
+from uploads import MAX_UPLOAD_BYTES, UploadError, get_upload_manager
 from pydantic import BaseModel
 
-app = FastAPI()
+logger = logging.getLogger("dicta")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s - %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+_import_seconds = time.perf_counter() - _import_start
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy work (Whisper import/load, Ollama model load) happens in the
+    # background so the port binds immediately; /ready reports when it's done.
+    readiness.record_phase("imports", _import_seconds)
+    logger.info("Startup phase imports took %.3fs", _import_seconds)
+    # Pipeline requests are admitted per priority class within this many threads
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_THREADS
+    stop_warmup = start_warmup()
+    stop_watchdog = start_watchdog()
+    store = get_store()
+    yield
+    if stop_warmup is not None:
+        stop_warmup.set()
+    stop_watchdog.set()
+    if store is not None:
+        store.close()
+
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+
+# Compress large responses (long transcripts and segment lists compress ~5-10x)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Model will be loaded on first request (lazy loading)
+model_loaded = False
+model_path = MODEL_PATH
+
+
+def _endpoint_label(request: Request) -> str:
+    """Route template for metric labels (keeps path parameters out of label values)."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+# Multipart endpoints: FastAPI spools the whole body before the endpoint runs
+_MULTIPART_UPLOAD_PATHS = ("/transcribe", "/transcribe/batch")
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """
+    Reject oversized multipart uploads from their Content-Length, before
+    the body is read and spooled to disk. The cap applies to the whole
+    request (all files of a batch); _save_upload still checks each file.
+    Chunked uploads without a length are refused, since their size is only
+    known after spooling; clients without a length can use /uploads.
+    """
+    if request.method == "POST" and request.url.path in _MULTIPART_UPLOAD_PATHS:
+        length = request.headers.get("content-length")
+        if length is None or not length.isdigit():
+            return FastJSONResponse({"detail": "Content-Length required"}, status_code=411)
+        if int(length) > MAX_UPLOAD_BYTES:
+            return FastJSONResponse(
+                {"detail": f"Request larger than the {MAX_UPLOAD_BYTES // 2**20} MB limit; use /uploads"},
+                status_code=413
+            )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = _endpoint_label(request)
+    in_flight = REQUESTS_IN_FLIGHT.labels(endpoint=endpoint)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        REQUEST_LATENCY.labels(
+            endpoint=endpoint,
+            method=request.method,
+            status=str(status)
+        ).observe(time.perf_counter() - start)
+
 
-# Enable CORS for localhost frontend (including file:// protocol)
+@app.middleware("http")
+async def assign_priority(request: Request, call_next):
+    """
+    Tag the request with its priority class and client for the scheduler.
+    Batch uploads default to the batch class; any request can set
+    X-Priority: interactive|batch; any other value counts as batch. Clients
+    are told apart by X-Client-Id, falling back to the remote address.
+    """
+    default = BATCH if request.url.path == "/transcribe/batch" else INTERACTIVE
+    priority = request.headers.get("x-priority", default).lower()
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else "")
+    token = set_request_class(priority, client)
+    try:
+        return await call_next(request)
+    finally:
+        reset_request_class(token)
+
+
+# Enable CORS for localhost frontend (including file:// protocol). Added after
+# the middlewares above so it wraps them: their early answers (411/413) carry
+# the CORS headers too.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins for local development
@@ -24,20 +168,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Model will be loaded on first request (lazy loading)
-model_loaded = False
-model_path = "mlx-community/whisper-large-v3-turbo"
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return FastJSONResponse(
+        {"detail": str(exc), "resource": exc.resource, "priority": exc.priority},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(InsufficientMemory)
+async def insufficient_memory_handler(request: Request, exc: InsufficientMemory):
+    return FastJSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "30"})
+
 
 @app.get("/")
 async def root():
     return {"message": "Speech-to-Text API is running", "model": model_path}
 
+def _wants_profile(request: Request) -> bool:
+    return is_profiling_requested(
+        request.headers.get("x-profile"),
+        request.query_params.get("profile")
+    )
+
+
+async def _run_pipeline(label: str, profile: bool, func, *args, **kwargs) -> tuple:
+    """
+    Run a blocking pipeline function in a worker thread, optionally under cProfile.
+    
+    Requests wait for a thread of their priority class in the event loop,
+    so queued work can't take the threads other requests need.
+    
+    Returns:
+        Tuple of (result, profile name or None)
+    """
+    async with admission.admit():
+        if profile:
+            return await run_in_threadpool(run_profiled, label, func, *args, **kwargs)
+        return await run_in_threadpool(func, *args, **kwargs), None
+
+
+def _render_result(result: dict, fields: Optional[str], response_format: str) -> Response:
+    """
+    Apply field selection and serialize a transcription result.
+    Returning a Response directly skips FastAPI's jsonable_encoder pass,
+    which dominates serialization time for large segment lists.
+    """
+    with track_stage("serialize"):
+        selected = select_fields(result, parse_fields(fields))
+        if "transcript_id" in result:
+            # Always returned so follow-up calls can refer to the stored transcript
+            selected["transcript_id"] = result["transcript_id"]
+        if response_format == "ndjson":
+            return StreamingResponse(iter_ndjson(selected), media_type="application/x-ndjson")
+        return FastJSONResponse(selected)
+
+
 @app.post("/transcribe")
 async def transcribe(
+    request: Request,
     file: UploadFile = File(...),
     clean_text: str = Form("true"),
     use_ai_refinement: str = Form("false"),
-    ai_model: Optional[str] = Form(None)
+    ai_model: Optional[str] = Form(None),
+    skip_silence: str = Form("false"),
+    fields: Optional[str] = Form(None),
+    format: str = Form("json")
 ):
     """
     Transcribe an audio file to text using MLX Whisper.
@@ -47,68 +245,429 @@ async def transcribe(
     - clean_text: Apply basic text cleaning (remove repetitions, fix formatting)
     - use_ai_refinement: Use AI for final refinement (requires Ollama or similar)
     - ai_model: AI model identifier (optional, defaults to llama3.2:1b for Ollama)
+    - skip_silence: Detect speech first and only send speech regions to Whisper
+    - fields: Comma-separated fields to return, with dots for segment fields
+      (e.g. "transcription,segments.start,segments.end,segments.text").
+      Defaults to everything.
+    - format: 'json' (default) or 'ndjson' (one line of metadata, then one line per segment)
+    
+    fields and format can also be passed as query parameters.
+    
+    The result is returned with a "transcript_id": /summarize and /refine
+    accept it instead of the text, and the transcript is saved to the
+    store in the background (see GET /transcripts/{id}).
+    
+    Send the X-Profile: 1 header (or ?profile=1) to record a cProfile
+    profile of the request; its name is returned as "profile".
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    # Create temporary file to save uploaded audio
-    temp_dir = tempfile.gettempdir()
-    temp_file_path = os.path.join(temp_dir, f"temp_{file.filename}")
+    fields = request.query_params.get("fields", fields)
+    response_format = request.query_params.get("format", format).lower()
+    if response_format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format. Must be one of: json, ndjson")
     
+    should_clean = clean_text.lower() in ("true", "1", "yes")
+    should_use_ai = use_ai_refinement.lower() in ("true", "1", "yes")
+    should_skip_silence = skip_silence.lower() in ("true", "1", "yes")
+    
+    temp_file_path = None
     try:
-        # Save uploaded file temporarily
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Transcribe using MLX Whisper
-        result = mlx_whisper.transcribe(
-            temp_file_path,
-            path_or_hf_repo=model_path,
-            verbose=False
-        )
-        
-        # Extract raw text from result
-        raw_text = result.get("text", "")
-        
-        # Parse boolean parameters
-        should_clean = clean_text.lower() in ("true", "1", "yes")
-        should_use_ai = use_ai_refinement.lower() in ("true", "1", "yes")
-        
-        # Process and clean the text
-        if should_clean or should_use_ai:
-            processed_text = process_transcription(
-                raw_text,
-                use_ai_refinement=should_use_ai,
-                ai_model=ai_model
+        with collect_timings() as timings:
+            # Save the upload to its own temporary file
+            with track_stage("upload_write"):
+                temp_file_path = await run_in_threadpool(_save_upload, file, "dicta_")
+            
+            result = await _transcribe_saved(
+                request, temp_file_path, file.filename,
+                should_clean, should_use_ai, ai_model, should_skip_silence
             )
-        else:
-            processed_text = raw_text
-        
-        # Also return segments if available for more detailed output
-        segments = result.get("segments", [])
         
-        return {
-            "transcription": processed_text,
-            "raw_transcription": raw_text,  # Include raw for comparison
-            "segments": segments,
-            "filename": file.filename,
-            "cleaned": should_clean,
-            "ai_refined": should_use_ai
-        }
+        result["timings"] = timings
+        return _render_result(result, fields, response_format)
     
+    except (Overloaded, InsufficientMemory, HTTPException):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
     
     finally:
-        # Clean up temporary file
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        if temp_file_path:
+            _remove_files([temp_file_path])
+
+
+def _save_upload(upload: UploadFile, prefix: str) -> str:
+    """
+    Copy a multipart upload to a unique temporary file, enforcing the upload size cap.
+    
+    Returns:
+        Path of the temporary file (the caller removes it)
+    """
+    suffix = os.path.splitext(upload.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            for block in iter(lambda: upload.file.read(2**20), b""):
+                written += len(block)
+                if written > MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File larger than the {MAX_UPLOAD_BYTES // 2**20} MB limit"
+                    )
+                buffer.write(block)
+    except BaseException:
+        _remove_files([path])
+        raise
+    return path
+
+
+async def _transcribe_saved(request: Request, path: str, filename: str, should_clean: bool,
+                            should_use_ai: bool, ai_model: Optional[str], should_skip_silence: bool) -> dict:
+    """Transcribe an audio file already on disk and open its transcript."""
+    result, profile_name = await _run_pipeline(
+        "transcribe",
+        _wants_profile(request),
+        transcribe_file,
+        path,
+        should_clean,
+        should_use_ai,
+        ai_model,
+        should_skip_silence
+    )
+    result["transcript_id"] = await run_in_threadpool(_open_transcript, result, filename)
+    result.update({
+        "filename": filename,
+        "cleaned": should_clean,
+        "ai_refined": should_use_ai,
+        "profile": profile_name
+    })
+    return result
+
+@app.post("/transcribe/batch")
+async def transcribe_batch_endpoint(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    clean_text: str = Form("true"),
+    use_ai_refinement: str = Form("false"),
+    ai_model: Optional[str] = Form(None),
+    skip_silence: str = Form("false"),
+    fields: Optional[str] = Form(None),
+    format: str = Form("ndjson")
+):
+    """
+    Transcribe many audio files in one request.
+    
+    Short clips (up to 60 s) are packed together into shared Whisper calls,
+    the texts of each pack are cleaned together, and AI refinement runs for
+    finished files in parallel while the model works on the next pack. Each
+    file succeeds or fails on its own.
+    
+    Parameters are the same as /transcribe and apply to every file. With
+    format='ndjson' (default) one line is streamed per file as soon as it is
+    done, in completion order; format='json' returns {"results": [...]} in
+    upload order. Every result has "index", "filename" and either the
+    transcription fields plus "transcript_id", or "error".
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    
+    fields = request.query_params.get("fields", fields)
+    response_format = request.query_params.get("format", format).lower()
+    if response_format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format. Must be one of: json, ndjson")
+    
+    should_clean = clean_text.lower() in ("true", "1", "yes")
+    should_use_ai = use_ai_refinement.lower() in ("true", "1", "yes")
+    should_skip_silence = skip_silence.lower() in ("true", "1", "yes")
+    selection = parse_fields(fields)
+    
+    # Save every upload to its own temporary file
+    temp_paths = []
+    try:
+        with track_stage("upload_write"):
+            for upload in files:
+                temp_paths.append(await run_in_threadpool(_save_upload, upload, "dicta_batch_"))
+    except HTTPException:
+        _remove_files(temp_paths)
+        raise
+    except Exception as e:
+        _remove_files(temp_paths)
+        raise HTTPException(status_code=500, detail=f"Saving uploads failed: {str(e)}")
+    
+    def shape(index: int, result: dict) -> dict:
+        keys = {"index": index, "filename": files[index].filename}
+        if "error" not in result:
+            keys["transcript_id"] = _open_transcript(result, files[index].filename)
+            result = select_fields(result, selection)
+        # Always keep the keys needed to match results to files
+        return dict(result, **keys)
+    
+    def results():
+        try:
+            for index, result in transcribe_batch(
+                temp_paths,
+                should_clean=should_clean,
+                should_use_ai=should_use_ai,
+                ai_model=ai_model,
+                should_skip_silence=should_skip_silence
+            ):
+                yield shape(index, result)
+        finally:
+            _remove_files(temp_paths)
+    
+    if response_format == "json":
+        try:
+            async with admission.admit():
+                collected = await run_in_threadpool(lambda: list(results()))
+        except BaseException:
+            _remove_files(temp_paths)  # In case the generator never started
+            raise
+        collected.sort(key=lambda r: r["index"])
+        return FastJSONResponse({"results": collected, "count": len(collected)})
+    
+    async def stream():
+        try:
+            async with admission.admit():
+                async for result in iterate_in_threadpool(results()):
+                    yield dumps(result) + b"\n"
+        finally:
+            _remove_files(temp_paths)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def _open_transcript(result: dict, filename: Optional[str]) -> str:
+    """
+    Queue a result for the transcript store and open a session for it.
+    Segments are converted to columnar form, with the cleaned text mapped
+    onto them, off the request path: by the store's writer thread, or by a
+    background builder when the store is disabled. Either way the session
+    ends up holding only the table, not the per-segment dicts.
+    
+    Returns:
+        Transcript id (a fresh id if the store is disabled)
+    """
+    segments = LazySegmentTable(result.get("segments") or [], result.get("transcription", ""))
+    store = get_store()
+    if store is not None:
+        # Queued for the background writer; doesn't wait for the database
+        transcript_id = store.save_transcript(result, filename, segments)
+    else:
+        transcript_id = uuid.uuid4().hex
+        build_in_background(segments)
+    sessions.create(transcript_id, result.get("transcription", ""), segments)
+    return transcript_id
+
+
+def _remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CreateUploadRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+
+class CompleteUploadRequest(BaseModel):
+    clean_text: bool = True
+    use_ai_refinement: bool = False
+    ai_model: Optional[str] = None
+    skip_silence: bool = False
+    fields: Optional[str] = None
+    format: str = "json"
+
+
+def _upload_error(e: UploadError) -> HTTPException:
+    detail = {"message": str(e), **e.details} if e.details else str(e)
+    return HTTPException(status_code=e.status_code, detail=detail)
+
+
+@app.post("/uploads", status_code=201)
+async def create_upload(request: CreateUploadRequest):
+    """
+    Start a resumable upload of a large audio file.
+    
+    Send the total size in bytes and, optionally, the file's SHA-256 (checked
+    when the upload is completed). Then PUT the bytes in chunks to
+    /uploads/{upload_id}?offset=N, each starting where the previous one ended
+    ("chunk_size" is a good size), and POST /uploads/{upload_id}/complete.
+    After a dropped connection, GET /uploads/{upload_id} returns the offset
+    to resume from.
+    """
+    try:
+        return await run_in_threadpool(get_upload_manager().create, request.filename, request.size, request.sha256)
+    except UploadError as e:
+        raise _upload_error(e)
+
+
+@app.get("/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    """Size, bytes received so far ("offset") and whether the upload is complete."""
+    try:
+        return await run_in_threadpool(get_upload_manager().status, upload_id)
+    except UploadError as e:
+        raise _upload_error(e)
+
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: Optional[int] = None):
+    """
+    Append one chunk (the raw request body) at ?offset=N (or an Upload-Offset header).
+    
+    The offset must equal the bytes received so far; otherwise the answer is
+    409 with the expected "offset". The chunk is written to disk and hashed
+    as it streams in. An optional X-Chunk-SHA256 header is checked before the
+    chunk is kept; a failed or interrupted chunk is discarded and can be resent.
+    """
+    if offset is None:
+        header = request.headers.get("upload-offset")
+        if header is None or not header.isdigit():
+            raise HTTPException(status_code=400, detail="Missing offset (query parameter or Upload-Offset header)")
+        offset = int(header)
+    
+    manager = get_upload_manager()
+    try:
+        writer = await run_in_threadpool(manager.begin_chunk, upload_id, offset)
+    except UploadError as e:
+        raise _upload_error(e)
+    
+    try:
+        with track_stage("upload_write"):
+            async for data in request.stream():
+                if data:
+                    await run_in_threadpool(writer.write, data)
+            return await run_in_threadpool(writer.commit, request.headers.get("x-chunk-sha256"))
+    except ClientDisconnect:
+        # Drop the partial chunk so it can be resent; the client won't see
+        # the answer, and 499 keeps the disconnect out of the server errors
+        await run_in_threadpool(writer.rollback)
+        raise HTTPException(status_code=499, detail="Client disconnected; resend the chunk")
+    except BaseException as e:
+        await run_in_threadpool(writer.rollback)
+        if isinstance(e, UploadError):
+            raise _upload_error(e)
+        raise
+
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, request: CompleteUploadRequest, http_request: Request):
+    """
+    Verify a finished upload (size and SHA-256) and transcribe it.
+    
+    Takes the same options as /transcribe (as JSON) and returns the same
+    result. Decoding starts straight from the uploaded file; the upload is
+    deleted once transcribed. If transcription fails the upload is kept, so
+    completing it can be retried. A second complete while one is running
+    gets 409.
+    """
+    response_format = request.format.lower()
+    if response_format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format. Must be one of: json, ndjson")
+    
+    manager = get_upload_manager()
+    try:
+        upload = await run_in_threadpool(manager.finalize, upload_id)
+    except UploadError as e:
+        raise _upload_error(e)
+    
+    try:
+        with collect_timings() as timings:
+            result = await _transcribe_saved(
+                http_request, upload["path"], upload["filename"],
+                request.clean_text, request.use_ai_refinement, request.ai_model, request.skip_silence
+            )
+    except BaseException as e:
+        # Keep the upload so completing it can be retried
+        await run_in_threadpool(manager.release, upload_id)
+        if isinstance(e, Exception) and not isinstance(e, (Overloaded, InsufficientMemory)):
+            raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
+        raise
+    
+    await run_in_threadpool(manager.finish, upload_id)
+    result.update({"sha256": upload["sha256"], "timings": timings})
+    return _render_result(result, request.fields, response_format)
+
+
+@app.delete("/uploads/{upload_id}", status_code=204)
+async def abort_upload(upload_id: str):
+    """Abandon an upload and delete what was received (409 while a chunk is written or it is being completed)."""
+    try:
+        await run_in_threadpool(get_upload_manager().delete, upload_id)
+    except UploadError as e:
+        raise _upload_error(e)
+    return Response(status_code=204)
+
 
 @app.get("/health")
 async def health():
+    """Liveness probe: the process is up and serving HTTP."""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the Whisper model and the preferred Ollama
+    model are loaded and warmed, 503 until then. The body lists component
+    state, how long each startup phase took, the scheduler queues and
+    model residency and memory use. An evicted Whisper model doesn't make
+    the server unready: the next transcription reloads it.
+    """
+    state = readiness.snapshot()
+    is_ready = readiness.is_ready()
+    residency_state = await run_in_threadpool(residency.snapshot, get_backend())
+    return FastJSONResponse(
+        {"ready": is_ready, **state, "queues": scheduler.snapshot(),
+         "threadpool": admission.snapshot(), "residency": residency_state},
+        status_code=200 if is_ready else 503
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    """Expose pipeline metrics in Prometheus text format."""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+@app.get("/profiles")
+async def profiles():
+    """List recently recorded request profiles, newest first."""
+    return {"profiles": list_profiles()}
+
+
+@app.get("/profiles/{name}")
+async def download_profile(name: str, format: str = "prof", limit: int = 50, sort: str = "cumulative"):
+    """
+    Download a recorded profile.
+    
+    Parameters:
+    - format: 'prof' for the raw pstats file (open with snakeviz or pstats),
+      'text' for a readable report of the top functions
+    - limit: Number of functions in the text report
+    - sort: pstats sort key for the text report ('cumulative', 'tottime', ...)
+    """
+    path = get_profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "text":
+        try:
+            report = format_profile(path, limit=limit, sort_by=sort)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Invalid sort key: {sort}")
+        return PlainTextResponse(report)
+    
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
 @app.get("/ollama/status")
 async def ollama_status():
     """
@@ -116,11 +675,13 @@ async def ollama_status():
     Automatically starts Ollama if it's not running.
     
     Returns:
-        Status information including whether Ollama is running
-        and which models are available.
+        Status information including whether Ollama is running,
+        which models are available and the measured speed of each model
+        used so far (prompt and generation tokens/sec, used for routing).
     """
     # Ensure Ollama is running (will start it if needed)
-    status = ensure_ollama_running()
+    with track_stage("ollama_status"):
+        status = await run_in_threadpool(ensure_ollama_running)
     
     recommended_model = None
     if status["running"] and status["available_models"]:
@@ -131,31 +692,147 @@ async def ollama_status():
         "was_started": status.get("was_started", False),
         "available_models": status["available_models"],
         "recommended_model": recommended_model,
+        "routing": router.snapshot(),
         "error": status["error"]
     }
 
 
+@app.get("/transcripts")
+async def list_transcripts(q: Optional[str] = None, limit: int = 20, offset: int = 0):
+    """
+    Search stored transcripts (full-text, best matches first) or, without
+    q, list the most recent ones. Words must all match; end a word with *
+    for prefix search.
+    """
+    store = _require_store()
+    limit = max(1, min(limit, 100))
+    with track_stage("transcript_search"):
+        results = await run_in_threadpool(store.search, q, limit, max(0, offset))
+    return {"query": q, "results": results, "count": len(results)}
+
+
+@app.get("/transcripts/{transcript_id}")
+async def get_transcript(transcript_id: str):
+    """Fetch a stored transcript with raw and cleaned text, segments and summaries."""
+    store = _require_store()
+    transcript = await run_in_threadpool(store.get_transcript, transcript_id)
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return transcript
+
+
+EXPORT_FORMATS = {
+    "srt": ("iter_srt", "application/x-subrip; charset=utf-8"),
+    "vtt": ("iter_vtt", "text/vtt; charset=utf-8"),
+    "json": ("iter_json", "application/json")
+}
+
+
+@app.get("/transcripts/{transcript_id}/export")
+async def export_transcript(transcript_id: str, format: str = "srt", text: str = "cleaned"):
+    """
+    Download a transcript's timed segments as subtitles or compact JSON.
+
+    Parameters:
+    - format: 'srt' (default), 'vtt' (WebVTT) or 'json' (one array per
+      column: start, end, confidence, text)
+    - text: 'cleaned' (default; the cleaned transcription mapped onto the
+      segments, dropping segments whose words were all removed) or 'raw'
+      (Whisper's text)
+
+    Works for any transcript still in a session or in the transcript store.
+    """
+    format = format.lower()
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Must be one of: srt, vtt, json")
+    if text not in ("cleaned", "raw"):
+        raise HTTPException(status_code=400, detail="Invalid text. Must be one of: cleaned, raw")
+
+    session = await run_in_threadpool(sessions.get, transcript_id)
+    # The first access may have to build the segment table
+    segments = await run_in_threadpool(lambda: session.segments) if session is not None else None
+    if segments is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+
+    method, media_type = EXPORT_FORMATS[format]
+    # Generated a block of cues at a time, straight from the segment columns
+    body = getattr(segments, method)(cleaned=text == "cleaned")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{transcript_id}.{format}"'}
+    )
+
+
+def _require_store():
+    store = get_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Transcript store is disabled or unavailable")
+    return store
+
+
+async def _resolve_text(text: Optional[str], transcript_id: Optional[str]) -> tuple:
+    """
+    Return (text, session) for a request that sends either the text or a
+    transcript id. Text sent in the body wins and isn't memoized.
+    """
+    if text is not None:
+        return text, None
+    if not transcript_id:
+        raise HTTPException(status_code=400, detail="Provide either text or transcript_id")
+    
+    session = await run_in_threadpool(sessions.get, transcript_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Transcript not found or expired. Transcribe the file again.")
+    return session.text, session
+
+
+def _memoized(session, key: tuple, func, *args, should_cache=lambda value: True) -> tuple:
+    """
+    Call func(*args), memoized under key in the transcript session if there is one.
+    
+    Returns:
+        Tuple of (result, whether it was memoized)
+    """
+    if session is None:
+        return func(*args), False
+    return sessions.memoize(session, key, lambda: func(*args), should_cache)
+
+
 class SummarizeRequest(BaseModel):
-    text: str
+    text: Optional[str] = None
     summary_type: str  # 'executive', 'top3', 'top5', 'top10'
     model: Optional[str] = None
+    transcript_id: Optional[str] = None
+    mode: str = "llm"  # 'llm' or 'extractive'
 
 
 @app.post("/summarize")
-async def summarize(request: SummarizeRequest):
+async def summarize(request: SummarizeRequest, http_request: Request):
     """
     Generate summaries or extract key ideas from transcribed text.
     
     Parameters:
-    - text: The cleaned/refined transcription text
+    - transcript_id: Id returned by /transcribe (preferred; the text stays on the server)
+    - text: The cleaned/refined transcription text, instead of transcript_id
     - summary_type: Type of summary ('executive', 'top3', 'top5', 'top10')
     - model: Optional AI model identifier (defaults to best available)
+    - mode: 'llm' (default, Ollama) or 'extractive' (the key sentences of the
+      text, ranked with TF-IDF/TextRank in milliseconds; no Ollama needed)
+    
+    Summaries requested by transcript_id are memoized per transcript, summary
+    type and model ("cached": true on a repeat) and stored with the transcript.
     
     Returns:
     - For 'executive': Executive summary text
     - For 'top3', 'top5', 'top10': List of key ideas
+    
+    Send the X-Profile: 1 header (or ?profile=1) to record a cProfile
+    profile of the request; its name is returned as "profile".
     """
-    if not request.text or len(request.text.strip()) < 50:
+    text, session = await _resolve_text(request.text, request.transcript_id)
+    
+    if not text or len(text.strip()) < 50:
         raise HTTPException(
             status_code=400, 
             detail="Text is too short to generate a summary. Minimum 50 characters required."
@@ -168,24 +845,100 @@ async def summarize(request: SummarizeRequest):
             detail=f"Invalid summary_type. Must be one of: {', '.join(valid_types)}"
         )
     
+    if request.mode not in ("llm", "extractive"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Must be one of: llm, extractive")
+    
     try:
-        result = generate_summary(
-            request.text,
-            request.summary_type,
-            request.model
-        )
+        with collect_timings() as timings:
+            with track_stage("summarize"):
+                (result, cached), profile_name = await _run_pipeline(
+                    "summarize",
+                    _wants_profile(http_request),
+                    _memoized,
+                    session,
+                    ("summary", request.summary_type, request.model, request.mode),
+                    generate_summary,
+                    text,
+                    request.summary_type,
+                    request.model,
+                    request.mode
+                )
+        
+        store = get_store()
+        # Extractive results are cheap to recompute and aren't stored
+        if store is not None and request.transcript_id and not cached and request.mode == "llm":
+            store.save_summary(request.transcript_id, request.summary_type, text, result, request.model)
         
         return {
             "success": True,
             "summary_type": result['type'],
             "title": result['title'],
             "content": result['content'],
-            "model_used": request.model or "auto-selected"
+            "model_used": "extractive" if request.mode == "extractive" else request.model or "auto-selected",
+            "mode": request.mode,
+            "cached": cached,
+            "timings": timings,
+            "profile": profile_name
         }
     
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Summarization failed: {str(e)}"
         )
 
+
+class RefineRequest(BaseModel):
+    text: Optional[str] = None
+    transcript_id: Optional[str] = None
+    model: Optional[str] = None
+
+
+@app.post("/refine")
+async def refine(request: RefineRequest, http_request: Request):
+    """
+    Refine a transcript with an LLM (fix grammar, remove disfluencies).
+    
+    Parameters:
+    - transcript_id: Id returned by /transcribe (preferred)
+    - text: Text to refine, instead of transcript_id
+    - model: Optional AI model identifier (defaults to best available)
+    
+    Refinements requested by transcript_id are memoized per transcript and
+    model. If Ollama is unavailable the original text is returned unchanged
+    (and not memoized).
+    """
+    text, session = await _resolve_text(request.text, request.transcript_id)
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="No text to refine")
+    
+    try:
+        with collect_timings() as timings:
+            (refined, cached), profile_name = await _run_pipeline(
+                "refine",
+                _wants_profile(http_request),
+                _memoized,
+                session,
+                ("refine", request.model),
+                refine_with_llm,
+                text,
+                request.model,
+                should_cache=lambda value: value != text
+            )
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Refinement failed: {str(e)}")
+    
+    return {
+        "success": True,
+        "transcript_id": request.transcript_id,
+        "refined_text": refined,
+        "refined": refined != text,
+        "model_used": request.model or "auto-selected",
+        "cached": cached,
+        "timings": timings,
+        "profile": profile_name
+    }
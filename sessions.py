@@ -0,0 +1,120 @@
+"""
+Server-side transcript sessions.
+Keeps recent transcripts in memory under their transcript id for a limited
+time, so follow-up requests (summaries, refinement) send the id instead of
+the full text, and memoizes the results derived from each transcript.
+Expired sessions are reloaded from the transcript store when possible.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from segment_table import LazySegmentTable, SegmentTable
+
+SESSION_TTL_SECONDS = float(os.environ.get("DICTA_SESSION_TTL_SECONDS", "3600"))
+MAX_SESSIONS = int(os.environ.get("DICTA_MAX_SESSIONS", "256"))
+
+
+class Session:
+    """One transcript and the results derived from it."""
+
+    def __init__(self, transcript_id: str, text: str, ttl: float, segments: Optional[LazySegmentTable] = None):
+        self.transcript_id = transcript_id
+        self.text = text
+        self._segments = segments
+        self.expires_at = time.monotonic() + ttl
+        # key -> Future, so concurrent requests for the same result share one computation
+        self.derived: Dict[Hashable, Future] = {}
+
+    @property
+    def segments(self) -> Optional[SegmentTable]:
+        """The transcript's segments, built on first access."""
+        return self._segments.get() if self._segments is not None else None
+
+
+class SessionStore:
+    """
+    Thread-safe TTL + LRU map of transcript id to Session.
+    Every access extends the session's lifetime.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, transcript_id: str, text: str, segments: Optional[LazySegmentTable] = None) -> Session:
+        session = Session(transcript_id, text, self.ttl, segments)
+        with self._lock:
+            self._sessions[transcript_id] = session
+            self._sessions.move_to_end(transcript_id)
+            self._evict()
+        return session
+
+    def get(self, transcript_id: str) -> Optional[Session]:
+        """
+        Return a live session, reloading it from the transcript store if it
+        expired from memory. None if the id is unknown.
+        """
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(transcript_id)
+            if session is not None:
+                session.expires_at = time.monotonic() + self.ttl
+                self._sessions.move_to_end(transcript_id)
+                return session
+
+        from transcript_store import get_store
+        store = get_store()
+        stored = store.get_transcript(transcript_id) if store is not None else None
+        if stored is None:
+            return None
+        return self.create(transcript_id, stored["cleaned_text"], LazySegmentTable(stored["segments"]))
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[oldest.transcript_id]
+
+    def memoize(self, session: Session, key: Hashable, compute: Callable[[], Any],
+                should_cache: Callable[[Any], bool] = lambda value: True) -> Tuple[Any, bool]:
+        """
+        Return the result stored under key for this session, computing it on
+        first use. Failed computations (and results rejected by should_cache)
+        are not kept, so the next request tries again.
+
+        Returns:
+            Tuple of (result, whether it came from the memo)
+        """
+        with self._lock:
+            future = session.derived.get(key)
+            owner = future is None
+            if owner:
+                future = session.derived[key] = Future()
+
+        if not owner:
+            return future.result(), True
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                session.derived.pop(key, None)
+            future.set_exception(e)
+            raise
+        if not should_cache(value):
+            with self._lock:
+                session.derived.pop(key, None)
+        future.set_result(value)
+        return value, False
+
+
+sessions = SessionStore()
@@ -0,0 +1,155 @@
+"""
+Startup warm-up and readiness tracking.
+Loads and warms the Whisper model and the preferred Ollama model in a
+background thread once the server is accepting connections, and records
+how long each startup phase took.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger("dicta.startup")
+
+WARMUP_ENABLED = os.environ.get("DICTA_WARMUP", "true").lower() in ("true", "1", "yes")
+READY_REQUIRES_OLLAMA = os.environ.get("DICTA_READY_REQUIRES_OLLAMA", "true").lower() in ("true", "1", "yes")
+WARMUP_RETRY_SECONDS = float(os.environ.get("DICTA_WARMUP_RETRY_SECONDS", "15"))
+OLLAMA_KEEP_ALIVE = os.environ.get("DICTA_OLLAMA_KEEP_ALIVE", "30m")
+
+
+class Readiness:
+    """Thread-safe record of startup phases and component readiness."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases: Dict[str, Dict] = {}
+        self.components: Dict[str, Dict] = {
+            "whisper": {"ready": False, "error": None},
+            "ollama": {"ready": False, "error": None, "model": None}
+        }
+
+    def record_phase(self, name: str, seconds: float, ok: bool = True, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.phases[name] = {"seconds": round(seconds, 3), "ok": ok, "error": error}
+
+    def set_component(self, name: str, ready: bool, error: Optional[str] = None, **extra) -> None:
+        with self._lock:
+            self.components[name].update(ready=ready, error=error, **extra)
+
+    def is_component_ready(self, name: str) -> bool:
+        with self._lock:
+            return self.components[name]["ready"]
+
+    def is_ready(self) -> bool:
+        """
+        Ready when Whisper is warm and (if required) the preferred Ollama model
+        is loaded. With warm-up disabled there is nothing to wait for.
+        """
+        if not WARMUP_ENABLED:
+            return True
+        with self._lock:
+            whisper_ready = self.components["whisper"]["ready"]
+            ollama_ready = self.components["ollama"]["ready"] or not READY_REQUIRES_OLLAMA
+            return whisper_ready and ollama_ready
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "components": {name: dict(state) for name, state in self.components.items()},
+                "phases": {name: dict(phase) for name, phase in self.phases.items()}
+            }
+
+
+readiness = Readiness()
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    """Time a startup phase, log it and record it in the readiness state."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        elapsed = time.perf_counter() - start
+        readiness.record_phase(name, elapsed, ok=False, error=str(e))
+        logger.warning("Startup phase %s failed after %.3fs: %s", name, elapsed, e)
+        raise
+    elapsed = time.perf_counter() - start
+    readiness.record_phase(name, elapsed)
+    logger.info("Startup phase %s took %.3fs", name, elapsed)
+
+
+def warm_whisper() -> None:
+    """Load the Whisper model and run one short decode so the first request is fast."""
+    import numpy as np
+    from transcriber import SAMPLE_RATE, run_whisper
+
+    with startup_phase("whisper_warmup"):
+        run_whisper(np.zeros(SAMPLE_RATE, dtype=np.float32))
+    readiness.set_component("whisper", True)
+
+
+def warm_ollama() -> None:
+    """Make sure Ollama is running and load the preferred model into memory."""
+    import requests
+    from ollama_checker import OLLAMA_URL, get_recommended_model
+    from ollama_starter import ensure_ollama_running
+
+    with startup_phase("ollama_start"):
+        status = ensure_ollama_running()
+        if not status["running"]:
+            raise RuntimeError(status["error"] or "Ollama is not running")
+
+    model = get_recommended_model(status["available_models"])
+    if not model:
+        raise RuntimeError("No Ollama models installed")
+
+    with startup_phase("ollama_model_load"):
+        # A generate call with an empty prompt loads the model without generating
+        response = requests.post(
+            f"{OLLAMA_URL}/api/generate",
+            json={"model": model, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=300
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama returned status code {response.status_code} loading {model}")
+    readiness.set_component("ollama", True, model=model)
+
+
+def _warmup_loop(stop: threading.Event) -> None:
+    tasks = {"whisper": warm_whisper}
+    if READY_REQUIRES_OLLAMA:
+        tasks["ollama"] = warm_ollama
+    while not stop.is_set():
+        for name, task in tasks.items():
+            if readiness.is_component_ready(name):
+                continue
+            try:
+                task()
+            except Exception as e:
+                readiness.set_component(name, False, error=str(e))
+
+        if all(readiness.is_component_ready(name) for name in tasks):
+            logger.info("Startup warm-up complete: ready to serve")
+            return
+        # Retry whatever failed (e.g. Ollama not installed yet)
+        stop.wait(WARMUP_RETRY_SECONDS)
+
+
+def start_warmup() -> Optional[threading.Event]:
+    """
+    Start warm-up in a daemon thread.
+
+    Returns:
+        Event that stops the retry loop when set, or None if warm-up is disabled
+    """
+    if not WARMUP_ENABLED:
+        logger.info("Startup warm-up disabled (DICTA_WARMUP=false); models load on first request")
+        return None
+
+    stop = threading.Event()
+    threading.Thread(target=_warmup_loop, args=(stop,), name="dicta-warmup", daemon=True).start()
+    return stop
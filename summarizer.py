@@ -1,10 +1,80 @@
 """
 Summarization module for generating executive summaries and extracting key ideas.
 Uses Ollama for AI-powered summarization.
+
+An extractive engine (TF-IDF + TextRank over sentences, vectorized with
+NumPy) returns key sentences instantly without Ollama, and can shrink the
+LLM prompts to the most salient sentences of long transcripts.
+
+Long transcripts are summarized incrementally: the text is split into
+content-defined units, each unit is summarized once (cached by its hash)
+and the final summary is written from the unit summaries. After an edit,
+only the units that changed go back to the model.
 """
 
-import requests
-from typing import Optional, List
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, List, Tuple
+
+import numpy as np
+
+from metrics import record_cache, record_ollama_attempt, record_fallback, track_stage
+from model_router import estimate_tokens, router
+from scheduler import Overloaded, scheduler
+from ollama_checker import OLLAMA_URL
+
+# Texts with at least this many words are summarized unit by unit
+INCREMENTAL_MIN_WORDS = int(os.environ.get("DICTA_INCREMENTAL_MIN_WORDS", "1200"))
+# Unit size bounds (words); between them a unit ends at a paragraph break or a cut point
+UNIT_MIN_WORDS = 150
+UNIT_MAX_WORDS = 600
+# About one sentence in CUT_DIVISOR is a cut point (~12 sentences of ~15 words past the minimum)
+CUT_DIVISOR = 12
+# Unit summaries kept in memory (keyed by unit hash and the model that wrote them)
+UNIT_CACHE_SIZE = int(os.environ.get("DICTA_UNIT_CACHE_SIZE", "4096"))
+
+# Word budget for single-prompt summaries: texts summarized in one prompt
+# (under INCREMENTAL_MIN_WORDS) that are longer than this are cut down to
+# their most salient sentences first. Unit summaries always see the whole
+# text, so their cache keeps working across edits (0 disables pre-selection)
+PROMPT_MAX_WORDS = int(os.environ.get("DICTA_PROMPT_MAX_WORDS", "0"))
+TEXTRANK_DAMPING = 0.85
+# Sentences more similar than this to an already chosen one are skipped
+DUPLICATE_SIMILARITY = 0.8
+
+SPANISH_STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes aquel aquella aquellas aquello aquellos aqui aquí así asi aun aunque bien
+cada casi como cómo con contra cual cuales cuando cuándo cuanto de del desde donde dónde dos el él ella ellas
+ello ellos en entre era eran eres es esa esas ese eso esos esta está estaba estaban estamos estan están estar
+estas este esto estos estoy fue fueron fui ha habia había han has hasta hay he hemos la las le les lo los mas
+más me mi mí mis mucho muchos muy nada ni no nos nosotros nuestra nuestro o os otra otras otro otros para pero
+poco por porque pues que qué quien quién se sea ser si sí sido sin sobre solo sólo son su sus también tambien
+tan tanto te tengo tiene tienen todo todos tu tú tus un una uno unos usted ustedes va vamos van ya yo bueno
+entonces o sea vale claro digamos tipo hacer hace hacemos puede pueden creo dice decir cosa cosas vez veces
+""".split())
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?…])\s+')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+_unit_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_unit_cache_lock = threading.Lock()
+
+# Model names in quality order (prioritize text-focused models)
+SUMMARY_MODELS = [
+    "qwen2.5:7b-instruct",      # Best for text tasks
+    "qwen2.5:7b",
+    "llama3.1:8b",
+    "mistral:7b",
+    "phi3.5:mini-instruct",
+    "llama3.2:3b-instruct",
+    "llama3.2:1b-instruct"      # Fastest, for huge inputs or a busy Ollama
+]
 
 
 def generate_executive_summary(text: str, model: Optional[str] = None) -> str:
@@ -21,6 +91,7 @@ def generate_executive_summary(text: str, model: Optional[str] = None) -> str:
     if not text or len(text.strip()) < 50:
         return "Text is too short to generate a summary."
     
+    label, source = _prompt_source(text, model)
     prompt = f"""You are an expert at creating executive summaries. 
 
 Create a concise executive summary of the following transcription in Spanish.
@@ -32,8 +103,8 @@ Requirements:
 - Focus on the most important information
 - Maintain the original meaning and context
 
-Transcription:
-{text}
+{label}:
+{source}
 
 Executive Summary:"""
 
@@ -58,6 +129,7 @@ def extract_key_ideas(text: str, num_ideas: int = 10, model: Optional[str] = Non
     if num_ideas not in [3, 5, 10]:
         num_ideas = 10  # Default to 10
     
+    label, source = _prompt_source(text, model)
     prompt = f"""You are an expert at extracting key ideas from transcriptions.
 
 Extract the top {num_ideas} most important ideas from the following transcription in Spanish.
@@ -70,13 +142,13 @@ Requirements:
 - Number each idea
 - Be specific and concrete
 
-Transcription:
-{text}
+{label}:
+{source}
 
 Top {num_ideas} Ideas:
 1."""
 
-    result = _call_ollama(prompt, model)
+    result = _call_ollama(prompt, model, output_tokens=40 * num_ideas)
     
     # Parse the response into a list of ideas
     ideas = []
@@ -109,67 +181,301 @@ Top {num_ideas} Ideas:
     return ideas[:num_ideas]
 
 
-def _call_ollama(prompt: str, model: Optional[str] = None) -> str:
+def split_sentences(text: str) -> List[str]:
+    """Split text after sentence-ending punctuation."""
+    return [sentence for sentence in _SENTENCE_BREAK.split(text.strip()) if sentence]
+
+
+def _is_cut_point(sentence: str) -> bool:
+    digest = hashlib.sha1(sentence.strip().lower().encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % CUT_DIVISOR == 0
+
+
+def split_units(text: str) -> List[str]:
+    """
+    Split text into stable summarization units.
+    
+    Units end at paragraph breaks, or inside long paragraphs (e.g. a
+    transcript with no line breaks) at sentences whose hash marks a cut
+    point. Because cut points depend only on the sentence itself, an edit
+    changes the unit it falls in (and at most its neighbour), while every
+    other unit keeps the same text and hash.
+    
+    Returns:
+        List of unit texts of roughly UNIT_MIN_WORDS to UNIT_MAX_WORDS words
+        (a unit ends after the sentence that reaches the bound)
+    """
+    units = []
+    paragraphs: List[List[str]] = [[]]
+    words = 0
+    
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        sentences = split_sentences(paragraph)
+        for i, sentence in enumerate(sentences):
+            paragraphs[-1].append(sentence)
+            words += len(sentence.split())
+            paragraph_end = i == len(sentences) - 1
+            if words >= UNIT_MAX_WORDS or (words >= UNIT_MIN_WORDS and (paragraph_end or _is_cut_point(sentence))):
+                units.append("\n\n".join(" ".join(p) for p in paragraphs if p))
+                paragraphs = [[]]
+                words = 0
+            elif paragraph_end:
+                paragraphs.append([])
+    
+    if words:
+        units.append("\n\n".join(" ".join(p) for p in paragraphs if p))
+    return units
+
+
+def _summarize_unit(unit: str, model: str) -> str:
+    """
+    Summarize one unit with the given model, reusing the cached summary if
+    that model already summarized the unit. Summaries are cached under the
+    model that actually wrote them (a fallback model if the given one failed).
+    """
+    digest = hashlib.sha256(unit.encode("utf-8")).hexdigest()
+    with _unit_cache_lock:
+        cached = _unit_cache.get((digest, model))
+        if cached is not None:
+            _unit_cache.move_to_end((digest, model))
+    record_cache("summary_unit", cached is not None)
+    if cached is not None:
+        return cached
+    
+    prompt = f"""Summarize the following part of a longer transcription in Spanish.
+
+Requirements:
+- Keep every important point, decision, name and figure
+- Use at most a third of the original length
+- Do not add information that isn't in the text
+- Write only the summary
+
+Part of the transcription:
+{unit}
+
+Summary:"""
+    summary, used_model = _generate(prompt, model, output_tokens=estimate_tokens(unit) // 3)
+    
+    with _unit_cache_lock:
+        _unit_cache[(digest, used_model)] = summary
+        while len(_unit_cache) > UNIT_CACHE_SIZE:
+            _unit_cache.popitem(last=False)
+    return summary
+
+
+def _prompt_source(text: str, model: Optional[str]) -> Tuple[str, str]:
+    """
+    Choose what goes into a summary prompt: the text itself (cut down to
+    its salient sentences past DICTA_PROMPT_MAX_WORDS), or for long
+    texts the per-unit summaries (only changed units are re-summarized).
+    
+    Returns:
+        Tuple of (prompt label, text for the prompt)
+    """
+    words = len(text.split())
+    if words < INCREMENTAL_MIN_WORDS:
+        if PROMPT_MAX_WORDS and words > PROMPT_MAX_WORDS:
+            return "Most relevant passages of the transcription", select_salient_text(text, PROMPT_MAX_WORDS)
+        return "Transcription", text
+    
+    units = split_units(text)
+    if model is None:
+        # Summarize every unit with one model, so cached and fresh partial
+        # summaries come from the same model
+        longest = max(units, key=len)
+        routed = router.order(SUMMARY_MODELS, longest, estimate_tokens(longest) // 3)
+        model = routed[0] if routed else SUMMARY_MODELS[0]
+    
+    with track_stage("summarize_units"):
+        partials = [_summarize_unit(unit, model) for unit in units]
+    return "Summaries of consecutive parts of the transcription", "\n\n".join(partials)
+
+
+def rank_sentences(sentences: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score sentences with TextRank over TF-IDF cosine similarity.
+    
+    Stopwords, words under 3 letters and words found in a single sentence
+    (which can't link sentences) are left out of the vocabulary.
+    
+    Returns:
+        Tuple of (score per sentence, L2-normalized TF-IDF matrix)
+    """
+    n = len(sentences)
+    rows, terms = [], []
+    for i, sentence in enumerate(sentences):
+        for word in _WORD.findall(sentence.lower()):
+            if len(word) > 2 and word not in SPANISH_STOPWORDS:
+                rows.append(i)
+                terms.append(word)
+    if n == 0 or not terms:
+        return np.zeros(n), np.zeros((n, 0), dtype=np.float32)
+    
+    vocabulary, cols = np.unique(np.array(terms), return_inverse=True)
+    tf = np.zeros((n, len(vocabulary)), dtype=np.float32)
+    np.add.at(tf, (np.array(rows), cols), 1.0)
+    
+    df = np.count_nonzero(tf, axis=0)
+    tf = tf[:, df > 1]
+    df = df[df > 1]
+    tfidf = tf * (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+    norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+    tfidf /= np.where(norms == 0, 1, norms)
+    
+    similarity = tfidf @ tfidf.T
+    np.fill_diagonal(similarity, 0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    transition = similarity / np.where(out_weight == 0, 1, out_weight)
+    
+    scores = np.full(n, 1.0 / n)
+    for _ in range(100):
+        updated = (1 - TEXTRANK_DAMPING) / n + TEXTRANK_DAMPING * (transition.T @ scores)
+        converged = np.abs(updated - scores).sum() < 1e-6
+        scores = updated
+        if converged:
+            break
+    return scores, tfidf
+
+
+def _select_sentences(sentences: List[str], scores: np.ndarray, tfidf: np.ndarray,
+                      max_sentences: Optional[int] = None, max_words: Optional[int] = None) -> List[int]:
+    """
+    Pick the best-scoring sentences (skipping near-duplicates, e.g. repeated
+    hallucinated lines) until a sentence or word budget is reached.
+    
+    Returns:
+        Indices of the chosen sentences, best first
+    """
+    chosen: List[int] = []
+    words = 0
+    for index in np.argsort(-scores, kind="stable"):
+        if max_sentences is not None and len(chosen) >= max_sentences:
+            break
+        sentence_words = len(sentences[index].split())
+        if sentence_words < 4:
+            continue
+        if max_words is not None and words + sentence_words > max_words:
+            continue
+        if chosen and tfidf.shape[1] and float(np.max(tfidf[chosen] @ tfidf[index])) > DUPLICATE_SIMILARITY:
+            continue
+        chosen.append(int(index))
+        words += sentence_words
+    return chosen
+
+
+def extract_key_sentences(text: str, num_sentences: int = 5) -> List[str]:
+    """
+    Return the most central sentences of the text, best first, without an LLM.
+    
+    Args:
+        text: The cleaned/refined transcription text
+        num_sentences: Number of sentences to return
+    
+    Returns:
+        List of sentences
+    """
+    with track_stage("extractive_rank"):
+        sentences = split_sentences(text)
+        scores, tfidf = rank_sentences(sentences)
+        return [sentences[i] for i in _select_sentences(sentences, scores, tfidf, max_sentences=num_sentences)]
+
+
+def select_salient_text(text: str, max_words: int) -> str:
+    """
+    Cut text down to about max_words words by keeping its most salient
+    sentences, in their original order.
+    """
+    with track_stage("extractive_rank"):
+        sentences = split_sentences(text)
+        scores, tfidf = rank_sentences(sentences)
+        chosen = _select_sentences(sentences, scores, tfidf, max_words=max_words)
+        return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def _call_ollama(prompt: str, model: Optional[str] = None, output_tokens: int = 400) -> str:
+    """Generate text with Ollama (see _generate) and return just the text."""
+    return _generate(prompt, model, output_tokens)[0]
+
+
+def _generate(prompt: str, model: Optional[str] = None, output_tokens: int = 400) -> Tuple[str, str]:
     """
     Call Ollama API to generate text using the specified model.
     
+    Without an explicit model, the best-quality model predicted to answer
+    within the latency target is tried first (see model_router).
+    
     Args:
         prompt: The prompt to send to the model
         model: Optional model name (defaults to available models)
+        output_tokens: Expected answer length, used to predict latency
     
     Returns:
-        Generated text response
+        Tuple of (generated text, model that generated it)
     """
     try:
         import requests
     except ImportError:
         raise ImportError("requests library is required. Install it with: pip install requests")
     
-    # Try available models in order of preference
-    models_to_try = []
-    if model:
-        models_to_try.append(model)
-    
-    # Add model names to try (prioritize text-focused models)
-    models_to_try.extend([
-        "qwen2.5:7b-instruct",      # Best for text tasks
-        "qwen2.5:7b",
-        "llama3.1:8b",
-        "mistral:7b",
-        "phi3.5:mini-instruct",
-        "llama3.2:3b-instruct"
-    ])
+    models_to_try = router.route("summarize", SUMMARY_MODELS, prompt, output_tokens, requested=model)
     
-    ollama_url = "http://localhost:11434/api/generate"
+    ollama_url = f"{OLLAMA_URL}/api/generate"
     
-    for model_name in models_to_try:
+    for attempt, model_name in enumerate(models_to_try):
+        if attempt > 0:
+            record_fallback("summarize", model_name)
+        
+        start = time.perf_counter()
+        outcome = "error"
         try:
-            response = requests.post(
-                ollama_url,
-                json={
-                    "model": model_name,
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=180  # Longer timeout for summarization
-            )
+            # Wait for this model by priority class; Overloaded propagates (HTTP 429)
+            with scheduler.slot(f"ollama:{model_name}"), router.track():
+                response = requests.post(
+                    ollama_url,
+                    json={
+                        "model": model_name,
+                        "prompt": prompt,
+                        "stream": False
+                    },
+                    timeout=180  # Longer timeout for summarization
+                )
             
+            outcome = "http_error"
             if response.status_code == 200:
-                result = response.json().get("response", "")
+                data = response.json()
+                router.record(model_name, data)
+                result = data.get("response", "")
+                outcome = "success" if result else "empty"
                 if result:
-                    return result.strip()
+                    return result.strip(), model_name
+        except Overloaded:
+            outcome = "shed"
+            raise
         except requests.exceptions.ConnectionError:
+            outcome = "connection_error"
             raise ConnectionError("Cannot connect to Ollama. Make sure it's running: ollama serve")
         except requests.exceptions.Timeout:
+            outcome = "timeout"
             continue  # Try next model
         except Exception:
+            outcome = "error"
             continue  # Try next model
+        finally:
+            record_ollama_attempt("summarize", model_name, outcome, time.perf_counter() - start)
     
     # If all models failed
     raise Exception("Failed to generate summary. Make sure Ollama is running and models are available.")
 
 
-def generate_summary(text: str, summary_type: str, model: Optional[str] = None) -> dict:
+SUMMARY_TITLES = {
+    'executive': 'Executive Summary',
+    'top3': 'Top 3 Ideas',
+    'top5': 'Top 5 Ideas',
+    'top10': 'Top 10 Ideas'
+}
+
+
+def generate_summary(text: str, summary_type: str, model: Optional[str] = None, mode: str = "llm") -> dict:
     """
     Generate the requested type of summary.
     
@@ -177,10 +483,32 @@ def generate_summary(text: str, summary_type: str, model: Optional[str] = None)
         text: The cleaned/refined transcription text
         summary_type: Type of summary ('executive', 'top3', 'top5', 'top10')
         model: Optional model name
+        mode: 'llm' (Ollama) or 'extractive' (key sentences from the text,
+              in milliseconds and without Ollama)
     
     Returns:
         Dictionary with summary data
     """
+    if summary_type not in SUMMARY_TITLES:
+        raise ValueError(f"Unknown summary type: {summary_type}")
+    if mode not in ("llm", "extractive"):
+        raise ValueError(f"Unknown summary mode: {mode}")
+    
+    if mode == "extractive":
+        if summary_type == 'executive':
+            # The five key sentences in reading order form a short abstract
+            sentences = extract_key_sentences(text, 5)
+            order = {sentence: i for i, sentence in enumerate(split_sentences(text))}
+            content = " ".join(sorted(sentences, key=order.get))
+        else:
+            content = extract_key_sentences(text, int(summary_type[3:]))
+        return {
+            'type': summary_type,
+            'title': SUMMARY_TITLES[summary_type],
+            'content': content,
+            'mode': 'extractive'
+        }
+    
     if summary_type == 'executive':
         summary_text = generate_executive_summary(text, model)
         return {
@@ -1,73 +1,205 @@
 """
 Text cleaning and post-processing module for transcriptions.
 Removes repetitions, fixes formatting, and optionally uses AI for refinement.
+Texts are tokenized and normalized once into a TokenTable that the
+cleaning stages share.
 """
 
 import re
-from typing import Optional, List, Tuple
+import time
+from typing import Dict, Optional, List, Tuple
 
+import numpy as np
 
-def remove_repetitions(text: str, min_repeat_length: int = 10) -> str:
+from metrics import track_stage, record_ollama_attempt, record_fallback
+from model_router import estimate_tokens, router
+from scheduler import Overloaded, scheduler
+from ollama_checker import OLLAMA_URL
+
+
+# Whitespace-delimited token (same whitespace as str.split)
+_TOKEN = re.compile(r'\S+')
+# Removed when normalizing tokens for comparison
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_SPACES = re.compile(r' +')
+_SPACE_BEFORE_END = re.compile(r'\s+([\.\?!])')
+_SENTENCE_END = re.compile(r'([\.\?!]\s+)')
+
+# Longest repeated sequence remove_repetitions looks for (in words)
+MAX_REPEAT_WORDS = 50
+
+
+class Vocabulary:
     """
-    Remove repetitive phrases from text.
-    Detects and removes repeated sequences of words.
+    Normalized token forms (lowercase, punctuation removed) and their
+    integer ids. Each distinct token is normalized once.
     """
-    words = text.split()
-    if len(words) < min_repeat_length:
-        return text
     
-    # Look for repeated sequences
-    result_words = []
-    i = 0
+    def __init__(self):
+        self.forms: List[str] = []
+        self._form_ids: Dict[str, int] = {}
+        self._token_ids: Dict[str, int] = {}
     
-    while i < len(words):
-        # Try to find a repeating pattern starting at position i
-        found_repetition = False
-        
-        # Check sequences of different lengths (longer first for better detection)
-        for seq_len in range(min(50, len(words) - i), min_repeat_length - 1, -1):
-            if i + seq_len * 2 > len(words):
-                continue
-                
-            sequence = words[i:i+seq_len]
-            sequence_text = " ".join(sequence)
-            
-            # Check if this sequence repeats immediately after
-            next_sequence = words[i+seq_len:i+seq_len*2]
-            next_sequence_text = " ".join(next_sequence)
-            
-            # Normalize for comparison (lowercase, remove punctuation)
-            seq_normalized = re.sub(r'[^\w\s]', '', sequence_text.lower())
-            next_normalized = re.sub(r'[^\w\s]', '', next_sequence_text.lower())
-            
-            if seq_normalized == next_normalized and len(seq_normalized) > min_repeat_length:
-                # Found repetition - count how many times it repeats
-                repeat_count = 1
-                check_pos = i + seq_len
-                
-                while check_pos + seq_len <= len(words):
-                    check_seq = words[check_pos:check_pos+seq_len]
-                    check_seq_text = " ".join(check_seq)
-                    check_normalized = re.sub(r'[^\w\s]', '', check_seq_text.lower())
-                    
-                    if check_normalized == seq_normalized:
-                        repeat_count += 1
-                        check_pos += seq_len
-                    else:
-                        break
-                
-                # Keep only one instance if repeated more than once
-                if repeat_count > 1:
-                    result_words.extend(sequence)
-                    i += seq_len * repeat_count
-                    found_repetition = True
-                    break
-        
-        if not found_repetition:
-            result_words.append(words[i])
-            i += 1
+    def ids(self, tokens: List[str]) -> np.ndarray:
+        token_ids = self._token_ids
+        for token in set(tokens).difference(token_ids):
+            form = _PUNCTUATION.sub('', token.lower())
+            token_ids[token] = self._form_ids.setdefault(form, len(self._form_ids))
+            if token_ids[token] == len(self.forms):
+                self.forms.append(form)
+        return np.fromiter(map(token_ids.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    
+    def lengths(self) -> np.ndarray:
+        """Length of every normalized form, indexed by id."""
+        return np.fromiter(map(len, self.forms), dtype=np.int64, count=len(self.forms))
+
+
+class TokenTable:
+    """
+    A text split into whitespace-delimited tokens, each with its character
+    span, normalized form id and normalized length. Built once per text
+    and shared by the cleaning stages.
+    """
+    
+    def __init__(self, text: str, tokens: List[str], ids: np.ndarray, vocabulary: Vocabulary,
+                 single_spaced: bool = False):
+        self.text = text
+        self.tokens = tokens
+        self.ids = ids
+        self.vocabulary = vocabulary
+        # Tokens separated by exactly one space (spans follow from token lengths)
+        self.single_spaced = single_spaced
+        self._spans: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    
+    def __len__(self) -> int:
+        return len(self.tokens)
+    
+    @property
+    def spans(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(starts, ends): character span of every token in text."""
+        if self._spans is None:
+            if self.single_spaced:
+                sizes = np.fromiter(map(len, self.tokens), dtype=np.int64, count=len(self.tokens))
+                ends = np.cumsum(sizes + 1) - 1
+                starts = ends - sizes
+            else:
+                bounds = np.array([m.span() for m in _TOKEN.finditer(self.text)], dtype=np.int64).reshape(-1, 2)
+                starts, ends = bounds[:, 0], bounds[:, 1]
+            self._spans = (starts, ends)
+        return self._spans
+    
+    def lengths(self) -> np.ndarray:
+        """Length of every token's normalized form."""
+        return self.vocabulary.lengths()[self.ids] if len(self) else np.zeros(0, dtype=np.int64)
+    
+    def select(self, keep: List[int]) -> "TokenTable":
+        """The kept tokens joined with single spaces, reusing their ids."""
+        tokens = [self.tokens[i] for i in keep]
+        return TokenTable(" ".join(tokens), tokens, self.ids[keep], self.vocabulary, single_spaced=True)
+    
+    def normalized(self, first: int, last: int, single_spaced: bool = False) -> str:
+        """
+        Normalized text of tokens first..last-1 with the original whitespace
+        between them, stripped: the same as re.sub(r'[^\w\s]', '', s.lower()).strip()
+        on that stretch of text. single_spaced says the stretch has exactly
+        one space between tokens (no spans needed).
+        """
+        forms = self.vocabulary.forms
+        ids = self.ids[first:last].tolist()
+        while ids and not forms[ids[-1]]:
+            ids.pop()
+            last -= 1
+        skip = 0
+        while skip < len(ids) and not forms[ids[skip]]:
+            skip += 1
+        first += skip
+        ids = ids[skip:]
+        if single_spaced or self.single_spaced:
+            return " ".join(map(forms.__getitem__, ids))
+        starts, ends = self.spans
+        gaps = [self.text[a:b] for a, b in zip(ends[first:last - 1].tolist(), starts[first + 1:last].tolist())]
+        return "".join(forms[i] + gap for i, gap in zip(ids, gaps + [""]))
+
+
+def tokenize(text: str, vocabulary: Optional[Vocabulary] = None) -> TokenTable:
+    """Split a text into a token table (with a fresh vocabulary unless one is given)."""
+    vocabulary = vocabulary or Vocabulary()
+    tokens = text.split()
+    return TokenTable(text, tokens, vocabulary.ids(tokens), vocabulary)
+
+
+def tokenize_batch(texts: List[str]) -> List[TokenTable]:
+    """
+    Tokenize many texts in one pass with a shared vocabulary, so tokens
+    common to the batch are normalized once.
+    """
+    vocabulary = Vocabulary()
+    token_lists = [text.split() for text in texts]
+    ids = vocabulary.ids([token for tokens in token_lists for token in tokens])
+    bounds = np.cumsum([0] + [len(tokens) for tokens in token_lists])
+    return [
+        TokenTable(text, tokens, ids[bounds[i]:bounds[i + 1]], vocabulary)
+        for i, (text, tokens) in enumerate(zip(texts, token_lists))
+    ]
+
+
+def _longest_repeats(table: TokenTable, min_repeat_length: int) -> np.ndarray:
+    """
+    For every token position i, the longest sequence length L (up to
+    MAX_REPEAT_WORDS) whose words repeat immediately after it, i.e.
+    normalized tokens i..i+L-1 equal i+L..i+2L-1 and the normalized
+    sequence is longer than min_repeat_length characters; 0 if none.
+    """
+    ids = table.ids
+    n = len(ids)
+    longest = np.zeros(n, dtype=np.int64)
+    # Normalized characters before each position
+    chars = np.concatenate(([0], np.cumsum(table.lengths())))
+    
+    # Ascending, so longer sequences overwrite shorter ones
+    for length in range(max(min_repeat_length, 1), min(MAX_REPEAT_WORDS, n // 2) + 1):
+        # same[k]: token k equals token k + length
+        same = np.concatenate(([0], np.cumsum(ids[:-length] == ids[length:])))
+        positions = n - 2 * length + 1
+        repeated = same[length:length + positions] - same[:positions] == length
+        # Joined with spaces, as the sequences used to be compared
+        long_enough = chars[length:length + positions] - chars[:positions] + length - 1 > min_repeat_length
+        longest[:positions][repeated & long_enough] = length
+    return longest
+
+
+def _remove_repetitions(table: TokenTable, min_repeat_length: int) -> TokenTable:
+    n = len(table)
+    if n < min_repeat_length:
+        return table
     
-    return " ".join(result_words)
+    longest = _longest_repeats(table, min_repeat_length).tolist()
+    ids = table.ids.tolist()
+    kept: List[int] = []
+    i = 0
+    while i < n:
+        length = longest[i]
+        if not length:
+            kept.append(i)
+            i += 1
+            continue
+        # Keep one instance of a sequence repeated back to back
+        sequence = ids[i:i + length]
+        end = i + 2 * length
+        while end + length <= n and ids[end:end + length] == sequence:
+            end += length
+        kept.extend(range(i, i + length))
+        i = end
+    return table.select(kept)
+
+
+def remove_repetitions(text: str, min_repeat_length: int = 10) -> str:
+    """
+    Remove repetitive phrases from text.
+    Detects and removes repeated sequences of words.
+    """
+    return _remove_repetitions(tokenize(text), min_repeat_length).text
 
 
 def clean_fragmented_sentences(text: str) -> str:
@@ -75,14 +207,14 @@ def clean_fragmented_sentences(text: str) -> str:
     Clean up fragmented sentences and improve formatting.
     """
     # Remove excessive line breaks and spaces
-    text = re.sub(r'\n\s*\n+', '\n\n', text)
-    text = re.sub(r' +', ' ', text)
+    text = _BLANK_LINES.sub('\n\n', text)
+    text = _SPACES.sub(' ', text)
     
     # Fix sentence endings
-    text = re.sub(r'\s+([\.\?!])', r'\1', text)
+    text = _SPACE_BEFORE_END.sub(r'\1', text)
     
     # Capitalize sentences
-    sentences = re.split(r'([\.\?!]\s+)', text)
+    sentences = _SENTENCE_END.split(text)
     result = []
     
     for i, part in enumerate(sentences):
@@ -96,22 +228,24 @@ def clean_fragmented_sentences(text: str) -> str:
     return ''.join(result).strip()
 
 
-def remove_short_repeats(text: str) -> str:
-    """
-    Remove short repeated phrases (like "es de la cartería" repeated many times).
-    """
-    lines = text.split('\n')
+def _remove_short_repeats(table: TokenTable) -> str:
+    lines = table.text.split('\n')
+    # Token range of every line
+    line_words = [line.split() for line in lines]
+    bounds = np.cumsum([0] + [len(words) for words in line_words]).tolist()
     cleaned_lines = []
     seen_phrases = {}
     
-    for line in lines:
+    for index, line in enumerate(lines):
         line = line.strip()
         if not line:
             cleaned_lines.append('')
             continue
         
         # Normalize line for comparison
-        normalized = re.sub(r'[^\w\s]', '', line.lower()).strip()
+        words = line_words[index]
+        single_spaced = line.count(' ') == len(words) - 1 and len(line) == sum(map(len, words)) + len(words) - 1
+        normalized = table.normalized(bounds[index], bounds[index + 1], single_spaced)
         
         # Skip if this phrase appeared recently (within last 3 lines)
         if normalized in seen_phrases:
@@ -133,6 +267,29 @@ def remove_short_repeats(text: str) -> str:
     return '\n'.join(cleaned_lines)
 
 
+def remove_short_repeats(text: str) -> str:
+    """
+    Remove short repeated phrases (like "es de la cartería" repeated many times).
+    """
+    return _remove_short_repeats(tokenize(text))
+
+
+def _clean_table(table: TokenTable, aggressive: bool) -> str:
+    # Step 1: Remove obvious repetitions
+    with track_stage("clean_remove_repetitions"):
+        table = _remove_repetitions(table, min_repeat_length=8 if aggressive else 15)
+    
+    # Step 2: Remove short repeated phrases (reusing step 1's tokens)
+    with track_stage("clean_remove_short_repeats"):
+        cleaned = _remove_short_repeats(table)
+    
+    # Step 3: Clean up formatting
+    with track_stage("clean_fragmented_sentences"):
+        cleaned = clean_fragmented_sentences(cleaned)
+    
+    return cleaned
+
+
 def clean_text(text: str, aggressive: bool = True) -> str:
     """
     Apply all cleaning methods to improve text quality.
@@ -147,16 +304,19 @@ def clean_text(text: str, aggressive: bool = True) -> str:
     if not text:
         return text
     
-    # Step 1: Remove obvious repetitions
-    cleaned = remove_repetitions(text, min_repeat_length=8 if aggressive else 15)
-    
-    # Step 2: Remove short repeated phrases
-    cleaned = remove_short_repeats(cleaned)
-    
-    # Step 3: Clean up formatting
-    cleaned = clean_fragmented_sentences(cleaned)
-    
-    return cleaned
+    with track_stage("clean_tokenize"):
+        table = tokenize(text)
+    return _clean_table(table, aggressive)
+
+
+def clean_texts(texts: List[str], aggressive: bool = True) -> List[str]:
+    """
+    Clean many texts, tokenizing and normalizing them together in one pass.
+    Same results as clean_text() on each.
+    """
+    with track_stage("clean_tokenize"):
+        tables = tokenize_batch(texts)
+    return [_clean_table(table, aggressive) if text else text for text, table in zip(texts, tables)]
 
 
 def refine_with_llm(text: str, model: Optional[str] = None) -> str:
@@ -194,14 +354,9 @@ Cleaned and improved text:"""
     except ImportError:
         raise ImportError("requests library is required for AI refinement. Install it with: pip install requests")
     
-    # Try available models in order of preference
-    models_to_try = []
-    if model:
-        models_to_try.append(model)
-    
-    # Add model names to try, ordered by best performance for text refinement
+    # Model names ordered by best performance for text refinement
     # Priority: Models optimized for text editing/refinement tasks
-    models_to_try.extend([
+    models_by_quality = [
         "qwen2.5:7b-instruct",      # Best for text refinement - optimized for concise, accurate outputs
         "qwen2.5:7b",                # Alternative Qwen variant
         "phi3.5:mini-instruct",      # Fast and good for text refinement
@@ -211,24 +366,38 @@ Cleaned and improved text:"""
         "mistral:7b",                # Your current model (fallback)
         "llama3.2:3b",               # Fallback variants
         "llama3.2:1b"
-    ])
+    ]
+    # The best model predicted to finish within the latency target goes first;
+    # the refined text is about as long as the input
+    models_to_try = router.route("refine", models_by_quality, prompt, estimate_tokens(text), requested=model)
     
-    ollama_url = "http://localhost:11434/api/generate"
+    ollama_url = f"{OLLAMA_URL}/api/generate"
     
-    for model_name in models_to_try:
+    for attempt, model_name in enumerate(models_to_try):
+        if attempt > 0:
+            record_fallback("refine", model_name)
+        
+        start = time.perf_counter()
+        outcome = "error"
         try:
-            response = requests.post(
-                ollama_url,
-                json={
-                    "model": model_name,
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=120
-            )
+            # Wait for this model by priority class; Overloaded propagates (HTTP 429)
+            with scheduler.slot(f"ollama:{model_name}"), router.track():
+                response = requests.post(
+                    ollama_url,
+                    json={
+                        "model": model_name,
+                        "prompt": prompt,
+                        "stream": False
+                    },
+                    timeout=120
+                )
             
+            outcome = "http_error"
             if response.status_code == 200:
-                result = response.json().get("response", "")
+                data = response.json()
+                router.record(model_name, data)
+                result = data.get("response", "")
+                outcome = "success" if result else "empty"
                 if result:
                     # Extract just the cleaned text (sometimes LLM adds extra text)
                     lines = result.split("\n")
@@ -247,14 +416,22 @@ Cleaned and improved text:"""
                     
                     # If no marker found, return the result (might be the cleaned text already)
                     return result.strip()
+        except Overloaded:
+            outcome = "shed"
+            raise
         except requests.exceptions.ConnectionError:
+            outcome = "connection_error"
             raise ConnectionError("Cannot connect to Ollama. Make sure it's running: ollama serve")
         except requests.exceptions.Timeout:
             # Try next model if this one times out
+            outcome = "timeout"
             continue
         except Exception as e:
             # Try next model if this one fails
+            outcome = "error"
             continue
+        finally:
+            record_ollama_attempt("refine", model_name, outcome, time.perf_counter() - start)
     
     # If all models failed, return original text
     return text
@@ -263,7 +440,8 @@ Cleaned and improved text:"""
 def process_transcription(
     text: str,
     use_ai_refinement: bool = False,
-    ai_model: Optional[str] = None
+    ai_model: Optional[str] = None,
+    cleaned: Optional[str] = None
 ) -> str:
     """
     Complete transcription processing pipeline.
@@ -272,17 +450,21 @@ def process_transcription(
         text: Raw transcription text
         use_ai_refinement: Whether to use AI for final refinement
         ai_model: AI model identifier (optional)
+        cleaned: clean_text(text) if already computed (e.g. by clean_texts for a batch)
     
     Returns:
         Processed text
     """
     # Step 1: Basic cleaning
-    cleaned = clean_text(text, aggressive=True)
+    if cleaned is None:
+        with track_stage("clean_text"):
+            cleaned = clean_text(text, aggressive=True)
     
     # Step 2: Optional AI refinement
     if use_ai_refinement:
         try:
-            cleaned = refine_with_llm(cleaned, model=ai_model)
+            with track_stage("refine_with_llm"):
+                cleaned = refine_with_llm(cleaned, model=ai_model)
         except Exception as e:
             print(f"AI refinement failed: {e}. Using cleaned text without AI.")
     
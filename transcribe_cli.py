@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Headless bulk transcription CLI.
+
+Walks directories, globs or file lists and runs the same pipeline as the
+/transcribe endpoint (transcriber.transcribe_file) across a worker pool,
+with the Whisper model loaded once per worker. Results are written
+incrementally to a JSONL file or to sidecar files next to each input, and a
+checkpoint manifest lets an interrupted run resume without redoing files.
+
+Usage:
+    python transcribe_cli.py ~/recordings --output results.jsonl
+    python transcribe_cli.py "archive/**/*.m4a" --sidecar --workers 2
+    python transcribe_cli.py ~/recordings --output results.jsonl   # resumes
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".aac", ".flac", ".ogg", ".opus", ".webm", ".mp4", ".mov")
+
+# Options shared with every worker (set by the pool initializer)
+_worker_options: Dict = {}
+
+
+def find_audio_files(inputs: List[str], extensions=AUDIO_EXTENSIONS) -> List[str]:
+    """
+    Expand files, directories (recursively) and glob patterns into a sorted,
+    de-duplicated list of audio files.
+    """
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                for name in names:
+                    if name.lower().endswith(extensions):
+                        found.add(os.path.abspath(os.path.join(root, name)))
+        elif os.path.isfile(item):
+            found.add(os.path.abspath(item))
+        else:
+            for path in glob.glob(os.path.expanduser(item), recursive=True):
+                if os.path.isfile(path) and path.lower().endswith(extensions):
+                    found.add(os.path.abspath(path))
+    return sorted(found)
+
+
+def _file_key(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def load_manifest(path: str) -> Dict[str, Dict]:
+    """
+    Read a checkpoint manifest (JSONL, one entry per finished file).
+    Later entries win, so a retried file's newest status is used.
+    A truncated last line (from an interrupted write) is ignored.
+    """
+    entries: Dict[str, Dict] = {}
+    if not os.path.exists(path):
+        return entries
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry["path"]] = entry
+    return entries
+
+
+def is_done(entry: Optional[Dict], key: Dict, retry_errors: bool) -> bool:
+    """A file is done if the manifest has it with the same size/mtime (and it succeeded)."""
+    if not entry or entry.get("size") != key["size"] or entry.get("mtime") != key["mtime"]:
+        return False
+    return entry.get("status") == "done" or (entry.get("status") == "error" and not retry_errors)
+
+
+def _init_worker(options: Dict) -> None:
+    """Pool initializer: load the model once for this worker process."""
+    global _worker_options
+    _worker_options = options
+
+    from scheduler import BATCH, set_request_class
+    from transcriber import get_backend, run_whisper, SAMPLE_RATE
+    import numpy as np
+
+    # Bulk work: an inference service shared with the server serves the UI first
+    set_request_class(BATCH, f"cli-{os.getpid()}")
+    backend = get_backend()
+    if not backend.is_model_loaded():
+        # One second of silence forces the model load up front
+        try:
+            run_whisper(np.zeros(SAMPLE_RATE, dtype=np.float32))
+        except Exception as e:
+            print(f"Worker {os.getpid()}: model warm-up failed: {e}", file=sys.stderr)
+
+
+def _process_file(path: str) -> Tuple[str, Dict]:
+    """Worker task: run the pipeline on one file and never raise."""
+    from transcriber import transcribe_file
+
+    start = time.perf_counter()
+    try:
+        result = transcribe_file(
+            path,
+            should_clean=_worker_options["clean"],
+            should_use_ai=_worker_options["ai_refinement"],
+            ai_model=_worker_options["ai_model"],
+            should_skip_silence=_worker_options["skip_silence"]
+        )
+        result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+        return path, result
+    except Exception as e:
+        return path, {"error": f"{type(e).__name__}: {e}", "elapsed_seconds": round(time.perf_counter() - start, 3)}
+
+
+class ResultWriter:
+    """Write results as JSONL lines or as .json/.txt sidecar files."""
+
+    def __init__(self, output: Optional[str], sidecar: bool, output_dir: Optional[str],
+                 base_dir: Optional[str], fields: Optional[str]):
+        from response_format import parse_fields
+
+        self.sidecar = sidecar
+        self.output_dir = output_dir
+        self.base_dir = base_dir
+        self.selection = parse_fields(fields)
+        self.jsonl = open(output, "a", encoding="utf-8") if output and not sidecar else None
+
+    def write(self, path: str, result: Dict) -> None:
+        from response_format import select_fields
+
+        record = dict(select_fields(result, self.selection) if "error" not in result else result)
+        record["path"] = path
+
+        if self.jsonl:
+            self.jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.jsonl.flush()
+            return
+
+        if "error" in result:
+            return
+        stem = os.path.splitext(self._sidecar_path(path))[0]
+        os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+        with open(stem + ".json", "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        with open(stem + ".txt", "w", encoding="utf-8") as f:
+            f.write(result.get("transcription", ""))
+
+    def _sidecar_path(self, path: str) -> str:
+        if not self.output_dir:
+            return path
+        relative = os.path.relpath(path, self.base_dir) if self.base_dir else os.path.basename(path)
+        return os.path.join(self.output_dir, relative)
+
+    def close(self) -> None:
+        if self.jsonl:
+            self.jsonl.close()
+
+
+def _format_duration(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}"
+
+
+def run(args) -> int:
+    files = find_audio_files(args.inputs)
+    if not files:
+        print("No audio files found.", file=sys.stderr)
+        return 1
+
+    manifest_path = args.manifest or (
+        f"{args.output}.manifest.jsonl" if args.output else os.path.join(args.output_dir or ".", "transcribe_manifest.jsonl")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    manifest = load_manifest(manifest_path)
+
+    todo = []
+    skipped = 0
+    for path in files:
+        key = _file_key(path)
+        if is_done(manifest.get(path), key, args.retry_errors):
+            skipped += 1
+        else:
+            todo.append((path, key))
+
+    print(f"{len(files)} files found, {skipped} already done, {len(todo)} to process "
+          f"({args.workers} worker{'s' if args.workers != 1 else ''})")
+    if not todo:
+        return 0
+
+    base_dir = os.path.commonpath(files) if args.output_dir and len(files) > 1 else None
+    writer = ResultWriter(args.output, args.sidecar, args.output_dir, base_dir, args.fields)
+    keys = dict(todo)
+    options = {
+        "clean": not args.no_clean,
+        "ai_refinement": args.ai_refinement,
+        "ai_model": args.ai_model,
+        "skip_silence": args.skip_silence
+    }
+
+    audio_seconds_total = 0.0
+    errors = 0
+    start = time.perf_counter()
+
+    # spawn: MLX state isn't fork-safe, and each worker should own its model
+    context = multiprocessing.get_context("spawn")
+    with open(manifest_path, "a", encoding="utf-8") as manifest_file, \
+            context.Pool(args.workers, initializer=_init_worker, initargs=(options,)) as pool:
+        try:
+            for done, (path, result) in enumerate(pool.imap_unordered(_process_file, keys), start=1):
+                writer.write(path, result)
+
+                entry = dict(keys[path])
+                if "error" in result:
+                    errors += 1
+                    entry.update(status="error", error=result["error"])
+                else:
+                    audio_seconds_total += result.get("audio_seconds", 0.0)
+                    entry.update(status="done", audio_seconds=result.get("audio_seconds"))
+                # Checkpoint only after the result is safely written
+                manifest_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                manifest_file.flush()
+
+                wall = time.perf_counter() - start
+                throughput = audio_seconds_total / wall if wall > 0 else 0.0
+                status = "ERROR " + result["error"] if "error" in result else \
+                    f"{result.get('audio_seconds', 0.0):.0f}s audio in {result['elapsed_seconds']:.1f}s"
+                print(f"[{done}/{len(todo)}] {os.path.basename(path)}: {status} | "
+                      f"{throughput:.1f} audio-h/wall-h", flush=True)
+        except KeyboardInterrupt:
+            pool.terminate()
+            print(f"\nInterrupted. Progress saved to {manifest_path}; run the same command to resume.")
+            writer.close()
+            return 130
+
+    writer.close()
+    wall = time.perf_counter() - start
+    throughput = audio_seconds_total / wall if wall > 0 else 0.0
+    print(f"\nDone: {len(todo) - errors} transcribed, {errors} failed, "
+          f"{_format_duration(audio_seconds_total)} of audio in {_format_duration(wall)} "
+          f"({throughput:.1f} audio-hours per wall-hour)")
+    return 1 if errors else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk-transcribe audio files without the web UI")
+    parser.add_argument("inputs", nargs="+", help="Audio files, directories (searched recursively) or glob patterns")
+    parser.add_argument("--output", "-o", help="JSONL file to append results to")
+    parser.add_argument("--sidecar", action="store_true",
+                        help="Write <name>.json and <name>.txt next to each file instead of JSONL")
+    parser.add_argument("--output-dir", help="With --sidecar, write sidecars here (mirroring the input tree)")
+    parser.add_argument("--manifest", help="Checkpoint manifest path (default: <output>.manifest.jsonl)")
+    parser.add_argument("--workers", "-w", type=int, default=1,
+                        help="Worker processes, each with its own model (default: 1)")
+    parser.add_argument("--fields", help="Fields to keep, as in /transcribe (e.g. transcription,segments.start)")
+    parser.add_argument("--no-clean", action="store_true", help="Skip text cleaning")
+    parser.add_argument("--ai-refinement", action="store_true", help="Refine text with Ollama")
+    parser.add_argument("--ai-model", help="Ollama model for refinement")
+    parser.add_argument("--skip-silence", action="store_true", help="Only transcribe speech regions")
+    parser.add_argument("--retry-errors", action="store_true", help="Retry files that failed in a previous run")
+    args = parser.parse_args(argv)
+
+    if not args.output and not args.sidecar:
+        parser.error("either --output or --sidecar is required")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
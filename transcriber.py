@@ -0,0 +1,613 @@
+"""
+Transcription backend and pipeline module wrapping MLX Whisper.
+Keeps all model access in one place so the server, tools and benchmarks
+can swap in another backend with the same interface, and provides the
+decode -> (VAD) -> Whisper -> cleaning pipeline for single files and batches.
+"""
+
+import contextlib
+import contextvars
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from metrics import record_cache, record_transcription, track_stage
+from model_residency import release_memory, residency
+from scheduler import scheduler
+from text_cleaner import clean_texts, process_transcription
+from vad import detect_speech_spans, extract_speech, remap_segments, speech_stats
+
+MODEL_PATH = "mlx-community/whisper-large-v3-turbo"
+
+# MLX Whisper decodes every input to 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+# Clips up to this length are packed together into one Whisper call
+BATCH_MAX_CLIP_SECONDS = 60.0
+# Upper bound on the length of one packed Whisper call
+BATCH_MAX_PACK_SECONDS = 300.0
+# Silence inserted between packed clips so Whisper ends a segment at each boundary
+BATCH_GAP_SECONDS = 1.0
+
+# Address(es) of dedicated inference service processes (see inference_service.py)
+INFERENCE_ADDRESS = os.environ.get("DICTA_INFERENCE_ADDRESS", "")
+
+
+def load_audio_file(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode an audio file to mono float32 samples with ffmpeg.
+
+    Same decoding as mlx_whisper.audio.load_audio, but returns a NumPy array
+    and does not import MLX, so API processes can decode without the model.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to load audio: {e.stderr.decode(errors='replace')}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+class WhisperBackend:
+    """
+    Default backend: MLX Whisper with a single cached model.
+
+    Any object providing the same three methods (load_audio, transcribe,
+    is_model_loaded) can be installed with set_backend(); backends that
+    also have unload() are evicted when idle or under memory pressure, and
+    backends with detect_language() get short batch clips packed together.
+    """
+
+    name = "mlx-whisper"
+
+    def __init__(self, model_path: str = MODEL_PATH):
+        self.model_path = model_path
+
+    def load_audio(self, path: str) -> np.ndarray:
+        """
+        Decode an audio file to 16 kHz mono float32 samples (uses ffmpeg).
+        """
+        return load_audio_file(path)
+
+    def transcribe(self, audio: Union[str, np.ndarray], **options) -> Dict:
+        """
+        Transcribe a file path or decoded audio.
+
+        Returns:
+            MLX Whisper result dictionary with 'text', 'segments' and 'language'
+        """
+        import mlx_whisper
+        return mlx_whisper.transcribe(
+            audio,
+            path_or_hf_repo=self.model_path,
+            verbose=False,
+            **options
+        )
+
+    def detect_language(self, audio: np.ndarray) -> str:
+        """
+        Detect the spoken language from the first 30 seconds of audio,
+        as mlx_whisper.transcribe does before decoding.
+        """
+        import mlx.core as mx
+        from mlx_whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+        from mlx_whisper.transcribe import ModelHolder
+
+        model = ModelHolder.get_model(self.model_path, mx.float16)
+        if not model.is_multilingual:
+            return "en"
+        mel = log_mel_spectrogram(audio, n_mels=model.dims.n_mels, padding=N_SAMPLES)
+        _, probs = model.detect_language(pad_or_trim(mel, N_FRAMES, axis=-2).astype(mx.float16))
+        return max(probs, key=probs.get)
+
+    def is_model_loaded(self) -> bool:
+        """Check whether the model is already resident (no load on next call)."""
+        from mlx_whisper.transcribe import ModelHolder
+        return ModelHolder.model is not None and ModelHolder.model_path == self.model_path
+
+    def unload(self) -> None:
+        """Drop the cached model; the next transcribe() loads it again."""
+        from mlx_whisper.transcribe import ModelHolder
+        ModelHolder.model = None
+        ModelHolder.model_path = None
+        release_memory()
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    Return the active transcription backend, creating the default on first use.
+    With DICTA_INFERENCE_ADDRESS set, jobs go to the inference service instead
+    of loading a model in this process.
+    """
+    global _backend
+    if _backend is None:
+        if INFERENCE_ADDRESS:
+            from inference_service import RemoteWhisperBackend
+            _backend = RemoteWhisperBackend(INFERENCE_ADDRESS)
+        else:
+            _backend = WhisperBackend()
+    return _backend
+
+
+def set_backend(backend: Optional[object]) -> None:
+    """
+    Install a transcription backend (None restores the default MLX Whisper backend).
+    """
+    global _backend
+    _backend = backend
+
+
+def run_whisper(audio: np.ndarray, audio_seconds: Optional[float] = None, **options) -> Dict:
+    """
+    Transcribe decoded audio on the shared model, recording queue, cache
+    and real-time factor metrics. Callers wait for the model by priority
+    class (see scheduler); Overloaded is raised when the queue is full, and
+    InsufficientMemory when the model would have to be loaded under memory
+    pressure.
+
+    Args:
+        audio: 16 kHz mono samples
+        audio_seconds: Duration credited for real-time factor (defaults to len(audio));
+                       pass the original duration when silence was removed
+        **options: Extra decoding options for the backend
+
+    Returns:
+        Backend result dictionary with 'text' and 'segments'
+    """
+    backend = get_backend()
+    if audio_seconds is None:
+        audio_seconds = len(audio) / SAMPLE_RATE
+
+    with _model_slot(backend):
+        record_cache("whisper_model", backend.is_model_loaded())
+        start = time.perf_counter()
+        with track_stage("whisper_transcribe"):
+            result = backend.transcribe(audio, **options)
+        record_transcription(audio_seconds, time.perf_counter() - start)
+
+    return result
+
+
+@contextlib.contextmanager
+def _model_slot(backend):
+    # Backends that queue jobs themselves (the inference service) take concurrent calls
+    slot = contextlib.nullcontext() if getattr(backend, "concurrent", False) else scheduler.slot("whisper")
+    with slot, residency.use(backend):
+        yield
+
+
+def detect_language(audio: np.ndarray) -> Optional[str]:
+    """
+    Detect the language of decoded audio on the shared model.
+
+    Returns:
+        Language code, or None when the backend can't detect languages
+    """
+    backend = get_backend()
+    if not hasattr(backend, "detect_language"):
+        return None
+    with _model_slot(backend), track_stage("whisper_detect_language"):
+        return backend.detect_language(audio)
+
+
+def decode_audio(path: str) -> np.ndarray:
+    """Decode an audio file with the active backend."""
+    with track_stage("audio_decode"):
+        return get_backend().load_audio(path)
+
+
+def _remove_silence(audio: np.ndarray) -> Tuple[np.ndarray, List[Tuple[int, int]], Dict]:
+    """Run VAD and return (speech-only audio, speech spans, stats)."""
+    with track_stage("vad"):
+        spans = detect_speech_spans(audio)
+        return extract_speech(audio, spans), spans, speech_stats(audio, spans)
+
+
+def transcribe_audio(audio: np.ndarray, skip_silence: bool = False) -> Dict:
+    """
+    Transcribe decoded audio, optionally sending only speech regions to Whisper.
+
+    Returns:
+        Dictionary with 'text', 'segments', 'audio_seconds' and
+        'silence_skipped' (VAD stats, or None when VAD is off)
+    """
+    audio_seconds = len(audio) / SAMPLE_RATE
+
+    vad_info = None
+    spans = None
+    if skip_silence:
+        audio, spans, vad_info = _remove_silence(audio)
+
+    if spans == []:
+        # detect_speech_spans only returns no spans for audio that is silent throughout
+        result = {"text": "", "segments": []}
+    else:
+        result = run_whisper(audio, audio_seconds=audio_seconds)
+        if spans:
+            # Whisper timestamps refer to the speech-only audio
+            remap_segments(result.get("segments", []), spans)
+
+    return {
+        "text": result.get("text", ""),
+        "segments": result.get("segments", []),
+        "audio_seconds": round(audio_seconds, 3),
+        "silence_skipped": vad_info
+    }
+
+
+def postprocess(
+    transcript: Dict,
+    should_clean: bool,
+    should_use_ai: bool,
+    ai_model: Optional[str],
+    cleaned_text: Optional[str] = None
+) -> Dict:
+    """
+    Clean (and optionally AI-refine) a transcript from transcribe_audio.
+
+    Args:
+        cleaned_text: The transcript's text already cleaned (batches clean
+                      their texts together with clean_texts)
+
+    Returns:
+        Response-shaped dictionary with 'transcription' and 'raw_transcription'
+    """
+    raw_text = transcript["text"]
+
+    # Process and clean the text
+    if should_clean or should_use_ai:
+        processed_text = process_transcription(
+            raw_text,
+            use_ai_refinement=should_use_ai,
+            ai_model=ai_model,
+            cleaned=cleaned_text
+        )
+    else:
+        processed_text = raw_text
+
+    return {
+        "transcription": processed_text,
+        "raw_transcription": raw_text,  # Include raw for comparison
+        "segments": transcript["segments"],  # More detailed output
+        "audio_seconds": transcript["audio_seconds"],
+        "silence_skipped": transcript["silence_skipped"]
+    }
+
+
+def transcribe_file(
+    path: str,
+    should_clean: bool = True,
+    should_use_ai: bool = False,
+    ai_model: Optional[str] = None,
+    should_skip_silence: bool = False
+) -> Dict:
+    """
+    Run the full blocking pipeline on an audio file.
+
+    Returns:
+        Dictionary with transcription, raw_transcription, segments,
+        audio_seconds and silence_skipped
+    """
+    audio = decode_audio(path)
+    transcript = transcribe_audio(audio, skip_silence=should_skip_silence)
+    return postprocess(transcript, should_clean, should_use_ai, ai_model)
+
+
+def _shift(segment: Dict, offset: float, duration: float) -> Dict:
+    """Copy of a segment (and its words) moved onto a clip's own timeline."""
+    def shifted(t):
+        return round(min(max(t - offset, 0.0), duration), 3)
+
+    segment = dict(segment, start=shifted(segment["start"]), end=shifted(segment["end"]))
+    if segment.get("words"):
+        segment["words"] = [dict(w, start=shifted(w["start"]), end=shifted(w["end"])) for w in segment["words"]]
+    return segment
+
+
+def _split_packed_segments(
+    segments: List[Dict],
+    offsets: List[float],
+    durations: List[float],
+    min_overlap: float = 0.1
+) -> List[List[Dict]]:
+    """
+    Assign segments of a packed transcription back to their clips, with
+    times shifted to each clip's own timeline.
+
+    A segment that spans a gap between clips is cut at the clip boundaries:
+    by word timestamps when the segment has them, otherwise by dividing its
+    words in proportion to the time it overlaps each clip. Overlaps shorter
+    than min_overlap (timestamp jitter at a boundary) don't count.
+    """
+    per_clip: List[List[Dict]] = [[] for _ in offsets]
+    starts = np.asarray(offsets)
+    ends = starts + np.asarray(durations)
+
+    def clip_at(t: float) -> int:
+        return int(np.clip(np.searchsorted(starts, t, side="right") - 1, 0, len(offsets) - 1))
+
+    for segment in segments:
+        overlaps = np.minimum(ends, segment["end"]) - np.maximum(starts, segment["start"])
+        clips = np.flatnonzero(overlaps >= min_overlap)
+        if len(clips) <= 1:
+            clip = int(clips[0]) if len(clips) else clip_at((segment["start"] + segment["end"]) / 2)
+            per_clip[clip].append(_shift(segment, offsets[clip], durations[clip]))
+            continue
+
+        pieces = []
+        if segment.get("words"):
+            by_clip: Dict[int, List[Dict]] = {}
+            for word in segment["words"]:
+                by_clip.setdefault(clip_at((word["start"] + word["end"]) / 2), []).append(word)
+            for clip, words in by_clip.items():
+                pieces.append((clip, words[0]["start"], words[-1]["end"],
+                               "".join(w["word"] for w in words), words))
+        else:
+            tokens = segment.get("text", "").split()
+            cuts = np.rint(np.cumsum(overlaps[clips])[:-1] / overlaps[clips].sum() * len(tokens)).astype(int)
+            for clip, clip_tokens in zip(clips.tolist(), np.split(np.array(tokens, dtype=object), cuts)):
+                if len(clip_tokens):
+                    pieces.append((clip, max(segment["start"], starts[clip]), min(segment["end"], ends[clip]),
+                                   " " + " ".join(clip_tokens), None))
+
+        for clip, start, end, text, words in pieces:
+            # Token ids belong to the whole segment, so they are dropped from the pieces
+            piece = {k: v for k, v in segment.items() if k not in ("tokens", "words")}
+            piece.update(start=float(start), end=float(end), text=text)
+            if words is not None:
+                piece["words"] = words
+            per_clip[clip].append(_shift(piece, offsets[clip], durations[clip]))
+
+    for clip_segments in per_clip:
+        for number, segment in enumerate(clip_segments):
+            segment["id"] = number
+    return per_clip
+
+
+def transcribe_packed(
+    audios: List[np.ndarray],
+    gap_seconds: float = BATCH_GAP_SECONDS,
+    language: Optional[str] = None
+) -> List[Dict]:
+    """
+    Transcribe several short clips in a single Whisper call.
+
+    Whisper decodes fixed 30-second windows, so a 10-second clip costs as much
+    encoder work as a 30-second one. Concatenating short clips (separated by
+    silence) fills those windows and pays model setup once per pack instead
+    of once per clip. Whisper detects the language only once per call, so
+    the clips of a pack should share a language; pass it when known.
+
+    Args:
+        audios: Decoded clips (16 kHz mono)
+        gap_seconds: Silence inserted between clips
+        language: Language of all the clips (None lets Whisper detect it)
+
+    Returns:
+        One {'text', 'segments'} dictionary per clip, timestamps relative to each clip
+    """
+    gap = np.zeros(int(gap_seconds * SAMPLE_RATE), dtype=np.float32)
+    pieces = []
+    offsets = []
+    durations = []
+    position = 0
+    for audio in audios:
+        offsets.append(position / SAMPLE_RATE)
+        durations.append(len(audio) / SAMPLE_RATE)
+        pieces.extend([audio, gap])
+        position += len(audio) + len(gap)
+
+    packed = np.concatenate(pieces)
+    options = {"language": language} if language else {}
+    # Don't let text from one clip prime the decoding of the next; word
+    # timestamps let segments that run across a gap be cut at the boundary
+    result = run_whisper(packed, audio_seconds=sum(durations), condition_on_previous_text=False,
+                         word_timestamps=True, **options)
+
+    transcripts = []
+    for clip_segments in _split_packed_segments(result.get("segments", []), offsets, durations):
+        for segment in clip_segments:
+            # Single-file transcriptions don't include words either
+            segment.pop("words", None)
+        transcripts.append({"text": "".join(s.get("text", "") for s in clip_segments), "segments": clip_segments})
+    return transcripts
+
+
+def plan_batches(
+    durations: List[float],
+    max_clip_seconds: float = BATCH_MAX_CLIP_SECONDS,
+    max_pack_seconds: float = BATCH_MAX_PACK_SECONDS
+) -> List[List[int]]:
+    """
+    Group clip indices into Whisper calls: short clips are packed together
+    up to max_pack_seconds, longer clips get a call of their own.
+
+    Returns:
+        List of index groups, one per Whisper call
+    """
+    groups: List[List[int]] = []
+    current: List[int] = []
+    current_seconds = 0.0
+
+    for index, seconds in enumerate(durations):
+        if seconds > max_clip_seconds:
+            groups.append([index])
+            continue
+        if current and current_seconds + seconds + BATCH_GAP_SECONDS > max_pack_seconds:
+            groups.append(current)
+            current, current_seconds = [], 0.0
+        current.append(index)
+        current_seconds += seconds + BATCH_GAP_SECONDS
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def transcribe_batch(
+    paths: List[str],
+    should_clean: bool = True,
+    should_use_ai: bool = False,
+    ai_model: Optional[str] = None,
+    should_skip_silence: bool = False,
+    max_workers: int = 4
+) -> Iterator[Tuple[int, Dict]]:
+    """
+    Transcribe many files, packing short clips into shared Whisper calls,
+    cleaning each call's transcripts together and AI-refining them in
+    parallel.
+
+    Short clips are packed only with clips detected as the same language,
+    and only when the backend can detect languages.
+
+    Only the short clips are held in memory together; a file too long to
+    pack is transcribed right after it is decoded, and every clip's samples
+    are released once Whisper has run.
+
+    Errors are isolated per file: a file that fails to decode, run VAD or
+    transcribe yields {'error': ...} without affecting the others. If a
+    packed call fails, its clips are retried one by one.
+
+    Yields:
+        (index, result) pairs in completion order; result has the same keys
+        as transcribe_file, or 'error'
+    """
+    audios: Dict[int, np.ndarray] = {}
+    vad: Dict[int, Tuple[List[Tuple[int, int]], Dict]] = {}
+    audio_seconds: Dict[int, float] = {}
+
+    def finish(index: int, transcript: Dict, cleaned_text: Optional[str] = None) -> Dict:
+        spans, stats = vad.get(index, (None, None))
+        if spans:
+            remap_segments(transcript["segments"], spans)
+        transcript = {
+            "text": transcript["text"],
+            "segments": transcript["segments"],
+            "audio_seconds": audio_seconds[index],
+            "silence_skipped": stats
+        }
+        return postprocess(transcript, should_clean, should_use_ai, ai_model, cleaned_text)
+
+    def run_group(language: Optional[str], group: List[int], pool: ThreadPoolExecutor,
+                  pending: Dict) -> Iterator[Tuple[int, Dict]]:
+        transcripts: Dict[int, Dict] = {}
+        errors: Dict[int, str] = {}
+        if len(group) > 1:
+            try:
+                packed = transcribe_packed([audios[i] for i in group], language=language)
+                transcripts = dict(zip(group, packed))
+            except Exception:
+                # Isolate the failure: fall through and retry each clip on its own
+                pass
+
+        for index in group:
+            if index in transcripts:
+                continue
+            try:
+                transcripts[index] = run_whisper(audios[index])
+            except Exception as e:
+                errors[index] = f"Transcription failed: {str(e)}"
+
+        # The samples aren't needed past Whisper
+        for index in group:
+            del audios[index]
+
+        for index, message in errors.items():
+            yield index, {"error": message}
+
+        # Basic cleaning takes milliseconds, so a group's texts are cleaned
+        # together (tokenized and normalized in one pass); if that fails
+        # each file is cleaned on its own in finish()
+        cleaned: Dict[int, str] = {}
+        if transcripts and (should_clean or should_use_ai):
+            try:
+                with track_stage("clean_text"):
+                    cleaned = dict(zip(transcripts, clean_texts([t["text"] for t in transcripts.values()])))
+            except Exception:
+                pass
+
+        # Refine and finish in the background while the model works on the next group
+        for index, transcript in transcripts.items():
+            context = contextvars.copy_context()
+            pending[pool.submit(context.run, finish, index, transcript, cleaned.get(index))] = index
+
+        for future in [f for f in pending if f.done()]:
+            yield pending.pop(future), _future_result(future)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {}
+
+        # Short clips are kept in memory to be packed together. A longer file
+        # is never packed, so it is transcribed as soon as it is decoded:
+        # at most one long recording is held at a time
+        for index, path in enumerate(paths):
+            try:
+                audio = decode_audio(path)
+            except Exception as e:
+                yield index, {"error": f"Audio decoding failed: {str(e)}"}
+                continue
+
+            audio_seconds[index] = round(len(audio) / SAMPLE_RATE, 3)
+            if should_skip_silence:
+                try:
+                    audio, spans, stats = _remove_silence(audio)
+                except Exception as e:
+                    yield index, {"error": f"Silence detection failed: {str(e)}"}
+                    continue
+                vad[index] = (spans, stats)
+
+            if not len(audio):
+                # Nothing to transcribe (empty file, or all silence)
+                yield index, finish(index, {"text": "", "segments": []})
+                continue
+            audios[index] = audio
+            if len(audio) / SAMPLE_RATE > BATCH_MAX_CLIP_SECONDS:
+                yield from run_group(None, [index], pool, pending)
+            del audio
+
+        # Whisper detects the language once per call, so only clips detected
+        # as the same language are packed together; clips whose language is
+        # unknown get a call of their own
+        packable = list(audios)
+        languages: Dict[int, Optional[str]] = {}
+        if len(packable) > 1:
+            for index in packable:
+                try:
+                    languages[index] = detect_language(audios[index])
+                except Exception:
+                    languages[index] = None
+
+        by_language: Dict[Optional[str], List[int]] = {}
+        for index in packable:
+            by_language.setdefault(languages.get(index), []).append(index)
+
+        groups: List[Tuple[Optional[str], List[int]]] = []
+        for language, members in by_language.items():
+            if language is None:
+                groups.extend((None, [index]) for index in members)
+                continue
+            durations = [len(audios[i]) / SAMPLE_RATE for i in members]
+            groups.extend((language, [members[i] for i in group]) for group in plan_batches(durations))
+
+        for language, group in groups:
+            yield from run_group(language, group, pool, pending)
+
+        for future in as_completed(list(pending)):
+            yield pending.pop(future), _future_result(future)
+
+
+def _future_result(future) -> Dict:
+    try:
+        return future.result()
+    except Exception as e:
+        return {"error": f"Post-processing failed: {str(e)}"}
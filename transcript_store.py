@@ -0,0 +1,326 @@
+"""
+Persistent transcript store backed by SQLite with an FTS5 full-text index.
+Keeps raw text, cleaned text, segments (in compact columnar form) and
+summaries (with content hashes) so past transcripts can be searched and
+reused. Writes are queued and
+committed in batches by a background thread, so saving a result never
+blocks the request that produced it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from segment_table import LazySegmentTable, SegmentTable
+
+logger = logging.getLogger("dicta.store")
+
+STORE_ENABLED = os.environ.get("DICTA_TRANSCRIPT_STORE", "true").lower() in ("true", "1", "yes")
+DB_PATH = os.environ.get(
+    "DICTA_TRANSCRIPT_DB",
+    os.path.join(os.path.expanduser("~"), ".dicta", "transcripts.db")
+)
+# Writes are committed together once this many are queued or after BATCH_SECONDS
+BATCH_SIZE = 64
+BATCH_SECONDS = 0.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    filename TEXT,
+    audio_seconds REAL,
+    raw_text TEXT NOT NULL,
+    raw_hash TEXT NOT NULL,
+    cleaned_text TEXT NOT NULL,
+    cleaned_hash TEXT NOT NULL,
+    segments TEXT
+);
+CREATE INDEX IF NOT EXISTS transcripts_created ON transcripts (created_at);
+CREATE INDEX IF NOT EXISTS transcripts_raw_hash ON transcripts (raw_hash);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    transcript_id TEXT NOT NULL,
+    summary_type TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    model TEXT,
+    title TEXT,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (transcript_id, summary_type, text_hash)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+    cleaned_text,
+    content='transcripts',
+    content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS transcripts_ai AFTER INSERT ON transcripts BEGIN
+    INSERT INTO transcripts_fts (rowid, cleaned_text) VALUES (new.rowid, new.cleaned_text);
+END;
+CREATE TRIGGER IF NOT EXISTS transcripts_ad AFTER DELETE ON transcripts BEGIN
+    INSERT INTO transcripts_fts (transcripts_fts, rowid, cleaned_text) VALUES ('delete', old.rowid, old.cleaned_text);
+END;
+CREATE TRIGGER IF NOT EXISTS transcripts_au AFTER UPDATE ON transcripts BEGIN
+    INSERT INTO transcripts_fts (transcripts_fts, rowid, cleaned_text) VALUES ('delete', old.rowid, old.cleaned_text);
+    INSERT INTO transcripts_fts (rowid, cleaned_text) VALUES (new.rowid, new.cleaned_text);
+END;
+"""
+
+_SEARCH_TERM = re.compile(r"\w+\*?", re.UNICODE)
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the text, used to spot duplicates and match summaries to text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def to_match_query(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 query: every word must match, and a
+    trailing * keeps prefix search (e.g. "presupuest*"). Operators and
+    punctuation are dropped so user input can't cause syntax errors.
+    """
+    terms = []
+    for term in _SEARCH_TERM.findall(query):
+        prefix = term.endswith("*")
+        word = term.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class TranscriptStore:
+    """
+    SQLite transcript store with a background batch writer.
+
+    save_transcript() and save_summary() return immediately; queued writes
+    are visible to get_transcript() straight away and reach the database
+    within BATCH_SECONDS.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._pending: Dict[str, Dict] = {}
+        self._pending_lock = threading.Lock()
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+        self._writer = threading.Thread(target=self._write_loop, name="dicta-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """One read connection per thread (sqlite3 connections aren't shared across threads)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # -- writes ------------------------------------------------------------
+
+    def save_transcript(self, result: Dict, filename: Optional[str] = None,
+                        segments: Optional[LazySegmentTable] = None) -> str:
+        """
+        Queue a transcription result for storage.
+
+        Args:
+            result: Pipeline result with 'transcription', 'raw_transcription',
+                    'segments' and 'audio_seconds'
+            filename: Original upload name
+            segments: The result's segments, if already wrapped for sharing
+                      (the table is built by the writer thread)
+
+        Returns:
+            Id of the stored transcript
+        """
+        transcript_id = uuid.uuid4().hex
+        record = {
+            "id": transcript_id,
+            "created_at": time.time(),
+            "filename": filename,
+            "audio_seconds": result.get("audio_seconds"),
+            "raw_text": result.get("raw_transcription", result.get("transcription", "")),
+            "cleaned_text": result.get("transcription", ""),
+            "segments": segments if segments is not None else LazySegmentTable(
+                result.get("segments") or [], result.get("transcription", "")
+            )
+        }
+        with self._pending_lock:
+            self._pending[transcript_id] = record
+        self._queue.put(("transcript", record))
+        return transcript_id
+
+    def save_summary(self, transcript_id: str, summary_type: str, text: str, result: Dict,
+                     model: Optional[str] = None) -> None:
+        """Queue a summary of a stored transcript (keyed by the hash of the summarized text)."""
+        self._queue.put(("summary", {
+            "transcript_id": transcript_id,
+            "summary_type": summary_type,
+            "text_hash": content_hash(text),
+            "model": model,
+            "title": result.get("title"),
+            "content": json.dumps(result.get("content"), ensure_ascii=False),
+            "created_at": time.time()
+        }))
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + BATCH_SECONDS
+            while len(batch) < BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write_batch(conn, batch)
+                    return
+                batch.append(item)
+            self._write_batch(conn, batch)
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple]) -> None:
+        try:
+            with conn:
+                for kind, record in batch:
+                    if kind == "transcript":
+                        conn.execute(
+                            "INSERT INTO transcripts (id, created_at, filename, audio_seconds, raw_text, raw_hash,"
+                            " cleaned_text, cleaned_hash, segments) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (record["id"], record["created_at"], record["filename"], record["audio_seconds"],
+                             record["raw_text"], content_hash(record["raw_text"]),
+                             record["cleaned_text"], content_hash(record["cleaned_text"]),
+                             json.dumps(record["segments"].get().to_columns(), ensure_ascii=False))
+                        )
+                    else:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO summaries (transcript_id, summary_type, text_hash, model, title,"
+                            " content, created_at) VALUES (:transcript_id, :summary_type, :text_hash, :model, :title,"
+                            " :content, :created_at)",
+                            record
+                        )
+        except sqlite3.Error as e:
+            logger.error("Failed to store %d record(s): %s", len(batch), e)
+        except Exception:
+            # e.g. building a segment table; keep the writer thread alive
+            logger.exception("Failed to store %d record(s)", len(batch))
+        finally:
+            with self._pending_lock:
+                for kind, record in batch:
+                    if kind == "transcript":
+                        self._pending.pop(record["id"], None)
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Block until every queued write has been committed."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Commit queued writes and stop the writer thread."""
+        self._queue.put(None)
+        self._writer.join()
+
+    # -- reads -------------------------------------------------------------
+
+    def get_transcript(self, transcript_id: str) -> Optional[Dict]:
+        """
+        Fetch a transcript with its segments and summaries.
+
+        Returns:
+            Transcript dictionary, or None if the id is unknown
+        """
+        with self._pending_lock:
+            pending = self._pending.get(transcript_id)
+        if pending is not None:
+            record = dict(pending, raw_hash=content_hash(pending["raw_text"]),
+                          cleaned_hash=content_hash(pending["cleaned_text"]),
+                          segments=pending["segments"].get().to_records())
+        else:
+            row = self._reader().execute("SELECT * FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
+            if row is None:
+                return None
+            record = dict(row)
+            segments = json.loads(record["segments"] or "[]")
+            if isinstance(segments, dict):
+                record["segments"] = SegmentTable.from_columns(segments).to_records()
+            else:
+                # Stored before segments were kept in columns: raw Whisper segments
+                record["segments"] = SegmentTable.from_segments(segments, record["cleaned_text"]).to_records()
+
+        record["summaries"] = [
+            dict(summary, content=json.loads(summary["content"]))
+            for summary in map(dict, self._reader().execute(
+                "SELECT summary_type, text_hash, model, title, content, created_at FROM summaries"
+                " WHERE transcript_id = ? ORDER BY created_at", (transcript_id,)
+            ))
+        ]
+        return record
+
+    def search(self, query: Optional[str] = None, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """
+        Full-text search over cleaned transcripts, best matches first.
+        Without a query, lists the most recent transcripts.
+
+        Returns:
+            List of {id, created_at, filename, audio_seconds, snippet}
+        """
+        match = to_match_query(query) if query else ""
+        if match:
+            rows = self._reader().execute(
+                "SELECT t.id, t.created_at, t.filename, t.audio_seconds,"
+                " snippet(transcripts_fts, 0, '[', ']', '…', 16) AS snippet"
+                " FROM transcripts_fts JOIN transcripts t ON t.rowid = transcripts_fts.rowid"
+                " WHERE transcripts_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                (match, limit, offset)
+            )
+        else:
+            rows = self._reader().execute(
+                "SELECT id, created_at, filename, audio_seconds, substr(cleaned_text, 1, 160) AS snippet"
+                " FROM transcripts ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            )
+        return [dict(row) for row in rows]
+
+
+_store: Optional[TranscriptStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[TranscriptStore]:
+    """Return the shared store (opened on first use), or None if disabled or unavailable."""
+    global _store
+    if not STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = TranscriptStore()
+            except sqlite3.Error as e:
+                logger.error("Transcript store unavailable at %s: %s", DB_PATH, e)
+                return None
+        return _store
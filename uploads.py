@@ -0,0 +1,409 @@
+"""
+Resumable chunked uploads.
+A client creates an upload with the total size (and optionally its
+SHA-256), PUTs chunks at increasing offsets and finalizes it. Chunks are
+appended straight to a unique per-upload file and hashed as they arrive;
+after a dropped connection the client asks for the current offset and
+continues from there. Upload state survives server restarts.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+UPLOAD_DIR = os.environ.get("DICTA_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "dicta-uploads"))
+MAX_UPLOAD_BYTES = int(os.environ.get("DICTA_MAX_UPLOAD_MB", "4096")) * 2**20
+MAX_CHUNK_BYTES = int(os.environ.get("DICTA_MAX_CHUNK_MB", "64")) * 2**20
+# Suggested chunk size returned to clients
+CHUNK_BYTES = min(8 * 2**20, MAX_CHUNK_BYTES)
+# Unfinished uploads untouched for this long are deleted
+UPLOAD_TTL_SECONDS = float(os.environ.get("DICTA_UPLOAD_TTL_SECONDS", str(24 * 3600)))
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """Invalid upload request; status_code is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400, **details):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class _Upload:
+    def __init__(self, meta: Dict, data_path: str):
+        self.meta = meta
+        self.data_path = data_path
+        self.lock = threading.Lock()
+        self.hasher = None  # Running SHA-256 of the bytes received so far (None: rebuild from disk)
+        self.busy = False
+        self.completing = False
+        self.lock_file = None  # Held across processes while completing
+
+
+class ChunkWriter:
+    """Appends one chunk to an upload, hashing as it goes; commit() or rollback() when done."""
+
+    def __init__(self, manager: "UploadManager", upload: _Upload, offset: int, lock_file):
+        self._manager = manager
+        self._upload = upload
+        self._offset = offset
+        self._lock_file = lock_file
+        self._written = 0
+        self._file = open(upload.data_path, "r+b")
+        self._file.seek(offset)
+        # Without a running hash (chunks were written by another process) it is rebuilt on finalize
+        self._hasher = upload.hasher.copy() if upload.hasher is not None else None
+        self._chunk_hasher = hashlib.sha256()
+
+    def write(self, data: bytes) -> None:
+        self._written += len(data)
+        if self._written > MAX_CHUNK_BYTES:
+            raise UploadError(f"Chunk larger than {MAX_CHUNK_BYTES // 2**20} MB", 413)
+        if self._offset + self._written > self._upload.meta["size"]:
+            raise UploadError("Chunk goes past the declared upload size", 413)
+        self._file.write(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+        self._chunk_hasher.update(data)
+
+    def commit(self, chunk_sha256: Optional[str] = None) -> Dict:
+        """Keep the chunk (after checking its hash if the client sent one)."""
+        if chunk_sha256 and chunk_sha256.lower() != self._chunk_hasher.hexdigest():
+            raise UploadError("Chunk checksum mismatch", 400)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        upload = self._upload
+        try:
+            upload.hasher = self._hasher
+            upload.meta["received"] = self._offset + self._written
+            upload.meta["updated_at"] = time.time()
+            self._manager._save_meta(upload)
+        finally:
+            upload.busy = False
+            self._lock_file.close()
+        return self._manager._status(upload.meta)
+
+    def rollback(self) -> None:
+        """Discard the partial chunk so the client can resend it from the same offset."""
+        try:
+            if not self._file.closed:
+                self._file.truncate(self._offset)
+                self._file.close()
+        finally:
+            if not self._lock_file.closed:
+                self._upload.busy = False
+                self._lock_file.close()
+
+
+class UploadManager:
+    """
+    Upload registry backed by <id>.part / <id>.json files in UPLOAD_DIR.
+
+    Several server processes (uvicorn --workers) can share the directory:
+    writing a chunk, completing and deleting take an exclusive flock on
+    <id>.lock and re-read <id>.json under it, so each process sees the
+    chunks the others received and only one of them touches the file at
+    a time.
+    """
+
+    def __init__(self, directory: str = UPLOAD_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._uploads: Dict[str, _Upload] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id: str):
+        base = os.path.join(self.directory, upload_id)
+        return base + ".part", base + ".json", base + ".lock"
+
+    def _save_meta(self, upload: _Upload) -> None:
+        meta_path = self._paths(upload.meta["upload_id"])[1]
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(upload.meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def _read_meta(self, upload_id: str) -> Dict:
+        try:
+            with open(self._paths(upload_id)[1], encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Upload not found", 404)
+
+    def _status(self, meta: Dict) -> Dict:
+        return {
+            "upload_id": meta["upload_id"],
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "offset": meta["received"],
+            "complete": meta["received"] == meta["size"],
+            "chunk_size": CHUNK_BYTES
+        }
+
+    def create(self, filename: str, size: int, sha256: Optional[str] = None) -> Dict:
+        """Start an upload of size bytes. Returns its status (offset 0)."""
+        if size <= 0:
+            raise UploadError("size must be positive")
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadError(f"Upload larger than the {MAX_UPLOAD_BYTES // 2**20} MB limit", 413)
+        if sha256 is not None and not re.fullmatch(r"[0-9a-fA-F]{64}", sha256):
+            raise UploadError("sha256 must be 64 hex characters")
+
+        self.cleanup()
+        upload_id = uuid.uuid4().hex
+        data_path = self._paths(upload_id)[0]
+        open(data_path, "wb").close()
+        now = time.time()
+        upload = _Upload({
+            "upload_id": upload_id,
+            "filename": os.path.basename(filename or "audio"),
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "received": 0,
+            "created_at": now,
+            "updated_at": now
+        }, data_path)
+        upload.hasher = hashlib.sha256()
+        self._save_meta(upload)
+        with self._lock:
+            self._uploads[upload_id] = upload
+        return self._status(upload.meta)
+
+    def _get(self, upload_id: str) -> _Upload:
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise UploadError("Upload not found", 404)
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                # Created by another process or a previous server run
+                upload = self._uploads[upload_id] = _Upload(self._read_meta(upload_id), self._paths(upload_id)[0])
+        return upload
+
+    def _acquire(self, upload: _Upload):
+        """
+        Take the cross-process lock of an upload (caller holds upload.lock)
+        and reload its state from disk.
+
+        Returns:
+            The open lock file; closing it releases the lock
+
+        Raises:
+            UploadError: 409 another process is writing or completing it, 404 deleted
+        """
+        upload_id = upload.meta["upload_id"]
+        lock_file = open(self._paths(upload_id)[2], "a+b")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            try:
+                completing = self._read_meta(upload_id).get("completing")
+            except UploadError:
+                completing = False
+            if completing:
+                raise UploadError("Upload is already being completed", 409)
+            raise UploadError("Another chunk is being written to this upload", 409)
+
+        try:
+            meta = self._read_meta(upload_id)
+        except UploadError:
+            # Deleted meanwhile; don't leave the lock file we just created behind
+            lock_file.close()
+            try:
+                os.remove(self._paths(upload_id)[2])
+            except OSError:
+                pass
+            with self._lock:
+                self._uploads.pop(upload_id, None)
+            raise
+        if meta["received"] != upload.meta["received"]:
+            # Another process received chunks: the running hash no longer matches
+            upload.hasher = None
+        # A 'completing' flag on disk is stale once its lock is free
+        meta["completing"] = False
+        upload.meta = meta
+        return lock_file
+
+    def _ensure_hasher(self, upload: _Upload) -> None:
+        """Rebuild the running hash from disk (after a restart or chunks written elsewhere)."""
+        if upload.hasher is not None:
+            return
+        hasher = hashlib.sha256()
+        with open(upload.data_path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                hasher.update(block)
+        upload.hasher = hasher
+
+    def status(self, upload_id: str) -> Dict:
+        self._get(upload_id)
+        # Chunks may have arrived through another process
+        return self._status(self._read_meta(upload_id))
+
+    def begin_chunk(self, upload_id: str, offset: int) -> ChunkWriter:
+        """
+        Start writing a chunk at offset, which must equal the bytes received so far.
+
+        Raises:
+            UploadError: 404 unknown upload, 409 wrong offset, another chunk in
+                         progress or the upload being completed
+        """
+        upload = self._get(upload_id)
+        with upload.lock:
+            if upload.completing:
+                raise UploadError("Upload is being completed", 409)
+            if upload.busy:
+                raise UploadError("Another chunk is being written to this upload", 409)
+            lock_file = self._acquire(upload)
+            try:
+                received = upload.meta["received"]
+                if offset != received:
+                    raise UploadError(f"Expected offset {received}", 409, offset=received)
+                # Drop bytes past 'received' left by an interrupted write
+                os.truncate(upload.data_path, received)
+                writer = ChunkWriter(self, upload, offset, lock_file)
+            except BaseException:
+                lock_file.close()
+                raise
+            upload.busy = True
+            return writer
+
+    def finalize(self, upload_id: str) -> Dict:
+        """
+        Check the upload is complete and matches its declared hash, and mark
+        it as completing (in every process) until finish() or release().
+
+        Returns:
+            {'path', 'filename', 'sha256', 'size'} of the finished file
+
+        Raises:
+            UploadError: 409 incomplete, a chunk in progress or already
+                         being completed; 422 checksum mismatch
+        """
+        upload = self._get(upload_id)
+        with upload.lock:
+            if upload.completing:
+                raise UploadError("Upload is already being completed", 409)
+            if upload.busy:
+                raise UploadError("A chunk is still being written", 409)
+            lock_file = self._acquire(upload)
+            try:
+                meta = upload.meta
+                if meta["received"] != meta["size"]:
+                    raise UploadError(f"Upload incomplete: {meta['received']} of {meta['size']} bytes",
+                                      409, offset=meta["received"])
+                self._ensure_hasher(upload)
+                digest = upload.hasher.hexdigest()
+                if meta["sha256"] and digest != meta["sha256"]:
+                    raise UploadError("Upload checksum mismatch", 422)
+                meta["completing"] = True
+                self._save_meta(upload)
+            except BaseException:
+                lock_file.close()
+                raise
+            upload.completing = True
+            upload.lock_file = lock_file
+            return {"path": upload.data_path, "filename": meta["filename"], "sha256": digest, "size": meta["size"]}
+
+    def release(self, upload_id: str) -> None:
+        """Undo finalize() after a failed transcription so completing can be retried."""
+        try:
+            upload = self._get(upload_id)
+        except UploadError:
+            return
+        with upload.lock:
+            if not upload.completing:
+                return
+            upload.completing = False
+            upload.meta["completing"] = False
+            try:
+                self._save_meta(upload)
+            finally:
+                upload.lock_file.close()
+                upload.lock_file = None
+
+    def finish(self, upload_id: str) -> None:
+        """Remove an upload after finalize() once it has been transcribed."""
+        upload = self._get(upload_id)
+        with upload.lock:
+            self._remove(upload_id)
+            upload.completing = False
+            if upload.lock_file is not None:
+                upload.lock_file.close()
+                upload.lock_file = None
+
+    def delete(self, upload_id: str) -> None:
+        """
+        Abandon an upload and delete what was received.
+
+        Raises:
+            UploadError: 409 while a chunk is being written or the upload is being completed
+        """
+        try:
+            upload = self._get(upload_id)
+        except UploadError:
+            return
+        with upload.lock:
+            if upload.completing:
+                raise UploadError("Upload is being completed", 409)
+            if upload.busy:
+                raise UploadError("A chunk is being written to this upload", 409)
+            try:
+                lock_file = self._acquire(upload)
+            except UploadError as e:
+                if e.status_code == 404:
+                    return
+                raise
+            try:
+                self._remove(upload_id)
+            finally:
+                lock_file.close()
+
+    def _remove(self, upload_id: str) -> None:
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+        # The lock file goes last, so other processes see the upload gone (404) once they get the lock
+        for path in self._paths(upload_id)[1::-1] + self._paths(upload_id)[2:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def cleanup(self) -> None:
+        """Delete uploads that haven't received data within UPLOAD_TTL_SECONDS."""
+        cutoff = time.time() - UPLOAD_TTL_SECONDS
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            upload_id, ext = os.path.splitext(name)
+            if ext != ".json":
+                continue
+            try:
+                if os.path.getmtime(os.path.join(self.directory, name)) < cutoff:
+                    self.delete(upload_id)
+            except (OSError, UploadError):
+                pass  # Gone meanwhile, or still in use
+
+
+_manager: Optional[UploadManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_upload_manager() -> UploadManager:
+    """Return the shared upload manager (creating the upload directory on first use)."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = UploadManager()
+        return _manager
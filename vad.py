@@ -0,0 +1,214 @@
+"""
+Voice activity detection module for skipping silence before transcription.
+Finds speech regions in decoded audio so only those spans are sent to Whisper,
+then maps segment timestamps back to the original timeline.
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+# MLX Whisper decodes every input to 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """
+    Find runs of True values in a boolean mask.
+
+    Returns:
+        Array of shape (n, 2) with [start, end) indices of each run
+    """
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return edges.reshape(-1, 2)
+
+
+def detect_speech_spans(
+    audio: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    frame_ms: int = 30,
+    threshold_db: float = 12.0,
+    min_level_db: float = -50.0,
+    min_speech_ms: int = 250,
+    min_silence_ms: int = 600,
+    pad_ms: int = 200
+) -> List[Tuple[int, int]]:
+    """
+    Detect speech regions using frame energy against an adaptive noise floor.
+
+    Args:
+        audio: Mono audio samples (float32 in [-1, 1])
+        sample_rate: Sample rate of the audio
+        frame_ms: Analysis frame length in milliseconds
+        threshold_db: How far above the noise floor a frame must be to count as speech
+        min_level_db: Absolute level below which a frame is never speech
+        min_speech_ms: Drop speech bursts shorter than this (clicks, pops)
+        min_silence_ms: Bridge pauses shorter than this (keeps sentences whole)
+        pad_ms: Padding kept around each speech region so words aren't clipped
+
+    Returns:
+        List of (start_sample, end_sample) speech spans, sorted and non-overlapping.
+        Empty only when the whole audio is below min_level_db; audio whose
+        level barely varies (continuous speech, speech over a constant noise
+        bed) comes back as one span covering everything.
+    """
+    frame_len = int(sample_rate * frame_ms / 1000)
+    n_frames = int(np.ceil(len(audio) / frame_len)) if len(audio) else 0
+    if n_frames == 0:
+        return []
+
+    # Frame the signal (zero-pad the tail frame) and compute per-frame energy in dB
+    frames = np.zeros(n_frames * frame_len, dtype=np.float32)
+    frames[:len(audio)] = audio
+    frames = frames.reshape(n_frames, frame_len)
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+    if not np.any(energy_db > min_level_db):
+        # Silent throughout
+        return []
+    everything = [(0, len(audio))]
+
+    # Noise floor estimated from the quietest frames; without enough contrast
+    # between quiet and loud frames there is no floor to measure against
+    noise_floor, loud = np.percentile(energy_db, [10, 90])
+    if loud - noise_floor < threshold_db:
+        return everything
+    threshold = max(noise_floor + threshold_db, min_level_db)
+    speech = energy_db > threshold
+
+    # Bridge short pauses between speech bursts
+    min_silence_frames = max(1, min_silence_ms // frame_ms)
+    for start, end in _runs(~speech):
+        if start > 0 and end < n_frames and end - start < min_silence_frames:
+            speech[start:end] = True
+
+    # Drop bursts that are too short to be speech
+    min_speech_frames = max(1, min_speech_ms // frame_ms)
+    for start, end in _runs(speech):
+        if end - start < min_speech_frames:
+            speech[start:end] = False
+
+    # Pad regions and merge any that now overlap
+    pad_frames = pad_ms // frame_ms
+    spans: List[Tuple[int, int]] = []
+    for start, end in _runs(speech):
+        start = max(0, start - pad_frames) * frame_len
+        end = min(len(audio), (end + pad_frames) * frame_len)
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((int(start), int(end)))
+
+    # Audible but nothing classified as speech: transcribe it all rather than drop it
+    return spans or everything
+
+
+def extract_speech(audio: np.ndarray, spans: List[Tuple[int, int]]) -> np.ndarray:
+    """
+    Concatenate the speech spans into a single compact audio buffer.
+
+    Args:
+        audio: Original audio samples
+        spans: Speech spans from detect_speech_spans
+
+    Returns:
+        Audio containing only the speech regions
+    """
+    if not spans:
+        return np.zeros(0, dtype=audio.dtype)
+    return np.concatenate([audio[start:end] for start, end in spans])
+
+
+def to_original_time(
+    times: np.ndarray,
+    spans: List[Tuple[int, int]],
+    sample_rate: int = SAMPLE_RATE,
+    is_end: bool = False
+) -> np.ndarray:
+    """
+    Map times on the compacted (speech-only) timeline back to the original audio.
+
+    Args:
+        times: Times in seconds relative to the compacted audio
+        spans: Speech spans used to build the compacted audio
+        sample_rate: Sample rate of the audio
+        is_end: Treat times as segment ends, so a time exactly at a cut
+                maps to the end of the previous span instead of the next start
+
+    Returns:
+        Times in seconds relative to the original audio
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if not spans:
+        return times
+
+    span_array = np.asarray(spans, dtype=np.float64) / sample_rate
+    lengths = span_array[:, 1] - span_array[:, 0]
+    compact_starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+
+    side = "left" if is_end else "right"
+    idx = np.clip(np.searchsorted(compact_starts, times, side=side) - 1, 0, len(spans) - 1)
+    offset = np.minimum(times - compact_starts[idx], lengths[idx])
+    return span_array[idx, 0] + np.maximum(offset, 0.0)
+
+
+def remap_segments(
+    segments: List[Dict],
+    spans: List[Tuple[int, int]],
+    sample_rate: int = SAMPLE_RATE
+) -> List[Dict]:
+    """
+    Rewrite segment (and word) timestamps from the compacted timeline
+    to the original timeline. Segments are updated in place.
+
+    Args:
+        segments: Whisper segments transcribed from the compacted audio
+        spans: Speech spans used to build the compacted audio
+        sample_rate: Sample rate of the audio
+
+    Returns:
+        The same segments with original-timeline timestamps
+    """
+    if not segments or not spans:
+        return segments
+
+    starts = to_original_time([s["start"] for s in segments], spans, sample_rate)
+    ends = to_original_time([s["end"] for s in segments], spans, sample_rate, is_end=True)
+    for segment, start, end in zip(segments, starts, ends):
+        segment["start"] = round(float(start), 3)
+        segment["end"] = round(float(end), 3)
+
+        words = segment.get("words")
+        if words:
+            word_starts = to_original_time([w["start"] for w in words], spans, sample_rate)
+            word_ends = to_original_time([w["end"] for w in words], spans, sample_rate, is_end=True)
+            for word, word_start, word_end in zip(words, word_starts, word_ends):
+                word["start"] = round(float(word_start), 3)
+                word["end"] = round(float(word_end), 3)
+
+    return segments
+
+
+def speech_stats(
+    audio: np.ndarray,
+    spans: List[Tuple[int, int]],
+    sample_rate: int = SAMPLE_RATE
+) -> Dict:
+    """
+    Summarize how much audio was kept and skipped.
+
+    Returns:
+        Dictionary with audio, speech and skipped durations (seconds)
+        and the fraction of audio skipped
+    """
+    audio_seconds = len(audio) / sample_rate
+    speech_seconds = sum(end - start for start, end in spans) / sample_rate
+    skipped_seconds = audio_seconds - speech_seconds
+
+    return {
+        "audio_seconds": round(audio_seconds, 3),
+        "speech_seconds": round(speech_seconds, 3),
+        "skipped_seconds": round(skipped_seconds, 3),
+        "skipped_ratio": round(skipped_seconds / audio_seconds, 4) if audio_seconds else 0.0,
+        "speech_spans": len(spans)
+    }